@@ -45,7 +45,7 @@ extensions = [
     'sphinx.ext.todo',
     'sphinx.ext.viewcode',
 ]
-autodoc_mock_imports = ['pandas', 'numpy', 'scipy', 'matplotlib', 'folium', 'shapely', 'geopandas', 'hdbscan', 'wordcloud', 'pysal', 'sklearn', 'pyLDAvis', 'mlxtend', 'osmnx', 'requests', 'zipfile']
+autodoc_mock_imports = ['pandas', 'numpy', 'scipy', 'matplotlib', 'folium', 'shapely', 'geopandas', 'hdbscan', 'wordcloud', 'pysal', 'sklearn', 'pyLDAvis', 'osmnx', 'requests', 'zipfile']
 
 # Add any paths that contain templates here, relative to this directory.
 templates_path = ['_templates']
@@ -1,28 +1,563 @@
+import re
+import math
+import struct
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import box, GeometryCollection
-from mlxtend.preprocessing import TransactionEncoder
-from mlxtend.frequent_patterns import apriori
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from scipy.sparse import coo_matrix, triu
+from scipy.spatial import cKDTree
+from shapely.geometry import box
+from loci.index import get_spatial_index, _num_workers
 
 
-def filter_by_kwd(df, kwd_filter, col_kwds='kwds'):
+class KwdsEncoding(object):
+    """A dictionary encoding of the keywords column of a POI GeoDataFrame.
+
+    The keywords of all rows are stored as integer codes into a vocabulary of distinct keywords, in a single array
+    laid out in CSR format: the keywords of the i-th row are `vocabulary[codes[offsets[i]:offsets[i + 1]]]`.
+
+    An encoding attached to a GeoDataFrame (see `encode_kwds`) is detected by `filter_by_kwd`, `kwds_freq` and
+    `topics.topic_modeling`, which then operate on the integer codes. Since it refers to the rows of that particular
+    GeoDataFrame, it is not carried over to copies or subsets of it, except for those returned by `filter_by_kwd`.
+    It is also ignored once the keywords column of the GeoDataFrame is replaced, added or removed. Assignments to
+    individual values of a kept keywords column are not detected, which is why `encode_kwds` drops it by default.
+
+    Args:
+        vocabulary (ndarray): The distinct keywords.
+        offsets (ndarray): The offsets of the keywords of each row in `codes` (size: number of rows + 1).
+        codes (ndarray): The keyword codes of all rows (int32).
+        col_kwds (string): Name of the encoded keywords column (default: `kwds`).
+    """
+
+    def __init__(self, vocabulary, offsets, codes, col_kwds='kwds'):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.codes = codes
+        self.col_kwds = col_kwds
+        self.index = None
+        self._kwds_values = None
+        self._lower_vocabulary = None
+
+    @classmethod
+    def from_flat(cls, flat_kwds, lengths, col_kwds='kwds'):
+        """Encodes the keywords of all rows given as a single flat sequence, along with the number of keywords of each
+        row."""
+
+        codes, vocabulary = pd.factorize(np.array(flat_kwds, dtype=object))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        return cls(vocabulary, offsets, codes.astype(np.int32), col_kwds)
+
+    @classmethod
+    def from_lists(cls, kwds, col_kwds='kwds'):
+        """Encodes a Series containing a list of keywords per row."""
+
+        lengths = np.fromiter(map(len, kwds), dtype=np.int64, count=len(kwds))
+        return cls.from_flat(list(chain.from_iterable(kwds)), lengths, col_kwds)
+
+    @classmethod
+    def from_strings(cls, kwds, kwds_sep=',', col_kwds='kwds'):
+        """Encodes a Series containing a `kwds_sep` delimited string of keywords per row, without splitting each row
+        into a list."""
+
+        lengths = kwds.str.count(re.escape(kwds_sep)).values.astype(np.int64) + 1
+        return cls.from_flat(kwds_sep.join(kwds).split(kwds_sep), lengths, col_kwds)
+
+    @property
+    def num_rows(self):
+        return len(self.offsets) - 1
+
+    def lower_vocabulary(self):
+        """Returns the lowercased vocabulary."""
+
+        if self._lower_vocabulary is None:
+            self._lower_vocabulary = np.array([kwd.lower() for kwd in self.vocabulary], dtype=object)
+        return self._lower_vocabulary
+
+    def rows_of(self, positions):
+        """Returns the rows containing the given (sorted) positions of `codes`."""
+
+        return np.searchsorted(self.offsets, positions, side='right') - 1
+
+    def rows_with_kwd(self, kwd):
+        """Returns the sorted positions of the rows containing the given keyword (case insensitive)."""
+
+        matching = np.zeros(len(self.vocabulary), dtype=bool)
+        matching[self.lower_vocabulary() == kwd.lower()] = True
+        rows = self.rows_of(np.flatnonzero(matching[self.codes]))
+
+        return np.unique(rows)
+
+    def take(self, rows):
+        """Returns the encoding of the given rows."""
+
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+        return KwdsEncoding(self.vocabulary, offsets, self.codes[positions], self.col_kwds)
+
+    def decode(self):
+        """Returns the list of keywords of each row."""
+
+        kwds = self.vocabulary[self.codes].tolist()
+        offsets = self.offsets.tolist()
+        return [kwds[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def attach(self, gdf):
+        """Attaches the encoding to the given GeoDataFrame, which must have one row per encoded row."""
+
+        self.index = gdf.index
+        self._kwds_values = gdf[self.col_kwds].values if self.col_kwds in gdf.columns else None
+        gdf._kwds_encoding = self
+
+    def is_attached_to(self, gdf):
+        """Returns whether the encoding is attached to the given GeoDataFrame, with the same index and keywords column
+        (or lack of it) as when it was attached."""
+
+        if getattr(gdf, '_kwds_encoding', None) is not self or self.index is not gdf.index:
+            return False
+
+        values = gdf[self.col_kwds].values if self.col_kwds in gdf.columns else None
+        if values is None or self._kwds_values is None:
+            return values is None and self._kwds_values is None
+
+        # The attached values are kept alive, so their buffer cannot be reused by another column
+        return (len(values) == len(self._kwds_values) and
+                values.__array_interface__['data'] == self._kwds_values.__array_interface__['data'])
+
+
+def encode_kwds(gdf, col_kwds='kwds', drop=True):
+    """Creates a dictionary encoding of the keywords of a GeoDataFrame and attaches it to the GeoDataFrame.
+
+    Args:
+        gdf (GeoDataFrame): A GeoDataFrame with a keywords column.
+        col_kwds (string): Name of the column containing the keywords (default: `kwds`).
+        drop (bool): Whether to drop the keywords column, which saves memory and keeps the encoding the only copy of
+            the keywords; it can be restored with `decode_kwds` (default: True). If the column is kept, replacing it
+            invalidates the encoding, but assigning to individual values of it does not.
+
+    Returns:
+        The created KwdsEncoding.
+    """
+
+    encoding = KwdsEncoding.from_lists(gdf[col_kwds], col_kwds)
+    if drop:
+        gdf.drop(columns=[col_kwds], inplace=True)
+    encoding.attach(gdf)
+
+    return encoding
+
+
+def decode_kwds(gdf, col_kwds='kwds'):
+    """Restores the keywords column of a GeoDataFrame from its attached dictionary encoding.
+
+    Args:
+        gdf (GeoDataFrame): A GeoDataFrame with an attached keywords encoding.
+        col_kwds (string): Name of the encoded keywords column (default: `kwds`).
+    """
+
+    encoding = get_kwds_encoding(gdf, col_kwds)
+    gdf[col_kwds] = pd.Series(encoding.decode(), index=gdf.index, dtype=object)
+    encoding.attach(gdf)
+
+
+def get_kwds_encoding(gdf, col_kwds='kwds'):
+    """Returns the dictionary encoding of the keywords attached to a GeoDataFrame, if any.
+
+    Args:
+        gdf (GeoDataFrame): A GeoDataFrame.
+        col_kwds (string): Name of the encoded keywords column (default: `kwds`).
+
+    Returns:
+        The attached KwdsEncoding, or None if the GeoDataFrame has no (valid) encoding for `col_kwds`.
+    """
+
+    encoding = getattr(gdf, '_kwds_encoding', None)
+    if encoding is not None and encoding.col_kwds == col_kwds and encoding.is_attached_to(gdf):
+        return encoding
+
+    return None
+
+
+class KeywordIndex(object):
+    """An inverted index mapping each (lowercased) keyword of a POI GeoDataFrame to the sorted positions of the rows
+    containing it.
+
+    The index is built once and can then answer keyword filters, boolean combinations of them and prefix matches in
+    time proportional to the size of the result, e.g.::
+
+        kwd_index = KeywordIndex(pois)
+        cafes = filter_by_kwd(pois, 'cafe', kwd_index=kwd_index)
+        food_not_fast = kwd_index.filter(pois, any_of=['restaurant', 'cafe'], none_of=['fast_food'])
+        shops = kwd_index.filter(pois, any_of=['shop*'])
+
+    Query terms ending with `*` match all keywords starting with the given prefix. The positions refer to the rows of
+    the GeoDataFrame the index was built from, so the index must be rebuilt if that GeoDataFrame changes.
+
+    Args:
+        gdf (GeoDataFrame): A GeoDataFrame with a keywords column or an attached keywords encoding.
+        col_kwds (string): Name of the column containing the keywords (default: `kwds`).
+    """
+
+    def __init__(self, gdf, col_kwds='kwds'):
+        encoding = get_kwds_encoding(gdf, col_kwds)
+        if encoding is None:
+            encoding = KwdsEncoding.from_lists(gdf[col_kwds], col_kwds)
+
+        num_rows = encoding.num_rows
+
+        # Map the keyword codes to the codes of the sorted lowercased vocabulary
+        lower_codes, vocabulary = pd.factorize(encoding.lower_vocabulary())
+        order = np.argsort(vocabulary, kind='mergesort')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        codes = rank[lower_codes][encoding.codes]
+
+        # Sort the (keyword, row) pairs and remove duplicates
+        rows = np.repeat(np.arange(num_rows, dtype=np.int64), np.diff(encoding.offsets))
+        keys = np.unique(codes * max(num_rows, 1) + rows)
+
+        self.vocabulary = np.asarray(vocabulary)[order]
+        self.postings = keys % max(num_rows, 1)
+        self.offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // max(num_rows, 1), minlength=len(self.vocabulary)), out=self.offsets[1:])
+        self.num_rows = num_rows
+        self.col_kwds = col_kwds
+
+    def positions(self, kwd):
+        """Returns the sorted positions of the rows containing the given keyword (case insensitive)."""
+
+        kwd = kwd.lower()
+        i = np.searchsorted(self.vocabulary, kwd)
+        if i < len(self.vocabulary) and self.vocabulary[i] == kwd:
+            return self.postings[self.offsets[i]:self.offsets[i + 1]]
+
+        return self.postings[:0]
+
+    def prefix(self, prefix):
+        """Returns the sorted positions of the rows containing any keyword starting with the given prefix (case
+        insensitive)."""
+
+        prefix = prefix.lower()
+        lo = np.searchsorted(self.vocabulary, prefix, side='left')
+        hi = np.searchsorted(self.vocabulary, prefix + chr(0x10FFFF), side='left')
+        if hi - lo == 1:
+            return self.postings[self.offsets[lo]:self.offsets[hi]]
+
+        return np.unique(self.postings[self.offsets[lo]:self.offsets[hi]])
+
+    def _term_positions(self, term):
+        if term.endswith('*'):
+            return self.prefix(term[:-1])
+
+        return self.positions(term)
+
+    def query(self, all_of=None, any_of=None, none_of=None):
+        """Returns the sorted positions of the rows satisfying a boolean keyword query.
+
+        Args:
+            all_of (list): Keywords that must all be contained in a row (AND).
+            any_of (list): Keywords of which at least one must be contained in a row (OR).
+            none_of (list): Keywords that must not be contained in a row (NOT).
+
+        Returns:
+            An array with the positions of the matching rows.
+        """
+
+        result = None
+
+        if all_of:
+            # Intersect starting from the shortest list of positions
+            for positions in sorted([self._term_positions(t) for t in all_of], key=len):
+                result = positions if result is None else np.intersect1d(result, positions, assume_unique=True)
+
+        if any_of:
+            positions = np.unique(np.concatenate([self._term_positions(t) for t in any_of]))
+            result = positions if result is None else np.intersect1d(result, positions, assume_unique=True)
+
+        if none_of:
+            if result is None:
+                result = np.arange(self.num_rows, dtype=np.int64)
+            positions = np.unique(np.concatenate([self._term_positions(t) for t in none_of]))
+            result = np.setdiff1d(result, positions, assume_unique=True)
+
+        if result is None:
+            result = np.arange(self.num_rows, dtype=np.int64)
+
+        return result
+
+    def filter(self, df, all_of=None, any_of=None, none_of=None):
+        """Returns the rows of a DataFrame satisfying a boolean keyword query (see `query`).
+
+        Args:
+            df (DataFrame): The DataFrame the index was built from.
+            all_of (list): Keywords that must all be contained in a row (AND).
+            any_of (list): Keywords of which at least one must be contained in a row (OR).
+            none_of (list): Keywords that must not be contained in a row (NOT).
+
+        Returns:
+            A GeoDataFrame with only the matching rows.
+        """
+
+        return _take_rows(df, self.query(all_of, any_of, none_of), self)
+
+
+def _take_rows(df, rows, kwd_index):
+    """Returns the given rows of a DataFrame, carrying over the subset of its keywords encoding (if any)."""
+
+    if len(df.index) != kwd_index.num_rows:
+        raise ValueError('The keyword index was built from a DataFrame with a different number of rows.')
+
+    filtered_gdf = df.iloc[rows]
+    encoding = get_kwds_encoding(df, kwd_index.col_kwds)
+    if encoding is not None:
+        encoding.take(rows).attach(filtered_gdf)
+
+    return filtered_gdf
+
+
+def filter_by_kwd(df, kwd_filter, col_kwds='kwds', kwd_index=None):
     """Returns a DataFrame with only those rows that contain the specified keyword.
 
     Args:
         df (DataFrame): The initial DataFrame to be filtered.
         kwd_filter (string): The keyword to use for filtering.
         col_kwds (string): Name of the column containing the keywords (default: `kwds`).
+        kwd_index (KeywordIndex): A keyword index built from `df`, used to avoid scanning all rows (default: None).
 
     Returns:
         A GeoDataFrame with only those rows that contain `kwd_filter`.
     """
 
-    mask = df[col_kwds].apply(lambda x: kwd_filter.lower() in [y.lower() for y in x])
+    if kwd_index is not None:
+        return _take_rows(df, kwd_index.positions(kwd_filter), kwd_index)
+
+    encoding = get_kwds_encoding(df, col_kwds)
+    if encoding is not None:
+        rows = encoding.rows_with_kwd(kwd_filter)
+        filtered_gdf = df.iloc[rows]
+        encoding.take(rows).attach(filtered_gdf)
+        return filtered_gdf
+
+    mask = df[col_kwds].apply(lambda x: kwd_filter.lower() in [y.lower() for y in x]).astype(bool)
     filtered_gdf = df[mask]
 
     return filtered_gdf
 
 
+def _kwd_mask(pois, kwd_filter, col_kwds, kwd_index):
+    """Returns a boolean mask of the POIs containing `kwd_filter`, or None if it is not provided."""
+
+    if kwd_filter is None:
+        return None
+
+    if kwd_index is not None:
+        if len(pois.index) != kwd_index.num_rows:
+            raise ValueError('The keyword index was built from a DataFrame with a different number of rows.')
+        rows = kwd_index.positions(kwd_filter)
+    else:
+        encoding = get_kwds_encoding(pois, col_kwds)
+        if encoding is None:
+            return pois[col_kwds].apply(lambda x: kwd_filter.lower() in [y.lower() for y in x]).values.astype(bool)
+        rows = encoding.rows_with_kwd(kwd_filter)
+
+    mask = np.zeros(len(pois.index), dtype=bool)
+    mask[rows] = True
+
+    return mask
+
+
+def _nearest_matching(sindex, x, y, k, mask):
+    """Returns the `k` points nearest to each location among those in `mask`, in the layout of
+    `SpatialIndex.nearest` for arrays of locations.
+
+    Since the spatial index covers all points, more than `k` neighbors are fetched (as many as expected to contain `k`
+    matching ones, given the fraction of points in `mask`), doubling their number for the locations that still have
+    fewer than `k` matching neighbors. If that would fetch more neighbors than there are matching points, only the
+    matching points are searched instead.
+    """
+
+    distances = np.full((len(x), k), np.inf)
+    positions = np.full((len(x), k), -1, dtype=np.int64)
+    num_points = len(sindex)
+    num_matches = int(mask.sum())
+    if k == 0 or num_matches == 0:
+        return distances, positions
+
+    fetch = min(num_points, max(k, 2 * int(math.ceil(k * num_points / num_matches))))
+    if fetch > num_matches:
+        rows = np.flatnonzero(mask)
+        tree = cKDTree(np.column_stack([sindex.geometry[rows].x, sindex.geometry[rows].y]))
+        matching_k = min(k, num_matches)
+        fetched_distances, fetched_positions = tree.query(np.column_stack([x, y]), k=matching_k)
+        distances[:, :matching_k] = fetched_distances.reshape(-1, matching_k)
+        positions[:, :matching_k] = rows[fetched_positions.reshape(-1, matching_k)]
+        return distances, positions
+
+    pending = np.arange(len(x))
+    while len(pending) > 0:
+        fetched_distances, fetched_positions = sindex.nearest(x[pending], y[pending], fetch)
+        matching = (fetched_positions >= 0) & mask[np.maximum(fetched_positions, 0)]
+        ranks = np.cumsum(matching, axis=1) - 1
+        rows, cols = np.nonzero(matching & (ranks < k))
+        distances[pending[rows], ranks[rows, cols]] = fetched_distances[rows, cols]
+        positions[pending[rows], ranks[rows, cols]] = fetched_positions[rows, cols]
+
+        if fetch == num_points:
+            break
+        pending = pending[matching.sum(axis=1) < k]
+        fetch = min(num_points, 2 * fetch)
+
+    return distances, positions
+
+
+def pois_within_distance(pois, location, radius, kwd_filter=None, col_kwds='kwds', kwd_index=None):
+    """Returns the POIs within a given distance from a location, optionally only those containing a keyword.
+
+    Distances are computed in the units of the CRS of `pois`, which should therefore be a projected CRS. The POIs are
+    searched through their spatial index (see `index.get_spatial_index`), which is built once and then reused by
+    subsequent searches on the same GeoDataFrame. A keyword filter is applied to the POIs found by the index, so it
+    does not require indexing the matching POIs separately.
+
+    Args:
+        pois (GeoDataFrame): A POI GeoDataFrame.
+        location (Point): The location.
+        radius (float): The distance.
+        kwd_filter (string): A keyword that the returned POIs should contain (default: None).
+        col_kwds (string): Name of the column containing the keywords (default: `kwds`).
+        kwd_index (KeywordIndex): A keyword index built from `pois`, used for the keyword filter (default: None).
+
+    Returns:
+        A GeoDataFrame with the POIs within distance `radius` from `location`, sorted by distance, with an additional
+        `distance` column.
+    """
+
+    sindex = get_spatial_index(pois)
+    mask = _kwd_mask(pois, kwd_filter, col_kwds, kwd_index)
+
+    positions = sindex.within_distance(location.x, location.y, radius)
+    if mask is not None:
+        positions = positions[mask[positions]]
+    distances = np.hypot(pois.geometry.x.values[positions] - location.x, pois.geometry.y.values[positions] - location.y)
+    order = np.argsort(distances, kind='mergesort')
+
+    result = pois.iloc[positions[order]].copy()
+    result['distance'] = distances[order]
+
+    return result
+
+
+def nearest_pois(pois, location, k=10, kwd_filter=None, col_kwds='kwds', kwd_index=None):
+    """Returns the `k` POIs nearest to a location, optionally only among those containing a keyword.
+
+    Distances are computed as in `pois_within_distance`.
+
+    Args:
+        pois (GeoDataFrame): A POI GeoDataFrame.
+        location (Point): The location.
+        k (int): The number of POIs to return (default: 10).
+        kwd_filter (string): A keyword that the returned POIs should contain (default: None).
+        col_kwds (string): Name of the column containing the keywords (default: `kwds`).
+        kwd_index (KeywordIndex): A keyword index built from `pois`, used for the keyword filter (default: None).
+
+    Returns:
+        A GeoDataFrame with the (at most) `k` POIs nearest to `location`, sorted by distance, with an additional
+        `distance` column.
+    """
+
+    sindex = get_spatial_index(pois)
+    mask = _kwd_mask(pois, kwd_filter, col_kwds, kwd_index)
+
+    if mask is None:
+        distances, positions = sindex.nearest(location.x, location.y, k)
+    else:
+        distances, positions = _nearest_matching(sindex, np.array([location.x]), np.array([location.y]), k, mask)
+        distances, positions = distances[0], positions[0]
+    found = positions >= 0
+
+    result = pois.iloc[positions[found]].copy()
+    result['distance'] = distances[found]
+
+    return result
+
+
+def pairs_within_distance(locations, pois, radius, kwd_filter=None, col_kwds='kwds', kwd_index=None):
+    """Finds, for each of a batch of locations, all POIs within a given distance, optionally only those containing a
+    keyword.
+
+    All pairs are computed at once, by a dual tree traversal over the locations and the POIs. Distances are computed
+    as in `pois_within_distance`.
+
+    Args:
+        locations (GeoSeries): The locations (points), in the CRS of `pois`.
+        pois (GeoDataFrame): A POI GeoDataFrame.
+        radius (float): The distance.
+        kwd_filter (string): A keyword that the returned POIs should contain (default: None).
+        col_kwds (string): Name of the column containing the keywords (default: `kwds`).
+        kwd_index (KeywordIndex): A keyword index built from `pois`, used for the keyword filter (default: None).
+
+    Returns:
+        A DataFrame with a row per pair and columns `location_index` and `poi_index` (the index labels of the location
+        and the POI in `locations` and `pois`) and `distance`, sorted by location (in the order of `locations`) and
+        distance.
+    """
+
+    sindex = get_spatial_index(pois)
+    mask = _kwd_mask(pois, kwd_filter, col_kwds, kwd_index)
+
+    geometry = locations.geometry
+    location_positions, positions, distances = sindex.pairs_within_distance(geometry.x.values, geometry.y.values,
+                                                                            radius)
+    if mask is not None:
+        matching = mask[positions]
+        location_positions, positions, distances = (location_positions[matching], positions[matching],
+                                                    distances[matching])
+
+    return pd.DataFrame({'location_index': locations.index.values[location_positions],
+                         'poi_index': pois.index.values[positions], 'distance': distances})
+
+
+def nearest_pairs(locations, pois, k=10, kwd_filter=None, col_kwds='kwds', kwd_index=None):
+    """Finds, for each of a batch of locations, the `k` nearest POIs, optionally only among those containing a keyword.
+
+    Distances are computed as in `pois_within_distance`.
+
+    Args:
+        locations (GeoSeries): The locations (points), in the CRS of `pois`.
+        pois (GeoDataFrame): A POI GeoDataFrame.
+        k (int): The number of POIs per location (default: 10).
+        kwd_filter (string): A keyword that the returned POIs should contain (default: None).
+        col_kwds (string): Name of the column containing the keywords (default: `kwds`).
+        kwd_index (KeywordIndex): A keyword index built from `pois`, used for the keyword filter (default: None).
+
+    Returns:
+        A DataFrame with a row per pair and columns `location_index` and `poi_index` (the index labels of the location
+        and the POI in `locations` and `pois`) and `distance`, sorted by location (in the order of `locations`) and
+        distance.
+    """
+
+    sindex = get_spatial_index(pois)
+    mask = _kwd_mask(pois, kwd_filter, col_kwds, kwd_index)
+
+    geometry = locations.geometry
+    if mask is None:
+        distances, positions = sindex.nearest(geometry.x.values, geometry.y.values, k)
+    else:
+        distances, positions = _nearest_matching(sindex, geometry.x.values, geometry.y.values, k, mask)
+    location_positions = np.repeat(np.arange(len(geometry)), k).reshape(-1, k)
+    found = positions >= 0
+
+    return pd.DataFrame({'location_index': locations.index.values[location_positions[found]],
+                         'poi_index': pois.index.values[positions[found]], 'distance': distances[found]})
+
+
 def bbox(gdf):
     """Computes the bounding box of a GeoDataFrame.
 
@@ -37,11 +572,23 @@ def bbox(gdf):
     return box(minx, miny, maxx, maxy)
 
 
+def _kwds_encoding_or_lists(gdf, col_kwds):
+    """Returns the keyword encoding attached to a GeoDataFrame or, if there is none, an encoding of its keywords column
+    (which is not attached)."""
+
+    encoding = get_kwds_encoding(gdf, col_kwds)
+    if encoding is None:
+        encoding = KwdsEncoding.from_lists(gdf[col_kwds].values, col_kwds)
+
+    return encoding
+
+
 def kwds_freq(gdf, col_kwds='kwds', normalized=False):
     """Computes the frequency of keywords in the provided GeoDataFrame.
 
     Args:
-        gdf (GeoDataFrame): A GeoDataFrame with a keywords column.
+        gdf (GeoDataFrame): A GeoDataFrame with a keywords column, or an iterable of such GeoDataFrames (e.g., the
+            chunks yielded by `io.iter_poi_csv`), in which case the frequencies are accumulated over all of them.
         col_kwds (string) : The column containing the list of keywords (default: `kwds`).
         normalized (bool): If True, the returned frequencies are normalized in [0,1]
             by dividing with the number of rows in `gdf` (default: False).
@@ -50,17 +597,24 @@ def kwds_freq(gdf, col_kwds='kwds', normalized=False):
         A dictionary containing for each keyword the number of rows it appears in.
     """
 
-    kwds_ser = gdf[col_kwds]
+    if isinstance(gdf, pd.DataFrame):
+        gdf = [gdf]
 
     kwds_freq_dict = dict()
-    for (index, kwds) in kwds_ser.iteritems():
-        for kwd in kwds:
-            if kwd in kwds_freq_dict:
-                kwds_freq_dict[kwd] += 1
-            else:
-                kwds_freq_dict[kwd] = 1
+    num_of_records = 0
+    for chunk in gdf:
+        encoding = get_kwds_encoding(chunk, col_kwds)
+        if encoding is not None:
+            counts = np.bincount(encoding.codes, minlength=len(encoding.vocabulary))
+            chunk_freq = zip(encoding.vocabulary[counts > 0].tolist(), counts[counts > 0].tolist())
+        else:
+            # Count all keywords of the chunk in a single pass over the flattened lists
+            chunk_freq = Counter(chain.from_iterable(chunk[col_kwds].values)).items()
+
+        for (kwd, freq) in chunk_freq:
+            kwds_freq_dict[kwd] = kwds_freq_dict.get(kwd, 0) + freq
 
-    num_of_records = kwds_ser.size
+        num_of_records += len(chunk.index)
 
     if normalized:
         for(kwd, freq) in kwds_freq_dict.items():
@@ -69,38 +623,479 @@ def kwds_freq(gdf, col_kwds='kwds', normalized=False):
     return kwds_freq_dict
 
 
-def freq_locationsets(location_visits, location_id_col, locations, locationset_id_col, min_sup, min_length):
+def kwds_freq_grouped(gdf, col_group, col_kwds='kwds'):
+    """Computes the frequency of keywords per group (e.g., per cluster or grid cell) in the provided GeoDataFrame.
+
+    Args:
+        gdf (GeoDataFrame): A GeoDataFrame with a keywords column and a group label column, or an iterable of such
+            GeoDataFrames (see `kwds_freq`).
+        col_group (string): The column containing the group label of each row (e.g., `cluster_id` or `cell_id`).
+        col_kwds (string) : The column containing the list of keywords (default: `kwds`).
+
+    Returns:
+        A sparse matrix (CSR) with the number of occurrences of each keyword (column) in each group (row), the (sorted)
+        group labels corresponding to the rows, and the keywords corresponding to the columns.
+    """
+
+    if isinstance(gdf, pd.DataFrame):
+        gdf = [gdf]
+
+    vocabulary = pd.Index([])
+    row_groups = []
+    occurrence_rows = []
+    occurrence_codes = []
+    num_of_records = 0
+    for chunk in gdf:
+        encoding = _kwds_encoding_or_lists(chunk, col_kwds)
+
+        # Map the keywords of the chunk to the vocabulary of all chunks
+        new_kwds = encoding.vocabulary[vocabulary.get_indexer(encoding.vocabulary) < 0]
+        vocabulary = vocabulary.append(pd.Index(new_kwds))
+        occurrence_codes.append(vocabulary.get_indexer(encoding.vocabulary)[encoding.codes])
+
+        occurrence_rows.append(np.repeat(np.arange(encoding.num_rows), np.diff(encoding.offsets)) + num_of_records)
+        row_groups.append(chunk[col_group].values)
+        num_of_records += encoding.num_rows
+
+    group_codes, groups = pd.factorize(np.concatenate(row_groups) if row_groups else np.zeros(0), sort=True)
+    occurrence_rows = np.concatenate(occurrence_rows) if occurrence_rows else np.zeros(0, dtype=np.int64)
+    occurrence_codes = np.concatenate(occurrence_codes) if occurrence_codes else np.zeros(0, dtype=np.int64)
+
+    counts = coo_matrix((np.ones(len(occurrence_codes), dtype=np.int64), (group_codes[occurrence_rows],
+                                                                          occurrence_codes)),
+                        shape=(len(groups), len(vocabulary))).tocsr()
+
+    return counts, pd.Index(groups, name=col_group), vocabulary.values
+
+
+class KwdsProfile(object):
+    """The keyword frequencies of each group of rows (e.g., cluster or grid cell) of a POI GeoDataFrame.
+
+    The profile holds a sparse (group x keyword) count matrix, computed once by `kwds_profile`, from which the keyword
+    frequencies of any group (as returned by `kwds_freq`, e.g., for `plots.barchart` or `plots.plot_wordcloud`) or the
+    documents of topic modeling (see `topics.topic_modeling`) are derived without recounting the keywords.
+
+    Args:
+        counts (csr_matrix): The number of occurrences of each keyword (column) in each group (row).
+        groups (Index): The group labels corresponding to the rows of `counts`.
+        vocabulary (ndarray): The keywords corresponding to the columns of `counts`.
+        sizes (ndarray): The number of rows of each group.
+    """
+
+    def __init__(self, counts, groups, vocabulary, sizes):
+        self.counts = counts
+        self.groups = groups
+        self.vocabulary = vocabulary
+        self.sizes = sizes
+        self.index = None
+        self.labels = None
+
+    def freq(self, group=None, normalized=False):
+        """Returns the frequency of keywords in a group, or in all groups.
+
+        Args:
+            group: The label of the group (default: None, all groups).
+            normalized (bool): If True, the returned frequencies are normalized in [0,1] by dividing with the number of
+                rows in the group (default: False).
+
+        Returns:
+            A dictionary containing for each keyword the number of rows it appears in, as in `kwds_freq`.
+        """
+
+        if group is None:
+            counts = np.asarray(self.counts.sum(axis=0)).ravel()
+            num_of_records = self.sizes.sum()
+        else:
+            row = self.groups.get_loc(group)
+            counts = self.counts[row].toarray().ravel()
+            num_of_records = self.sizes[row]
+
+        used = np.flatnonzero(counts)
+        if normalized:
+            return dict(zip(self.vocabulary[used].tolist(), (counts[used] / num_of_records).tolist()))
+
+        return dict(zip(self.vocabulary[used].tolist(), counts[used].tolist()))
+
+
+def kwds_profile(gdf, col_group, col_kwds='kwds'):
+    """Returns the keyword profile of the groups of rows of a GeoDataFrame, computing it on first use.
+
+    The profile is kept on the GeoDataFrame itself and reused by subsequent calls, as long as the GeoDataFrame has the
+    same index and group labels.
+
+    Args:
+        gdf (GeoDataFrame): A GeoDataFrame with a keywords column and a group label column.
+        col_group (string): The column containing the group label of each row (e.g., `cluster_id` or `cell_id`).
+        col_kwds (string) : The column containing the list of keywords (default: `kwds`).
+
+    Returns:
+        A KwdsProfile.
+    """
+
+    profiles = getattr(gdf, '_kwds_profiles', None)
+    if profiles is None:
+        # Set directly, since pandas warns about setting list-like attributes that are not columns
+        profiles = dict()
+        object.__setattr__(gdf, '_kwds_profiles', profiles)
+
+    labels = gdf[col_group].values
+    profile = profiles.get((col_group, col_kwds))
+    if profile is None or profile.index is not gdf.index or not np.array_equal(profile.labels, labels):
+        counts, groups, vocabulary = kwds_freq_grouped(gdf, col_group, col_kwds)
+        sizes = np.bincount(groups.get_indexer(labels), minlength=len(groups))
+        profile = KwdsProfile(counts, groups, vocabulary, sizes)
+        profile.index = gdf.index
+        profile.labels = labels.copy()
+        profiles[(col_group, col_kwds)] = profile
+
+    return profile
+
+
+# Number of set bits of each byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# Number of transactions multiplied at once with the candidate itemsets
+_COUNT_BLOCK_SIZE = 2**16
+
+
+def _encode_transactions(location_visits, location_id_col, locationset_id_col):
+    """Encodes the location visits as distinct (location, locationset) pairs of integer codes.
+
+    Returns:
+        The location codes and the locationset codes of the pairs, the distinct location ids (in sorted order, so the
+        codes follow the order of the ids) and the number of locationsets.
+    """
+
+    items, item_ids = pd.factorize(location_visits[location_id_col], sort=True)
+    txns, txn_ids = pd.factorize(location_visits[locationset_id_col])
+    valid = (items >= 0) & (txns >= 0)
+    items = items[valid].astype(np.int64)
+    txns = txns[valid].astype(np.int64)
+
+    pairs = np.unique(txns * len(item_ids) + items)
+
+    return pairs % len(item_ids), pairs // len(item_ids), np.asarray(item_ids).tolist(), len(txn_ids)
+
+
+def _min_count(min_sup, num_txns):
+    """Returns the minimum number of locationsets an itemset must appear in to have support at least `min_sup`."""
+
+    min_count = int(math.ceil(min_sup * num_txns))
+    while min_count > 0 and (min_count - 1) / num_txns >= min_sup:
+        min_count -= 1
+    while min_count / num_txns < min_sup:
+        min_count += 1
+
+    return max(min_count, 1)
+
+
+def _bitset_extend(tidsets, j, others):
+    """Intersects the j-th bitset with each of the `others`, returning the intersections and their sizes."""
+
+    tidsets = tidsets[j] & tidsets[others]
+    return tidsets, _POPCOUNT[tidsets].sum(axis=1, dtype=np.int64)
+
+
+def _tidlist_extend(tidsets, j, others):
+    """Intersects the j-th sorted tid-list with each of the `others`, returning the intersections and their sizes."""
+
+    sizes = np.array([len(tidsets[k]) for k in others], dtype=np.int64)
+    tids = np.concatenate([tidsets[k] for k in others])
+    common = tidsets[j][np.minimum(np.searchsorted(tidsets[j], tids), len(tidsets[j]) - 1)] == tids
+    tids = tids[common]
+    ext_sizes = np.add.reduceat(common, np.cumsum(sizes) - sizes, dtype=np.int64)
+    ext_ends = np.cumsum(ext_sizes)
+    return [tids[e - n:e] for e, n in zip(ext_ends, ext_sizes)], ext_sizes
+
+
+def _eclat(prefix, items, tidsets, counts, min_count, max_length, extend, itemsets, supports):
+    """Depth-first ECLAT over the equivalence class of `prefix`, appending the frequent itemsets to `itemsets` and
+    their number of transactions to `supports`."""
+
+    for j in range(len(items)):
+        itemset = prefix + (items[j],)
+        itemsets.append(itemset)
+        supports.append(counts[j])
+        if j + 1 == len(items) or (max_length is not None and len(itemset) >= max_length):
+            continue
+        ext_tidsets, ext_counts = extend(tidsets, j, np.arange(j + 1, len(items)))
+        keep = np.flatnonzero(ext_counts >= min_count)
+        if len(keep) > 0:
+            if isinstance(ext_tidsets, list):
+                ext_tidsets = [ext_tidsets[k] for k in keep]
+            else:
+                ext_tidsets = ext_tidsets[keep]
+            _eclat(itemset, items[j + 1:][keep], ext_tidsets, ext_counts[keep], min_count, max_length, extend,
+                   itemsets, supports)
+
+
+def _mine_itemsets(items, txns, num_items, num_txns, min_count, max_length, max_memory):
+    """Mines the itemsets appearing in at least `min_count` transactions, given the distinct (item, transaction) pairs.
+
+    The supports of all the pairs of frequent items are counted at once with a sparse co-occurrence product, so the
+    transactions of an item are only intersected with those of the items it forms a frequent pair with. The
+    transactions of each frequent item are kept as bitsets, or as sorted tid-lists if these are smaller (i.e., the
+    frequent items appear on average in less than 1/32 of the transactions) or if the bitsets would take more than
+    `max_memory` bytes.
+
+    Returns:
+        The frequent itemsets (tuples of increasing item codes) ordered by length and then lexicographically, and an
+        array with the number of transactions containing each of them.
+    """
+
+    item_counts = np.bincount(items, minlength=num_items)
+    frequent = np.flatnonzero(item_counts >= min_count)
+    counts = item_counts[frequent]
+
+    rank = np.full(num_items, -1, dtype=np.int64)
+    rank[frequent] = np.arange(len(frequent))
+    in_frequent = rank[items] >= 0
+    ranks = rank[items[in_frequent]]
+    txns = txns[in_frequent]
+
+    itemsets = []
+    supports = []
+    if max_length == 1:
+        itemsets = [(i,) for i in range(len(frequent))]
+        supports = counts.tolist()
+    else:
+        x = coo_matrix((np.ones(len(ranks), dtype=np.int64), (txns, ranks)), shape=(num_txns, len(frequent))).tocsc()
+        pair_counts = triu(x.T.dot(x), k=1).tocsr()
+        pair_counts.data[pair_counts.data < min_count] = 0
+        pair_counts.eliminate_zeros()
+        pair_counts.sort_indices()
+
+        num_bytes = (num_txns + 7) // 8
+        if max_length == 2:
+            tidsets = None
+        elif len(frequent) * num_bytes <= min(max_memory, 4 * len(ranks)):
+            # The pairs are distinct, so the bits summed within each byte never overlap
+            tidsets = np.bincount(ranks * num_bytes + (txns >> 3), weights=np.left_shift(1, 7 - (txns & 7)),
+                                  minlength=len(frequent) * num_bytes)
+            tidsets = tidsets.astype(np.uint8).reshape(len(frequent), num_bytes)
+            extend = _bitset_extend
+        else:
+            order = np.lexsort((txns, ranks))
+            tids = txns[order].astype(np.int32)
+            ends = np.cumsum(counts)
+            tidsets = [tids[e - n:e] for e, n in zip(ends, counts)]
+            extend = _tidlist_extend
+
+        for j in range(len(frequent)):
+            itemsets.append((j,))
+            supports.append(counts[j])
+            start, end = pair_counts.indptr[j], pair_counts.indptr[j + 1]
+            if start == end:
+                continue
+            others = pair_counts.indices[start:end]
+            if tidsets is None:
+                itemsets.extend((j, k) for k in others)
+                supports.extend(pair_counts.data[start:end])
+                continue
+            ext_tidsets, ext_counts = extend(tidsets, j, others)
+            _eclat((j,), others, ext_tidsets, ext_counts, min_count, max_length, extend, itemsets, supports)
+
+    order = sorted(range(len(itemsets)), key=lambda i: (len(itemsets[i]), itemsets[i]))
+
+    return [tuple(frequent[list(itemsets[i])].tolist()) for i in order], np.array(supports, dtype=np.int64)[order]
+
+
+def _locationsets_gdf(location_ids, support, locations, min_length):
+    """Returns the GeoDataFrame of the given location sets with length at least `min_length`."""
+
+    df = pd.DataFrame({'support': support, 'location_ids': location_ids})
+    df['length'] = df['location_ids'].apply(len)
+    df = df[df['length'] >= min_length]
+
+    # Look up all the locations at once, and assemble the WKB of each location set from the WKB of its locations
+    ids = list(chain.from_iterable(df['location_ids']))
+    positions = pd.Index(locations.index).get_indexer(ids)
+    if (positions < 0).any():
+        missing = pd.unique(np.asarray(ids, dtype=object)[positions < 0])
+        raise ValueError('`locations` does not contain the location ids: %s.' % ', '.join(map(str, missing)))
+    used, positions = np.unique(positions, return_inverse=True)
+    members = gpd.GeoSeries(locations.geometry.values[used]).to_wkb().values[positions]
+
+    # Little endian WKB geometry collection header
+    ends = np.cumsum(df['length'].values)
+    geometry = gpd.GeoSeries.from_wkb([b'\x01' + struct.pack('<II', 7, n) + b''.join(members[e - n:e])
+                                       for e, n in zip(ends, df['length'].values)]).values
+
+    return gpd.GeoDataFrame(df, crs=locations.crs, geometry=geometry)
+
+
+def _mine_chunk(location_visits, location_id_col, locationset_id_col, min_sup, max_length, max_memory, keep):
+    """Mines the location sets that are frequent within a chunk of the location visits (first pass of SON).
+
+    Returns:
+        The locally frequent location sets (tuples of sorted location ids), the number of locationsets of the chunk,
+        and its encoded transactions if `keep` is True (or None).
+    """
+
+    items, txns, item_ids, num_txns = _encode_transactions(location_visits, location_id_col, locationset_id_col)
+    encoded = (items, txns, item_ids, num_txns) if keep else None
+    if len(item_ids) == 0:
+        return [], num_txns, encoded
+
+    itemsets, _ = _mine_itemsets(items, txns, len(item_ids), num_txns, _min_count(min_sup, num_txns), max_length,
+                                 max_memory)
+
+    return [tuple(item_ids[i] for i in itemset) for itemset in itemsets], num_txns, encoded
+
+
+def _count_itemsets(items, txns, item_ids, num_txns, candidates):
+    """Counts the transactions containing each of the candidate itemsets (tuples of item ids), given the distinct
+    (item, transaction) pairs of the transactions.
+
+    The transactions are multiplied, in blocks, with the item-candidate incidence matrix; a transaction contains a
+    candidate if the product is equal to the length of the candidate.
+    """
+
+    lengths = np.array([len(c) for c in candidates], dtype=np.int64)
+    cands = np.repeat(np.arange(len(candidates)), lengths)
+    codes = pd.Index(item_ids).get_indexer(list(chain.from_iterable(candidates)))
+    present = codes >= 0
+
+    y = coo_matrix((np.ones(present.sum(), dtype=np.int64), (codes[present], cands[present])),
+                   shape=(len(item_ids), len(candidates))).tocsr()
+    x = coo_matrix((np.ones(len(items), dtype=np.int64), (txns, items)), shape=(num_txns, len(item_ids))).tocsr()
+
+    counts = np.zeros(len(candidates), dtype=np.int64)
+    for start in range(0, num_txns, _COUNT_BLOCK_SIZE):
+        hits = x[start:start + _COUNT_BLOCK_SIZE].dot(y)
+        counts += np.bincount(hits.indices[hits.data == lengths[hits.indices]], minlength=len(candidates))
+
+    return counts
+
+
+def _count_chunk(location_visits, location_id_col, locationset_id_col, candidates):
+    """Counts the locationsets of a chunk of the location visits containing each of the candidate location sets
+    (second pass of SON)."""
+
+    items, txns, item_ids, num_txns = _encode_transactions(location_visits, location_id_col, locationset_id_col)
+    if len(item_ids) == 0:
+        return np.zeros(len(candidates), dtype=np.int64)
+
+    return _count_itemsets(items, txns, item_ids, num_txns, candidates)
+
+
+def _imap(fn, args, n_jobs):
+    """Yields `fn(*a)` for each `a` in `args`, in order, in a pool of `n_jobs` processes.
+
+    At most `2 * n_jobs` calls are pending at any time, so `args` is consumed lazily.
+    """
+
+    if n_jobs == 1:
+        for a in args:
+            yield fn(*a)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        pending = deque()
+        for a in args:
+            pending.append(executor.submit(fn, *a))
+            if len(pending) >= 2 * n_jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _son_itemsets(chunks, location_id_col, locationset_id_col, min_sup, max_length, max_memory, n_jobs):
+    """Mines the frequent location sets of the given chunks of location visits with the SON algorithm.
+
+    Each chunk is mined locally with the same relative support; since a location set that is frequent overall is
+    frequent in at least one chunk, the union of the local results contains all frequent location sets, whose exact
+    supports are then counted in a second pass over the chunks.
+
+    Returns:
+        The frequent location sets (tuples of sorted location ids) ordered by length and then lexicographically, an
+        array with the number of locationsets containing each of them, and the total number of locationsets.
+    """
+
+    # A one-off iterator cannot be read twice, so its chunks are kept encoded for the second pass
+    reread = callable(chunks) or iter(chunks) is not chunks
+    source = chunks() if callable(chunks) else chunks
+
+    candidates = set()
+    num_txns = 0
+    encoded = []
+    args = ((chunk, location_id_col, locationset_id_col, min_sup, max_length, max_memory, not reread)
+            for chunk in source)
+    for local_itemsets, chunk_txns, chunk_encoded in _imap(_mine_chunk, args, n_jobs):
+        candidates.update(local_itemsets)
+        num_txns += chunk_txns
+        if not reread:
+            encoded.append(chunk_encoded)
+
+    candidates = sorted(candidates, key=lambda c: (len(c), c))
+    counts = np.zeros(len(candidates), dtype=np.int64)
+    if len(candidates) > 0:
+        if reread:
+            source = chunks() if callable(chunks) else chunks
+            partials = _imap(_count_chunk, ((chunk, location_id_col, locationset_id_col, candidates)
+                                            for chunk in source), n_jobs)
+        else:
+            partials = _imap(_count_itemsets, (chunk_encoded + (candidates,) for chunk_encoded in encoded), n_jobs)
+        for partial in partials:
+            counts += partial
+
+    frequent = np.flatnonzero(counts >= _min_count(min_sup, max(num_txns, 1)))
+
+    return [candidates[i] for i in frequent], counts[frequent], num_txns
+
+
+def freq_locationsets(location_visits, location_id_col, locations, locationset_id_col, min_sup, min_length,
+                      max_length=None, max_memory=2**30, n_jobs=1):
     """Computes frequently visited sets of locations based on frequent itemset mining.
 
+    The location sets are mined with ECLAT, intersecting the sets of locationsets (transactions) of the locations as
+    bitsets. If the bitsets of the frequent locations would exceed `max_memory`, sorted lists of transaction ids are
+    intersected instead, which is slower but takes memory proportional to the number of visits.
+
+    The location visits can also be given as chunks, each containing all the visits of its locationsets (e.g., a log
+    split by user or by day), which are mined with the SON algorithm: each chunk is mined separately, in a pool of
+    `n_jobs` processes, and the exact supports of the location sets found are then counted in a second pass over the
+    chunks. The chunks are read twice if `location_visits` is a list of DataFrames or a callable returning an
+    iterable of DataFrames (e.g., `lambda: pd.read_csv(path, chunksize=10**6)`); the chunks of any other iterable are
+    kept in memory (encoded) between the two passes. A DataFrame is split into `n_jobs` such chunks if `n_jobs` > 1.
+    The result is the same in all cases.
+
         Args:
-             location_visits (DataFrame): A DataFrame with location ids and locationset ids.
+             location_visits (DataFrame): A DataFrame with location ids and locationset ids, or an iterable of such
+                DataFrames, or a callable returning such an iterable.
              location_id_col (String): The name of the column containing the location ids.
              locationset_id_col (String): The name of the column containing the locationsets ids.
              locations (GeoDataFrame): A GeoDataFrame containing the geometries of the locations.
              min_sup (float): The minimum support threshold.
              min_length (int): Minimum length of itemsets to be returned.
+             max_length (int): Maximum length of itemsets to be mined (default: None, i.e. no limit).
+             max_memory (int): Approximate memory limit in bytes for the transaction bitsets (default: 1GB).
+             n_jobs (int): The number of processes mining the chunks (default: 1; -1 means one per CPU).
 
         Returns:
             A GeoDataFrame with the support, length and geometry of the computed location sets.
     """
 
-    itemsets = location_visits.groupby([locationset_id_col], sort=False)[location_id_col].agg(set)
-    te = TransactionEncoder()
-    oht_ary = te.fit(itemsets).transform(itemsets.values, sparse=True)
-    sparse_df = pd.SparseDataFrame(oht_ary, columns=te.columns_, default_fill_value=False)
-
-    apriori_df = apriori(sparse_df, min_support=min_sup, use_colnames=True)
-    apriori_df['length'] = apriori_df['itemsets'].apply(lambda x: len(x))
+    if max_length is not None and max_length < 1:
+        raise ValueError('`max_length` must be at least 1.')
 
-    apriori_df = apriori_df[(apriori_df['length'] >= min_length)]
+    n_jobs = _num_workers(n_jobs)
+    if isinstance(location_visits, pd.DataFrame) and n_jobs > 1:
+        partitions = pd.factorize(location_visits[locationset_id_col])[0] % n_jobs
+        location_visits = [location_visits[partitions == i] for i in range(n_jobs)]
 
-    def cluster_id_to_geom(row):
-        polylist = [locations.loc[c].geometry for c in row]
-        return GeometryCollection(polylist)
+    if not isinstance(location_visits, pd.DataFrame):
+        itemsets, counts, num_txns = _son_itemsets(location_visits, location_id_col, locationset_id_col, min_sup,
+                                                   max_length, max_memory, n_jobs)
+        return _locationsets_gdf([frozenset(itemset) for itemset in itemsets], counts / max(num_txns, 1), locations,
+                                 min_length)
 
-    apriori_df['geometry'] = apriori_df['itemsets'].apply(lambda x: cluster_id_to_geom(x))
+    items, txns, item_ids, num_txns = _encode_transactions(location_visits, location_id_col, locationset_id_col)
+    if len(item_ids) == 0:
+        return _locationsets_gdf([], np.zeros(0), locations, min_length)
 
-    apriori_df = gpd.GeoDataFrame(apriori_df, crs=locations.crs, geometry=apriori_df.geometry)
-    apriori_df.rename(columns={'itemsets': 'location_ids'}, inplace=True)
+    itemsets, counts = _mine_itemsets(items, txns, len(item_ids), num_txns, _min_count(min_sup, num_txns),
+                                      max_length, max_memory)
+    location_ids = [frozenset(item_ids[i] for i in itemset) for itemset in itemsets]
 
-    return apriori_df
+    return _locationsets_gdf(location_ids, counts / num_txns, locations, min_length)
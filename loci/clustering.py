@@ -1,55 +1,524 @@
+import os
+import math
+import struct
+import hashlib
 import pandas as pd
 import geopandas
 
-from pandas import merge
 from time import time
 from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors
 import numpy as np
 from shapely.ops import cascaded_union
 from geopandas import GeoDataFrame
 from hdbscan import HDBSCAN
-from shapely.geometry import MultiPoint
+from hdbscan.plots import CondensedTree, SingleLinkageTree
+try:
+    # Private API of hdbscan (0.8.x), only needed to extract flat clusterings from a cached HDBSCANHierarchy
+    from hdbscan._hdbscan_tree import condense_tree, compute_stability, get_clusters
+except ImportError:
+    condense_tree = compute_stability = get_clusters = None
+from collections import OrderedDict
+from shapely.geometry import MultiPoint, Point, Polygon
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import Delaunay
+from concurrent.futures import ProcessPoolExecutor
+from loci.index import get_spatial_index, _expand_ranges, _num_workers
 
 
-def compute_clusters(pois, alg='dbscan', min_pts=None, eps=None, n_jobs=1):
+# Number of fitted HDBSCAN hierarchies kept in memory
+_HDBSCAN_CACHE_SIZE = 8
+
+# Fitted HDBSCAN hierarchies by key (see `hdbscan_hierarchy`), from the least to the most recently used
+_hdbscan_cache = OrderedDict()
+
+# Number of query points whose neighbor cells are looked up at once by the grid DBSCAN
+_QUERY_BATCH_SIZE = 2**15
+
+# Number of candidate pairs of points whose distance is computed at once by the grid DBSCAN
+_PAIR_BATCH_SIZE = 2**22
+
+# Number of POIs whose circles are unioned in the same task when computing cluster shapes of type 2
+_DISC_BATCH_SIZE = 2**16
+
+# Relative error bound of the orientation of three points computed in floating point (Shewchuk's `ccwerrboundA`)
+_ORIENTATION_ERROR = (3 + 16 * 2.0 ** -53) * 2.0 ** -53
+
+
+def _coordinates(pois):
+    """Returns the coordinates of the POIs as a C-contiguous float64 array of shape (n, 2).
+
+    If the k-d tree of the spatial index of `pois` has already been built, its coordinates are returned instead.
+    """
+
+    sindex = getattr(pois, '_spatial_index', None)
+    if (sindex is not None and sindex._kd_tree is not None and sindex.index is pois.index and
+            sindex.geometry is pois.geometry.values):
+        return sindex._kd_tree.data
+
+    coords = np.empty((len(pois), 2))
+    coords[:, 0] = pois.geometry.x.values
+    coords[:, 1] = pois.geometry.y.values
+
+    return coords
+
+
+def _cell_index(keys, x, y):
+    """Returns the distinct cell keys of points sorted by cell key, the range of the points in each cell, and the
+    bounding box of the points in each cell."""
+
+    cell_keys, starts = np.unique(keys, return_index=True)
+    if len(cell_keys) == 0:
+        return cell_keys, starts, starts, x, y, x, y
+
+    return (cell_keys, starts, np.r_[starts[1:], len(keys)], np.minimum.reduceat(x, starts),
+            np.minimum.reduceat(y, starts), np.maximum.reduceat(x, starts), np.maximum.reduceat(y, starts))
+
+
+def _batches(sizes, batch_size=_PAIR_BATCH_SIZE):
+    """Returns the bounds of consecutive batches of items with about `batch_size` total size."""
+
+    cum_sizes = np.cumsum(sizes)
+    if len(cum_sizes) == 0:
+        return []
+
+    cuts = np.searchsorted(cum_sizes, np.arange(batch_size, cum_sizes[-1], batch_size))
+    cuts = np.unique(np.r_[0, cuts, len(cum_sizes)])
+
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def _pairs_within(qx, qy, qkeys, x, y, cells, offsets, eps, min_count=None):
+    """Yields, in batches, the query points and points (sorted by cell key) within distance `eps`, looking only at the
+    cells at the given key offsets from the cell of each query point.
+
+    The cells whose bounding box lies entirely within (or beyond) eps from a query point are accepted (or rejected)
+    as a whole; the distances to the points are only computed for the rest. If `min_count` is given, the distances
+    are only computed for the query points for which the cells do not decide whether they have at least `min_count`
+    points within eps.
+
+    Yields:
+        The positions of the query points and the indices of the cells within eps from them, and the positions of
+        the query points and of the points of the rest of the pairs within eps.
+    """
+
+    cell_keys, starts, ends, min_x, min_y, max_x, max_y = cells
+    if len(cell_keys) == 0:
+        return
+
+    eps2 = eps * eps
+    for b0 in range(0, len(qkeys), _QUERY_BATCH_SIZE):
+        b1 = min(b0 + _QUERY_BATCH_SIZE, len(qkeys))
+        nb_keys = (qkeys[b0:b1, None] + offsets[None, :]).ravel()
+        nb_cells = np.minimum(np.searchsorted(cell_keys, nb_keys), len(cell_keys) - 1)
+        found = cell_keys[nb_cells] == nb_keys
+        queries = np.repeat(np.arange(b0, b1), len(offsets))[found]
+        nb_cells = nb_cells[found]
+
+        bx = qx[queries]
+        by = qy[queries]
+        near_dx = np.maximum(np.maximum(min_x[nb_cells] - bx, bx - max_x[nb_cells]), 0)
+        near_dy = np.maximum(np.maximum(min_y[nb_cells] - by, by - max_y[nb_cells]), 0)
+        far_dx = np.maximum(bx - min_x[nb_cells], max_x[nb_cells] - bx)
+        far_dy = np.maximum(by - min_y[nb_cells], max_y[nb_cells] - by)
+        full = far_dx ** 2 + far_dy ** 2 <= eps2
+        partial = ~full & (near_dx ** 2 + near_dy ** 2 <= eps2)
+        if min_count is not None:
+            sizes = ends[nb_cells] - starts[nb_cells]
+            lower = np.bincount(queries[full] - b0, weights=sizes[full], minlength=b1 - b0)
+            upper = lower + np.bincount(queries[partial] - b0, weights=sizes[partial], minlength=b1 - b0)
+            undecided = (lower < min_count) & (upper >= min_count)
+            partial &= undecided[queries - b0]
+
+        yield queries[full], nb_cells[full], None, None
+
+        queries = queries[partial]
+        range_starts = starts[nb_cells[partial]]
+        range_ends = ends[nb_cells[partial]]
+        for c0, c1 in _batches(range_ends - range_starts):
+            points = _expand_ranges(range_starts[c0:c1], range_ends[c0:c1])
+            q = np.repeat(queries[c0:c1], range_ends[c0:c1] - range_starts[c0:c1])
+            within = (qx[q] - x[points]) ** 2 + (qy[q] - y[points]) ** 2 <= eps2
+            yield None, None, q[within], points[within]
+
+
+def _core_tile(x, y, keys, own_start, own_end, offsets, eps, min_pts):
+    """Returns whether each of the points `own_start:own_end` of a tile (sorted by cell key, including the halo) is a
+    core point."""
+
+    cells = _cell_index(keys, x, y)
+    sizes = cells[2] - cells[1]
+
+    # All the points of a cell are within eps of each other, so the points of cells with at least min_pts points are
+    # core points
+    dense = np.repeat(sizes >= min_pts, sizes)[own_start:own_end]
+    queries = own_start + np.flatnonzero(~dense)
+
+    counts = np.zeros(len(queries), dtype=np.int64)
+    for q_full, c_full, q, _ in _pairs_within(x[queries], y[queries], keys[queries], x, y, cells, offsets, eps,
+                                              min_count=min_pts):
+        if q_full is not None:
+            counts += np.bincount(q_full, weights=sizes[c_full], minlength=len(queries)).astype(np.int64)
+        else:
+            counts += np.bincount(q, minlength=len(queries))
+
+    core = dense.copy()
+    core[~dense] = counts >= min_pts
+
+    return core
+
+
+def _box_distances(min_x, min_y, max_x, max_y, other_min_x, other_min_y, other_max_x, other_max_y):
+    """Returns the squared minimum and maximum distances between the points of pairs of boxes."""
+
+    near_dx = np.maximum(np.maximum(other_min_x - max_x, min_x - other_max_x), 0)
+    near_dy = np.maximum(np.maximum(other_min_y - max_y, min_y - other_max_y), 0)
+    far_dx = np.maximum(other_max_x - min_x, max_x - other_min_x)
+    far_dy = np.maximum(other_max_y - min_y, max_y - other_min_y)
+
+    return near_dx ** 2 + near_dy ** 2, far_dx ** 2 + far_dy ** 2
+
+
+def _linked_cells(x, y, cells, own_cells, offsets, eps):
+    """Returns the pairs of cells (indices) linked by points within eps, checking the given cells against the cells at
+    the given key offsets from them.
+
+    The pairs of cells are first checked using their bounding boxes, then the remaining pairs using the bounding box
+    of the second cell and each point of the first one, and only the pairs that are still undecided are checked point
+    by point (in batches).
+    """
+
+    cell_keys, starts, ends, min_x, min_y, max_x, max_y = cells
+    if len(cell_keys) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    eps2 = eps * eps
+    nb_keys = (cell_keys[own_cells, None] + offsets[None, :]).ravel()
+    second = np.minimum(np.searchsorted(cell_keys, nb_keys), len(cell_keys) - 1)
+    found = cell_keys[second] == nb_keys
+    first = np.repeat(own_cells, len(offsets))[found]
+    second = second[found]
+
+    near, far = _box_distances(min_x[first], min_y[first], max_x[first], max_y[first], min_x[second], min_y[second],
+                               max_x[second], max_y[second])
+    linked = [np.column_stack([first[far <= eps2], second[far <= eps2]])]
+    undecided = (far > eps2) & (near <= eps2)
+    first = first[undecided]
+    second = second[undecided]
+
+    # Check the points of the first cell of each pair against the bounding box of the second one, and the remaining
+    # points against the points of the second cell, in batches of about _PAIR_BATCH_SIZE pairs
+    for c0, c1 in _batches(ends[first] - starts[first]):
+        pairs = np.repeat(np.arange(c0, c1), ends[first[c0:c1]] - starts[first[c0:c1]])
+        points = _expand_ranges(starts[first[c0:c1]], ends[first[c0:c1]])
+        others = second[pairs]
+        near, far = _box_distances(x[points], y[points], x[points], y[points], min_x[others], min_y[others],
+                                   max_x[others], max_y[others])
+        decided = np.zeros(len(first), dtype=bool)
+        decided[pairs[far <= eps2]] = True
+        candidates = np.flatnonzero((near <= eps2) & ~decided[pairs])
+
+        for d0, d1 in _batches(ends[others[candidates]] - starts[others[candidates]]):
+            batch = candidates[d0:d1]
+            sizes = ends[others[batch]] - starts[others[batch]]
+            others_points = _expand_ranges(starts[others[batch]], ends[others[batch]])
+            p = np.repeat(points[batch], sizes)
+            within = (x[p] - x[others_points]) ** 2 + (y[p] - y[others_points]) ** 2 <= eps2
+            decided[np.repeat(pairs[batch], sizes)[within]] = True
+
+        linked.append(np.column_stack([first[decided], second[decided]]))
+
+    return np.concatenate(linked)
+
+
+def _link_tile(x, y, keys, core, own_start, own_end, offsets, eps):
+    """Links the points `own_start:own_end` of a tile (sorted by cell key, including the halo) to the core points
+    within eps.
+
+    Returns:
+        The pairs of keys of distinct cells linked by core points, and the pairs of non-core points (positions in the
+        tile) and keys of the cells of the core points within eps from them.
+    """
+
+    core_positions = np.flatnonzero(core)
+    core_keys = keys[core_positions]
+    core_x = x[core_positions]
+    core_y = y[core_positions]
+    cells = _cell_index(core_keys, core_x, core_y)
+    num_cells = max(len(cells[0]), 1)
+    point_cells = np.repeat(np.arange(len(cells[0])), cells[2] - cells[1])
+
+    # Each pair of cells is checked from the cell with the lower key only, whether it lies in this tile or another
+    own_cells = np.unique(np.searchsorted(cells[0], keys[own_start + np.flatnonzero(core[own_start:own_end])]))
+    edges = _linked_cells(core_x, core_y, cells, own_cells, offsets[offsets > 0], eps)
+
+    own = own_start + np.flatnonzero(~core[own_start:own_end])
+    borders = []
+    for q_full, c_full, q, p in _pairs_within(x[own], y[own], keys[own], core_x, core_y, cells, offsets, eps):
+        if q_full is not None:
+            borders.append(np.unique(own[q_full] * num_cells + c_full))
+        else:
+            borders.append(np.unique(own[q] * num_cells + point_cells[p]))
+    borders = np.unique(np.concatenate(borders)) if borders else np.zeros(0, dtype=np.int64)
+
+    return (cells[0][edges], np.column_stack([borders // num_cells, cells[0][borders % num_cells]]))
+
+
+def _run_tiles(fn, tasks, n_jobs):
+    """Returns the results of `fn` for the given argument tuples, computed in a pool of `n_jobs` processes."""
+
+    if n_jobs == 1 or len(tasks) == 1:
+        return [fn(*task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(fn, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def _grid_dbscan(coords, eps, min_pts, n_jobs=1):
+    """Computes the DBSCAN labels of the given points over a grid of cells with side `eps / sqrt(2)`.
+
+    The points within eps of a point can only lie in the 5x5 cells around its cell, and all the points of a cell are
+    within eps of each other. The core points are found by counting the neighbors of the points of sparse cells only,
+    and the cells with core points within eps of each other are then linked into clusters (the connected components of
+    the cell graph). Each border point gets the lowest label of the clusters of its neighboring core points, and the
+    clusters are numbered in order of their first core point, as in scikit-learn.
+
+    The grid is partitioned into vertical strips (tiles) with roughly the same number of points, which are processed
+    in a pool of `n_jobs` processes; each tile also reads the points of the 2 columns of cells on either side of it
+    (its halo). The distances are computed in batches, so the memory used does not depend on the size of the
+    neighborhoods.
+    """
+
+    n = len(coords)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    side = eps / math.sqrt(2)
+    cell_x = np.floor((coords[:, 0] - coords[:, 0].min()) / side).astype(np.int64)
+    cell_y = np.floor((coords[:, 1] - coords[:, 1].min()) / side).astype(np.int64)
+
+    # The keys of the cells are padded with 2 cells on each side, so that the keys of neighboring cells do not wrap
+    num_rows = int(cell_y.max()) + 5
+    keys = (cell_x + 2) * num_rows + cell_y + 2
+    offsets = np.array([dx * num_rows + dy for dx in range(-2, 3) for dy in range(-2, 3)], dtype=np.int64)
+
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    cell_x = cell_x[order]
+    x = coords[order, 0]
+    y = coords[order, 1]
+
+    sample = cell_x[::max(n // (1000 * n_jobs), 1)]
+    col_bounds = np.unique(np.quantile(sample, np.linspace(0, 1, n_jobs + 1)[1:-1]).astype(np.int64))
+    col_bounds = np.r_[cell_x[0], col_bounds[col_bounds > cell_x[0]], cell_x[-1] + 1]
+    own_bounds = np.searchsorted(cell_x, col_bounds)
+    halo_starts = np.searchsorted(cell_x, col_bounds[:-1] - 2)
+    halo_ends = np.searchsorted(cell_x, col_bounds[1:] + 2)
+    tiles = list(zip(halo_starts, halo_ends, own_bounds[:-1], own_bounds[1:]))
+
+    core = np.concatenate(_run_tiles(_core_tile, [(x[h0:h1], y[h0:h1], keys[h0:h1], o0 - h0, o1 - h0, offsets, eps,
+                                                   min_pts) for h0, h1, o0, o1 in tiles], n_jobs))
+
+    links = _run_tiles(_link_tile, [(x[h0:h1], y[h0:h1], keys[h0:h1], core[h0:h1], o0 - h0, o1 - h0, offsets, eps)
+                                    for h0, h1, o0, o1 in tiles], n_jobs)
+    edges = np.concatenate([tile_edges for tile_edges, _ in links])
+    borders = np.concatenate([tile_borders + [h0, 0] for (_, tile_borders), (h0, _, _, _) in zip(links, tiles)])
+
+    # Cluster the cells with core points
+    core_positions = np.flatnonzero(core)
+    core_cell_keys = np.unique(keys[core_positions])
+    graph = coo_matrix((np.ones(len(edges)), (np.searchsorted(core_cell_keys, edges[:, 0]),
+                                              np.searchsorted(core_cell_keys, edges[:, 1]))),
+                       shape=(len(core_cell_keys), len(core_cell_keys)))
+    num_clusters, cell_clusters = connected_components(graph, directed=False)
+
+    clusters = cell_clusters[np.searchsorted(core_cell_keys, keys[core_positions])]
+    first = np.full(num_clusters, n)
+    np.minimum.at(first, clusters, order[core_positions])
+    rank = np.empty(num_clusters, dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(num_clusters)
+
+    labels = np.full(n, -1, dtype=np.int64)
+    labels[core_positions] = rank[clusters]
+
+    border_labels = np.full(n, num_clusters)
+    np.minimum.at(border_labels, borders[:, 0], rank[cell_clusters[np.searchsorted(core_cell_keys, borders[:, 1])]])
+    is_border = border_labels < num_clusters
+    labels[is_border] = border_labels[is_border]
+
+    result = np.empty(n, dtype=np.int64)
+    result[order] = labels
+
+    return result
+
+
+class HDBSCANHierarchy(object):
+    """The cluster hierarchy of HDBSCAN over a set of POIs, from which flat clusterings are extracted without refitting.
+
+    The hierarchy (the single linkage tree of the mutual reachability distances) depends only on `min_samples`; the
+    condensed tree for each minimum cluster size, and the clusters selected from it by each method, are computed on
+    first use and kept. Only repeated extractions are near-instant: the first extraction for a minimum cluster size
+    condenses the whole tree again, which is linear in the number of POIs and can take a third of the fitting time
+    (e.g., about 0.5s instead of 1.8s for 50K POIs).
+
+    Extracting clusters by `min_cluster_size` relies on the private module `hdbscan._hdbscan_tree`, which is available
+    in hdbscan 0.8.x; with other versions, an ImportError is raised instead.
+
+    Args:
+        single_linkage_tree (ndarray): The single linkage tree, as in `HDBSCAN.single_linkage_tree_.to_numpy()`.
+        min_samples (integer): The number of neighbors used for the core distances of the POIs.
+    """
+
+    def __init__(self, single_linkage_tree, min_samples):
+        self.single_linkage_tree = single_linkage_tree
+        self.min_samples = min_samples
+        self._condensed = dict()
+        self._flat = dict()
+
+    def condensed_tree(self, min_cluster_size):
+        """Returns the condensed tree (as in `HDBSCAN.condensed_tree_`) and the stability of its clusters for the
+        given minimum cluster size."""
+
+        if condense_tree is None:
+            raise ImportError('Extracting HDBSCAN clusters from a hierarchy requires `hdbscan._hdbscan_tree`, which '
+                              'is not available in the installed version of hdbscan (tested with 0.8.x).')
+
+        if min_cluster_size not in self._condensed:
+            condensed = condense_tree(self.single_linkage_tree, min_cluster_size)
+            self._condensed[min_cluster_size] = (condensed, compute_stability(condensed))
+
+        return self._condensed[min_cluster_size]
+
+    def clusters(self, min_cluster_size=None, cluster_selection_method='eom', eps=None):
+        """Extracts a flat clustering from the hierarchy.
+
+        Args:
+            min_cluster_size (integer): The minimum cluster size (default: `min_samples`).
+            cluster_selection_method (string): The method used to select the clusters of the condensed tree (`eom` or
+                `leaf`; default: `eom`).
+            eps (float): If given, the clusters are instead those of the single linkage tree cut at this (mutual
+                reachability) distance, as in DBSCAN*, ignoring clusters smaller than `min_cluster_size`.
+
+        Returns:
+            The cluster label of each POI (`-1` for noise), and a DataFrame with the `eps` and `cluster_size` of each
+            cluster, as in `compute_clusters`.
+        """
+
+        if min_cluster_size is None:
+            min_cluster_size = self.min_samples
+
+        if eps is not None:
+            labels = SingleLinkageTree(self.single_linkage_tree).get_clusters(eps, min_cluster_size)
+            eps_per_cluster = pd.DataFrame({'eps': [eps] * (labels.max() + 1)})
+            eps_per_cluster['cluster_size'] = np.bincount(labels[labels >= 0], minlength=labels.max() + 1)
+            return labels, eps_per_cluster
+
+        flat = self._flat.get((min_cluster_size, cluster_selection_method))
+        if flat is not None:
+            return flat[0].copy(), flat[1].copy()
+
+        # get_clusters updates the stabilities it is given
+        condensed, stability = self.condensed_tree(min_cluster_size)
+        labels, _, _ = get_clusters(condensed, dict(stability), cluster_selection_method, False)
+
+        tree = CondensedTree(condensed, cluster_selection_method, False)
+        cluster_tree = tree.to_pandas()
+        cluster_tree = cluster_tree[cluster_tree.child_size > 1]
+        chosen_clusters = tree._select_clusters()
+
+        eps_per_cluster = cluster_tree[cluster_tree.child.isin(chosen_clusters)].\
+            drop("parent", axis=1).drop("child", axis=1).reset_index().drop("index", axis=1)
+        eps_per_cluster['lambda_val'] = eps_per_cluster['lambda_val'].apply(lambda x: 1 / x)
+        eps_per_cluster.rename(columns={'lambda_val': 'eps', 'child_size': 'cluster_size'}, inplace=True)
+
+        self._flat[(min_cluster_size, cluster_selection_method)] = (labels.copy(), eps_per_cluster.copy())
+
+        return labels, eps_per_cluster
+
+
+def hdbscan_hierarchy(pois, min_samples, n_jobs=1, cache_dir=None):
+    """Returns the HDBSCAN cluster hierarchy of the given POIs, fitting it only if it is not cached.
+
+    The hierarchies are cached by the coordinates of the POIs and `min_samples`: the most recently used ones are kept
+    in memory and, if `cache_dir` is given, all of them are also saved in (and loaded from) that directory.
+
+    Args:
+         pois (GeoDataFrame): A POI GeoDataFrame.
+         min_samples (integer): The number of neighbors used for the core distances of the POIs.
+         n_jobs (integer): Number of parallel jobs used to compute the core distances (default: 1).
+         cache_dir (string): The directory of the disk cache (default: None, i.e., no disk cache).
+
+    Returns:
+          An HDBSCANHierarchy.
+    """
+
+    data_arr = _coordinates(pois)
+    digest = hashlib.sha1(np.ascontiguousarray(data_arr).tobytes())
+    digest.update(str(min_samples).encode())
+    key = digest.hexdigest()
+
+    hierarchy = _hdbscan_cache.pop(key, None)
+    path = os.path.join(cache_dir, 'hdbscan_%s.npy' % key) if cache_dir is not None else None
+    if hierarchy is None and path is not None and os.path.exists(path):
+        hierarchy = HDBSCANHierarchy(np.load(path), min_samples)
+    if hierarchy is None:
+        clusterer = HDBSCAN(min_cluster_size=max(min_samples, 2), min_samples=min_samples,
+                            core_dist_n_jobs=n_jobs).fit(data_arr)
+        hierarchy = HDBSCANHierarchy(clusterer.single_linkage_tree_.to_numpy(), min_samples)
+    if path is not None and not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path, hierarchy.single_linkage_tree)
+
+    _hdbscan_cache[key] = hierarchy
+    while len(_hdbscan_cache) > _HDBSCAN_CACHE_SIZE:
+        _hdbscan_cache.popitem(last=False)
+
+    return hierarchy
+
+
+def compute_clusters(pois, alg='dbscan', min_pts=None, eps=None, n_jobs=1, inplace=True, cache_dir=None):
     """Computes clusters using the DBSCAN or the HDBSCAN algorithm.
 
+    The `grid_dbscan` algorithm computes the same clusters as `dbscan` over a grid of cells with side `eps / sqrt(2)`,
+    comparing each point only with the points of the 5x5 cells around its cell. The grid is split into strips that are
+    processed in parallel (using `n_jobs` processes), and the distances are computed in batches, so it takes far less
+    memory than `dbscan`, whose memory grows with the total size of the neighborhoods.
+
+    The `hdbscan` hierarchy is cached (see `hdbscan_hierarchy`), so other flat clusterings of the same POIs can be
+    extracted from it without refitting.
+
     Args:
          pois (GeoDataFrame): A POI GeoDataFrame.
-         alg (string): The clustering algorithm to use (dbscan or hdbscan; default: dbscan).
+         alg (string): The clustering algorithm to use (dbscan, grid_dbscan or hdbscan; default: dbscan).
          min_pts (integer): The minimum number of neighbors for a dense point.
          eps (float): The neighborhood radius.
          n_jobs (integer): Number of parallel jobs to run in the algorithm (default: 1)
+         inplace (bool): Whether to add the `cluster_id` column to `pois` itself, or to a (shallow) copy of it
+            (default: True).
+         cache_dir (string): The directory of the disk cache of HDBSCAN hierarchies (default: None).
 
     Returns:
           A GeoDataFrame containing the clustered POIs and their labels. The value of parameter `eps` for each cluster
           is also returned (which varies in the case of HDBSCAN).
     """
 
-    # Prepare list of coordinates
-    poi_list = [[p.x, p.y] for p in pois['geometry']]
-    data_arr = np.array(poi_list)
-    del poi_list[:]
+    data_arr = _coordinates(pois)
 
     # Compute the clusters
     t0 = time()
     if alg == 'hdbscan':
-        clusterer = HDBSCAN(min_cluster_size=min_pts, min_samples=min_pts, core_dist_n_jobs=n_jobs)
-        labels = clusterer.fit_predict(data_arr)
+        hierarchy = hdbscan_hierarchy(pois, min_pts, n_jobs=n_jobs, cache_dir=cache_dir)
+        labels, eps_per_cluster = hierarchy.clusters(min_pts)
         num_of_clusters = len(set(labels))
 
-        tree = clusterer.condensed_tree_.to_pandas()
-        cluster_tree = tree[tree.child_size > 1]
-        chosen_clusters = clusterer.condensed_tree_._select_clusters()
-
-        eps_per_cluster = cluster_tree[cluster_tree.child.isin(chosen_clusters)].\
-            drop("parent", axis=1).drop("child", axis=1).reset_index().drop("index", axis=1)
-        eps_per_cluster['lambda_val'] = eps_per_cluster['lambda_val'].apply(lambda x: 1 / x)
-        eps_per_cluster.rename(columns={'lambda_val': 'eps', 'child_size': 'cluster_size'}, inplace=True)
-
     else:
-        clusterer = DBSCAN(eps=eps, min_samples=min_pts, n_jobs=n_jobs).fit(data_arr)
-        labels = clusterer.labels_
+        if alg == 'grid_dbscan':
+            labels = _grid_dbscan(data_arr, eps, min_pts, _num_workers(n_jobs))
+        else:
+            clusterer = DBSCAN(eps=eps, min_samples=min_pts, n_jobs=n_jobs).fit(data_arr)
+            labels = clusterer.labels_
 
         num_of_clusters = len(set(labels))
         num_of_clusters_no_noise = set(labels)
@@ -62,6 +531,8 @@ def compute_clusters(pois, alg='dbscan', min_pts=None, eps=None, n_jobs=1):
     print("Done in %0.3fs." % (time() - t0))
 
     # Assign cluster labels to initial POIs
+    if not inplace:
+        pois = pois.copy(deep=False)
     pois['cluster_id'] = labels
 
     # Separate POIs that are inside clusters from those that are noise
@@ -75,13 +546,564 @@ def compute_clusters(pois, alg='dbscan', min_pts=None, eps=None, n_jobs=1):
     return pois_in_clusters, eps_per_cluster
 
 
-def cluster_shapes(pois, shape_type=1, eps_per_cluster=None):
+def _graph_dbscan(rows, cols, core):
+    """Returns the DBSCAN labels of the points, given the (symmetric) pairs of points within eps, sorted by their first
+    point, and the core points.
+
+    The clusters are the connected components of the core points, numbered in order of their first core point, and
+    each border point gets the lowest label of the clusters of its neighboring core points, as in scikit-learn.
+    """
+
+    n = len(core)
+    linked = core[rows] & core[cols]
+    indptr = np.r_[0, np.cumsum(np.bincount(rows[linked], minlength=n))]
+    graph = csr_matrix((np.ones(linked.sum()), cols[linked], indptr), shape=(n, n))
+
+    # The graph is symmetric, so its strongly connected components are its connected components (and they are
+    # computed without transposing it)
+    _, components = connected_components(graph, directed=True, connection='strong')
+
+    core_positions = np.flatnonzero(core)
+    clusters, first = np.unique(components[core_positions], return_index=True)
+    rank = np.empty(len(components), dtype=np.int64)
+    rank[clusters[np.argsort(first)]] = np.arange(len(clusters))
+
+    labels = np.full(n, -1, dtype=np.int64)
+    labels[core_positions] = rank[components[core_positions]]
+
+    border = ~core[rows] & core[cols]
+    border_labels = np.full(n, len(clusters))
+    np.minimum.at(border_labels, rows[border], labels[cols[border]])
+    is_border = border_labels < len(clusters)
+    labels[is_border] = border_labels[is_border]
+
+    return labels
+
+
+def dbscan_sweep(pois, eps_values, min_pts_values, n_jobs=1):
+    """Computes the DBSCAN clusters for each combination of the given values of `eps` and `min_pts`.
+
+    The neighbors of all POIs are computed once, as a sparse graph of the distances up to the largest `eps`; the
+    clusters of each combination are then computed from the part of the graph within its `eps` (as the connected
+    components of its core POIs), without any further neighbor search. The labels are the same as those of
+    `compute_clusters`. Note that the graph holds all pairs of POIs within the largest `eps`.
+
+    Args:
+         pois (GeoDataFrame): A POI GeoDataFrame.
+         eps_values (list): The values of the neighborhood radius.
+         min_pts_values (list): The values of the minimum number of neighbors for a dense point.
+         n_jobs (integer): Number of parallel jobs to run in the neighbor search and the clustering (default: 1).
+
+    Returns:
+          A DataFrame with the cluster labels of the POIs (`-1` for noise), with the same index as `pois` and one
+          column per combination, labeled by `(eps, min_pts)`, and a DataFrame with the following columns per
+          combination: `eps`, `min_pts`, `num_clusters` (excluding noise) and `noise_ratio` (the fraction of POIs that
+          are noise).
+    """
+
+    t0 = time()
+
+    if len(pois) == 0:
+        raise ValueError('`pois` must not be empty.')
+
+    eps_values = sorted(set(eps_values))
+    min_pts_values = sorted(set(min_pts_values))
+
+    data_arr = _coordinates(pois)
+    graph = NearestNeighbors(radius=eps_values[-1], n_jobs=n_jobs).fit(data_arr).radius_neighbors_graph(
+        mode='distance', sort_results=True)
+    rows = np.repeat(np.arange(graph.shape[0]), np.diff(graph.indptr))
+
+    labels = dict()
+    stats = []
+    for eps in eps_values:
+        within = graph.data <= eps
+        eps_rows = rows[within]
+        eps_cols = graph.indices[within]
+        num_neighbors = np.bincount(eps_rows, minlength=len(data_arr)) + 1
+
+        for min_pts in min_pts_values:
+            config_labels = _graph_dbscan(eps_rows, eps_cols, num_neighbors >= min_pts)
+            labels[(eps, min_pts)] = config_labels
+            stats.append({'eps': eps, 'min_pts': min_pts, 'num_clusters': config_labels.max() + 1,
+                          'noise_ratio': (config_labels == -1).mean()})
+
+    labels = pd.DataFrame(labels, index=pois.index)
+    stats = pd.DataFrame(stats, columns=['eps', 'min_pts', 'num_clusters', 'noise_ratio'])
+
+    print("Done in %0.3fs." % (time() - t0))
+
+    return labels, stats
+
+
+def _orientations(x, y, a, b, c):
+    """Returns the orientation of each triple of points `a`, `b`, `c` (twice the signed area of the triangle, i.e.,
+    positive if counterclockwise), and whether its sign may be wrong due to rounding errors."""
+
+    left = (x[b] - x[a]) * (y[c] - y[a])
+    right = (y[b] - y[a]) * (x[c] - x[a])
+    bound = _ORIENTATION_ERROR * (np.abs(left) + np.abs(right))
+
+    # Triples with a repeated point are exactly collinear (their products cancel out)
+    return left - right, (np.abs(left - right) <= bound) & (bound > 0) & (c != a) & (c != b)
+
+
+def _prune_chain(x, y, is_first, is_last, sign):
+    """Returns the points of the lower (`sign` 1) or upper (`sign` -1) monotone chain of each group of points sorted by
+    group, x and y, where `is_first` and `is_last` mark the first and last point of each group, and the points whose
+    removal or not depended on an orientation with an uncertain sign (see `_orientations`).
+
+    All points that do not make a strict turn with their neighbors in the chain are removed at once, repeatedly, and
+    only the neighbors of removed points are checked again.
+    """
+
+    prv = np.arange(-1, len(x) - 1)
+    nxt = np.arange(1, len(x) + 1)
+    alive = np.ones(len(x), dtype=bool)
+    uncertain = np.zeros(len(x), dtype=bool)
+    active = np.flatnonzero(~is_first & ~is_last)
+    while len(active):
+        a = prv[active]
+        b = nxt[active]
+        cross, unsure = _orientations(x, y, a, b, active)
+        uncertain[active[unsure]] = True
+        removed = sign * cross >= 0
+        if not removed.any():
+            break
+        alive[active[removed]] = False
+
+        # Link the surviving neighbors of the removed points, skipping over runs of removed points
+        active = np.unique(np.concatenate([a[removed], b[removed]]))
+        active = active[alive[active]]
+        for links, is_outer in ((nxt, is_last), (prv, is_first)):
+            pending = active[~is_outer[active]]
+            while len(pending):
+                dead = ~alive[links[pending]]
+                pending = pending[dead]
+                links[pending] = links[links[pending]]
+        active = active[~is_first[active] & ~is_last[active]]
+
+    return alive, uncertain
+
+
+def _convex_hulls(groups, x, y):
+    """Computes the convex hull of each group of points, as `MultiPoint(points).convex_hull`.
+
+    The points are sorted by group once, and the hulls of all groups are computed together with Andrew's monotone
+    chain algorithm, after discarding the points inside the quadrilateral of the extreme points of each group. The
+    hulls of the groups where the sign of an orientation is uncertain due to rounding errors (i.e., almost collinear
+    points) are computed by GEOS instead, which uses exact orientations.
+
+    Args:
+        groups (ndarray): The group of each point (integers from 0 to the number of groups - 1, each one present).
+        x (ndarray): The x coordinates of the points.
+        y (ndarray): The y coordinates of the points.
+
+    Returns:
+        A GeometryArray with the hull of each group: a polygon, or a line string or a point for degenerate groups.
+    """
+
+    if len(groups) == 0:
+        return geopandas.GeoSeries.from_wkb([]).values
+
+    # Sort by group, x and y, keeping the first occurrence of duplicate points
+    order = np.argsort(y, kind='stable')
+    order = order[np.argsort(x[order], kind='stable')]
+    order = order[np.argsort(groups[order], kind='stable')]
+    all_order, all_x, all_y = order, x, y
+    g, x, y = groups[order], x[order], y[order]
+    distinct = np.ones(len(g), dtype=bool)
+    distinct[1:] = (g[1:] != g[:-1]) | (x[1:] != x[:-1]) | (y[1:] != y[:-1])
+    order, g, x, y = order[distinct], g[distinct], x[distinct], y[distinct]
+    starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    ends = np.r_[starts[1:], len(g)]
+
+    # Discard the points strictly inside the quadrilateral of the leftmost, lowest, rightmost and topmost points
+    bottom = np.flatnonzero(y == np.minimum.reduceat(y, starts)[g])
+    bottom = bottom[np.r_[True, g[bottom[1:]] != g[bottom[:-1]]]]
+    top = np.flatnonzero(y == np.maximum.reduceat(y, starts)[g])
+    top = top[np.r_[True, g[top[1:]] != g[top[:-1]]]]
+    quad = np.column_stack([starts, bottom, ends - 1, top])[g]
+    inside = np.ones(len(g), dtype=bool)
+    uncertain = np.zeros(len(starts), dtype=bool)
+    for i in range(4):
+        cross, unsure = _orientations(x, y, quad[:, i], quad[:, (i + 1) % 4], np.arange(len(g)))
+        inside &= cross > 0
+        uncertain[g[unsure]] = True
+    order, g, x, y = order[~inside], g[~inside], x[~inside], y[~inside]
+    starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    ends = np.r_[starts[1:], len(g)]
+
+    is_first = np.zeros(len(g), dtype=bool)
+    is_first[starts] = True
+    is_last = np.zeros(len(g), dtype=bool)
+    is_last[ends - 1] = True
+    lower, lower_uncertain = _prune_chain(x, y, is_first, is_last, 1)
+    upper, upper_uncertain = _prune_chain(x, y, is_first, is_last, -1)
+    uncertain[g[lower_uncertain | upper_uncertain]] = True
+
+    # Clockwise rings: the upper chain from left to right, then the lower chain from right to left
+    in_lower = np.flatnonzero(lower & ~is_first & ~is_last)
+    in_upper = np.flatnonzero(upper)
+    vertices = np.concatenate([in_upper, in_lower])
+    vertices = vertices[np.lexsort((np.r_[in_upper, -in_lower], np.r_[np.zeros(len(in_upper)), np.ones(len(in_lower))],
+                                    g[vertices]))]
+    sizes = np.bincount(g[vertices], minlength=len(starts))
+
+    wkb = [None] * len(starts)
+
+    # Rings with at least 3 vertices, starting (and ending) at their lowest vertex (then leftmost), as in GEOS
+    rings = np.flatnonzero(sizes >= 3)
+    ring_sizes = sizes[rings]
+    kept = np.repeat(sizes >= 3, sizes)
+    vertices, ring_g = vertices[kept], g[vertices[kept]]
+    ring_starts = np.cumsum(ring_sizes) - ring_sizes
+    lowest = np.lexsort((x[vertices], y[vertices], ring_g))[ring_starts] - ring_starts
+    steps = np.arange(ring_sizes.sum() + len(rings)) - np.repeat(ring_starts + np.arange(len(rings)), ring_sizes + 1)
+    closed = vertices[np.repeat(ring_starts, ring_sizes + 1) +
+                      (steps + np.repeat(lowest, ring_sizes + 1)) % np.repeat(ring_sizes, ring_sizes + 1)]
+    for i, data in zip(rings, _ring_wkb(np.column_stack([x[closed], y[closed]]), ring_sizes + 1)):
+        wkb[i] = data
+
+    # Single points, and segments between the extreme points of collinear groups; segments of two points keep their
+    # original order, longer ones start at their lowest (then leftmost) point, as in GEOS
+    for i in np.flatnonzero(sizes < 3):
+        first, last = starts[i], ends[i] - 1
+        if first == last:
+            wkb[i] = struct.pack('<BI2d', 1, 1, x[first], y[first])
+        else:
+            if (order[last] < order[first]) if last - first == 1 else ((y[last], x[last]) < (y[first], x[first])):
+                first, last = last, first
+            wkb[i] = struct.pack('<BII4d', 1, 2, 2, x[first], y[first], x[last], y[last])
+
+    # The points of each uncertain group in their original order
+    all_starts = np.searchsorted(groups[all_order], np.flatnonzero(uncertain))
+    all_ends = np.searchsorted(groups[all_order], np.flatnonzero(uncertain), side='right')
+    for i, start, end in zip(np.flatnonzero(uncertain), all_starts, all_ends):
+        points = np.sort(all_order[start:end])
+        wkb[i] = MultiPoint(np.column_stack([all_x[points], all_y[points]])).convex_hull.wkb
+
+    return geopandas.GeoSeries.from_wkb(wkb).values
+
+
+def _ring_wkb(coords, sizes):
+    """Returns the WKB of polygons with a single ring, given as the consecutive rows of `coords` with the given number
+    of rows per polygon."""
+
+    # Little endian WKB polygon with a single ring
+    headers = np.empty(len(sizes), dtype=[('byte_order', 'u1'), ('type', '<u4'), ('num_rings', '<u4'),
+                                          ('num_points', '<u4')])
+    headers['byte_order'] = 1
+    headers['type'] = 3
+    headers['num_rings'] = 1
+    headers['num_points'] = sizes
+
+    size = headers.dtype.itemsize
+    headers = headers.tobytes()
+    data = np.ascontiguousarray(coords, dtype='<f8').tobytes()
+    offsets = (np.r_[0, np.cumsum(sizes)] * 16).tolist()
+
+    return [headers[i * size:(i + 1) * size] + data[offsets[i]:offsets[i + 1]] for i in range(len(sizes))]
+
+
+def _separated_delaunay(codes, x, y, gap):
+    """Returns the Delaunay triangulation of the points of all groups, moved apart on a square grid so that there is at
+    least `gap` between the bounding boxes of the groups (or None if all points are collinear), and the moved points.
+    """
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    min_x, min_y = np.minimum.reduceat(x, starts), np.minimum.reduceat(y, starts)
+    span = gap + max((np.maximum.reduceat(x, starts) - min_x).max(), (np.maximum.reduceat(y, starts) - min_y).max())
+    columns = int(math.ceil(math.sqrt(len(starts))))
+    groups = np.arange(len(starts))
+    points = np.column_stack([x + ((groups % columns) * span - min_x)[codes],
+                              y + ((groups // columns) * span - min_y)[codes]])
+    if len(points) < 3:
+        return None, points
+
+    try:
+        return Delaunay(points), points
+    except RuntimeError:
+        # All the points are collinear (QhullError)
+        return None, points
+
+
+def _buffer_unions(codes, x, y, eps, resolution, groups):
+    """Returns the WKB of the union of the polygons returned by `buffer(eps, resolution)` for the points of each of the
+    given groups."""
+
+    wkb = []
+    starts = np.searchsorted(codes, groups)
+    ends = np.searchsorted(codes, groups, side='right')
+    for group, start, end in zip(groups, starts, ends):
+        discs = geopandas.GeoSeries(geopandas.points_from_xy(x[start:end], y[start:end]))
+        wkb.append(discs.buffer(eps[group], resolution=resolution).unary_union.wkb)
+
+    return wkb
+
+
+def _disc_unions(codes, x, y, eps, resolution, tolerance):
+    """Computes the union of the circles of radius `eps` around the points of each group, as approximated by the union
+    of the polygons returned by `buffer(eps, resolution)` for the points.
+
+    Instead of unioning polygons, the boundary of the union is traced directly: it consists of the arcs of the circles
+    that lie in the Voronoi cells of their centers, which meet at the intersections of the circles of neighboring points
+    on the edges of the cells. The arcs are approximated with vertices at the same angles as those of `buffer`, so the
+    result only differs from the union of the polygons near these intersections, by less than the distance between the
+    polygons and their circles. Groups whose boundary cannot be traced consistently (e.g., due to rounding errors in
+    degenerate configurations) are computed by unioning the polygons.
+
+    If `tolerance` is positive, only one point is kept in each cell of a grid with diagonal `tolerance`, which reduces
+    the number of points of dense groups at the cost of moving the boundary by up to `tolerance`.
+
+    Args:
+        codes (ndarray): The group of each point (sorted integers from 0 to the number of groups - 1, all present).
+        x (ndarray): The x coordinates of the points.
+        y (ndarray): The y coordinates of the points.
+        eps (ndarray): The radius of the circles of each group.
+        resolution (integer): The number of segments used to approximate a quarter circle.
+        tolerance (float): The distance by which the points may be moved.
+
+    Returns:
+        A list with the WKB of the union of each group.
+    """
+
+    step = math.pi / (2 * resolution)
+
+    # Keep one of the points in each cell of the grid, or of the duplicate points
+    if tolerance > 0:
+        side = tolerance / math.sqrt(2)
+        keys_x, keys_y = np.floor(x / side), np.floor(y / side)
+    else:
+        keys_x, keys_y = x, y
+    order = np.lexsort((keys_y, keys_x, codes))
+    codes, x, y, keys_x, keys_y = codes[order], x[order], y[order], keys_x[order], keys_y[order]
+    distinct = np.r_[True, (codes[1:] != codes[:-1]) | (keys_x[1:] != keys_x[:-1]) | (keys_y[1:] != keys_y[:-1])]
+    codes, x, y = codes[distinct], x[distinct], y[distinct]
+
+    # The groups are moved apart by more than twice their radius, so that the points of other groups do not affect the
+    # parts of the Voronoi cells within the circles
+    triangulation, points = _separated_delaunay(codes, x, y, 4 * eps.max())
+    if triangulation is None:
+        return _buffer_unions(codes, x, y, eps, resolution, np.arange(len(eps)))
+    px, py = points[:, 0], points[:, 1]
+    radius = eps[codes]
+
+    # Circumcenters of the triangles, i.e., the vertices of the Voronoi cells
+    simplices = triangulation.simplices
+    bx, by = px[simplices[:, 1]] - px[simplices[:, 0]], py[simplices[:, 1]] - py[simplices[:, 0]]
+    cx, cy = px[simplices[:, 2]] - px[simplices[:, 0]], py[simplices[:, 2]] - py[simplices[:, 0]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d = 2 * (bx * cy - by * cx)
+        center_x = px[simplices[:, 0]] + (cy * (bx ** 2 + by ** 2) - by * (cx ** 2 + cy ** 2)) / d
+        center_y = py[simplices[:, 0]] + (bx * (cx ** 2 + cy ** 2) - cx * (bx ** 2 + by ** 2)) / d
+
+    # The edges of the triangulation (each one once), with the triangle on each side (-1 outside the convex hull)
+    triangles = np.repeat(np.arange(len(simplices)), 3)
+    vertices = np.tile(np.arange(3), len(simplices))
+    others = triangulation.neighbors.ravel()
+    once = (others > triangles) | (others < 0)
+    triangles, vertices, others = triangles[once], vertices[once], others[once]
+    a = simplices[triangles, (vertices + 1) % 3]
+    b = simplices[triangles, (vertices + 2) % 3]
+    opposite = simplices[triangles, vertices]
+
+    # The intersections of the circles of neighboring points that lie on the dual edge of the Voronoi diagram, at
+    # signed distance +h or -h from the middle of the points (along the left normal of a -> b); at +h the boundary
+    # (traversed counterclockwise) passes from the circle of b to the circle of a, and at -h the other way around
+    lengths = np.hypot(px[b] - px[a], py[b] - py[a])
+    close = np.flatnonzero((codes[a] == codes[b]) & (lengths < 2 * radius[a]))
+    a, b, triangles, others, opposite, lengths = a[close], b[close], triangles[close], others[close], opposite[close], \
+        lengths[close]
+    h = np.sqrt(radius[a] ** 2 - (lengths / 2) ** 2)
+    nx, ny = (py[a] - py[b]) / lengths, (px[b] - px[a]) / lengths
+    mx, my = (px[a] + px[b]) / 2, (py[a] + py[b]) / 2
+    first = (center_x[triangles] - mx) * nx + (center_y[triangles] - my) * ny
+    outward = np.where((px[opposite] - mx) * nx + (py[opposite] - my) * ny > 0, -np.inf, np.inf)
+    second = np.where(others >= 0, (center_x[others] - mx) * nx + (center_y[others] - my) * ny, outward)
+    low, high = np.minimum(first, second), np.maximum(first, second)
+    plus = np.flatnonzero((low <= h) & (h <= high))
+    minus = np.flatnonzero((low <= -h) & (-h <= high))
+    signs = np.r_[np.ones(len(plus)), -np.ones(len(minus))]
+    edges = np.r_[plus, minus]
+    corner_x = mx[edges] + signs * h[edges] * nx[edges]
+    corner_y = my[edges] + signs * h[edges] * ny[edges]
+    enters = np.where(signs > 0, a[edges], b[edges])
+    exits = np.where(signs > 0, b[edges], a[edges])
+
+    # The arcs of each circle, from each corner where the boundary enters it to the next one counterclockwise, where
+    # the boundary must exit it
+    num_corners = len(edges)
+    owners = np.r_[enters, exits]
+    angles = np.arctan2(np.r_[corner_y, corner_y] - py[owners], np.r_[corner_x, corner_x] - px[owners])
+    order = np.lexsort((angles, owners))
+    owners, angles, events = owners[order], angles[order], order
+    owner_starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) if len(owners) > 0 else owners
+    owner_ends = np.r_[owner_starts[1:], len(owners)]
+    following = np.arange(1, len(owners) + 1)
+    following[owner_ends - 1] = owner_starts
+    is_enter = events < num_corners
+    arcs = np.flatnonzero(is_enter)
+    consistent = np.ones(len(eps), dtype=bool)
+    consistent[codes[owners[is_enter == is_enter[following]]]] = False
+
+    # Points without corners: their circle lies either in their cell (so it is part of the boundary) or outside it, in
+    # which case it is covered by the circles of others. Testing a single point of the circle is enough, and only
+    # against the neighbors of its center: if the point is outside the cell, the segment from the center to it crosses
+    # an edge of the cell, beyond which the point is closer to the neighbor across that edge than to the center
+    neighbors = simplices[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    lonely = np.ones(len(x), dtype=bool)
+    lonely[owners] = False
+    test_x = px + radius
+    for p, q in (neighbors.T, neighbors[:, ::-1].T):
+        inside = np.hypot(test_x[p] - px[q], py[p] - py[q]) < radius[p]
+        lonely[p[inside]] = False
+
+    arcs = arcs[consistent[codes[owners[arcs]]]]
+    lonely &= consistent[codes]
+
+    # Link each arc to the arc starting where it ends, and order the arcs of each ring (starting with the smallest)
+    starts, ends = events[arcs], events[following[arcs]] - num_corners
+    arc_by_corner = np.zeros(num_corners, dtype=np.int64)
+    arc_by_corner[starts] = np.arange(len(arcs))
+    successors = arc_by_corner[ends]
+    rings = np.zeros(0, dtype=np.int64)
+    if len(arcs) > 0:
+        _, rings = connected_components(csr_matrix((np.ones(len(arcs)), (np.arange(len(arcs)), successors)),
+                                                   shape=(len(arcs), len(arcs))), directed=False)
+    heads = np.full(rings.max() + 1 if len(rings) > 0 else 0, len(arcs))
+    np.minimum.at(heads, rings, np.arange(len(arcs)))
+    remaining = np.where(successors == heads[rings], -1, successors)
+    distances = (remaining >= 0).astype(np.int64)
+    pending = np.flatnonzero(remaining >= 0)
+    while len(pending):
+        distances[pending] += distances[remaining[pending]]
+        remaining[pending] = remaining[remaining[pending]]
+        pending = pending[remaining[pending] >= 0]
+    arc_order = np.lexsort((-distances, rings))
+
+    # The vertices of the arcs: the corner where they start, and the vertices of `buffer` strictly before their end
+    ring_ids = rings[arc_order]
+    centers = owners[arcs][arc_order]
+    start_angles = angles[arcs][arc_order]
+    end_angles = angles[following[arcs]][arc_order]
+    end_angles = np.where(end_angles <= start_angles, end_angles + 2 * math.pi, end_angles)
+    first_steps = np.floor(start_angles / step).astype(np.int64) + 1
+    num_steps = np.maximum(np.ceil(end_angles / step).astype(np.int64) - first_steps, 0)
+    arc_sizes = 1 + num_steps
+    arc_ring_starts = np.flatnonzero(np.r_[True, ring_ids[1:] != ring_ids[:-1]]) if len(arcs) > 0 else arcs
+
+    # The points without corners give rings with all the vertices of `buffer`
+    lonely = np.flatnonzero(lonely)
+    ring_codes = np.r_[codes[centers[arc_ring_starts]], codes[lonely]]
+    ring_sizes = np.r_[np.add.reduceat(arc_sizes, arc_ring_starts) if len(arcs) > 0 else arcs,
+                       np.full(len(lonely), 4 * resolution)]
+
+    vertex_centers = np.r_[np.repeat(centers, arc_sizes), np.repeat(lonely, 4 * resolution)]
+    vertex_steps = np.r_[_expand_ranges(first_steps - 1, first_steps + num_steps),
+                         np.tile(np.arange(4 * resolution), len(lonely))]
+    vertex_x = radius[vertex_centers] * np.cos(vertex_steps * step)
+    vertex_y = radius[vertex_centers] * np.sin(vertex_steps * step)
+    arc_starts = np.cumsum(arc_sizes) - arc_sizes
+    corners = events[arcs][arc_order]
+    vertex_x[arc_starts] = corner_x[corners] - px[centers]
+    vertex_y[arc_starts] = corner_y[corners] - py[centers]
+    vertex_x += x[vertex_centers]
+    vertex_y += y[vertex_centers]
+
+    wkb = _rings_wkb(ring_codes, ring_sizes, vertex_x, vertex_y, len(eps))
+    inconsistent = np.flatnonzero(~consistent)
+    for group, data in zip(inconsistent, _buffer_unions(codes, x, y, eps, resolution, inconsistent)):
+        wkb[group] = data
+
+    return wkb
+
+
+def _rings_wkb(ring_codes, ring_sizes, x, y, num_groups):
+    """Returns the WKB of the polygon or multipolygon of each group, given the vertices of its rings (not closed),
+    counterclockwise for outer rings and clockwise for holes.
+
+    The rings are reversed, i.e., outer rings are clockwise and holes counterclockwise, as in the output of GEOS.
+    """
+
+    ring_starts = np.cumsum(ring_sizes) - ring_sizes
+
+    # Signed areas (relative to the first vertex of each ring)
+    rel_x = x - np.repeat(x[ring_starts], ring_sizes)
+    rel_y = y - np.repeat(y[ring_starts], ring_sizes)
+    following = np.arange(1, len(x) + 1)
+    following[ring_starts + ring_sizes - 1] = ring_starts
+    areas = np.add.reduceat(rel_x * rel_y[following] - rel_x[following] * rel_y, ring_starts) / 2 \
+        if len(x) > 0 else np.zeros(0)
+
+    # Closed and reversed rings
+    closed_sizes = ring_sizes + 1
+    closed_starts = np.cumsum(closed_sizes) - closed_sizes
+    offsets = np.arange(closed_sizes.sum()) - np.repeat(closed_starts, closed_sizes)
+    positions = np.repeat(ring_starts + ring_sizes, closed_sizes) - offsets
+    positions[closed_starts] = ring_starts
+    data = np.column_stack([x[positions], y[positions]]).astype('<f8').tobytes()
+
+    # Each hole belongs to the smallest outer ring of its group that contains it; only the outer rings whose bounding
+    # box contains the first vertex of the hole are tested, and only if there are several of them
+    shells = np.flatnonzero(areas > 0)
+    shells = shells[np.argsort(ring_codes[shells], kind='stable')]
+    holes = np.flatnonzero(areas < 0)
+    shell_codes = ring_codes[shells]
+    first = np.searchsorted(shell_codes, ring_codes[holes], side='left')
+    last = np.searchsorted(shell_codes, ring_codes[holes], side='right')
+    pair_holes = np.repeat(holes, last - first)
+    pair_shells = shells[_expand_ranges(first, last)]
+    if len(x) > 0:
+        min_x, max_x = np.minimum.reduceat(x, ring_starts), np.maximum.reduceat(x, ring_starts)
+        min_y, max_y = np.minimum.reduceat(y, ring_starts), np.maximum.reduceat(y, ring_starts)
+        hole_x, hole_y = x[ring_starts[pair_holes]], y[ring_starts[pair_holes]]
+        inside = ((min_x[pair_shells] <= hole_x) & (hole_x <= max_x[pair_shells]) &
+                  (min_y[pair_shells] <= hole_y) & (hole_y <= max_y[pair_shells]))
+        pair_holes, pair_shells = pair_holes[inside], pair_shells[inside]
+    ambiguous = np.flatnonzero(np.bincount(pair_holes, minlength=len(areas))[pair_holes] > 1)
+    if len(ambiguous) > 0:
+        coords = np.column_stack([x, y])
+        inside = np.ones(len(pair_holes), dtype=bool)
+        inside[ambiguous] = [Polygon(coords[ring_starts[shell]:ring_starts[shell] + ring_sizes[shell]]).contains(
+            Point(x[ring_starts[hole]], y[ring_starts[hole]]))
+            for hole, shell in zip(pair_holes[ambiguous], pair_shells[ambiguous])]
+        pair_holes, pair_shells = pair_holes[inside], pair_shells[inside]
+    order = np.argsort(areas[pair_shells], kind='stable')
+    order = order[np.argsort(pair_holes[order], kind='stable')]
+    pair_holes, pair_shells = pair_holes[order], pair_shells[order]
+    smallest = np.r_[True, pair_holes[1:] != pair_holes[:-1]] if len(pair_holes) > 0 else np.zeros(0, dtype=bool)
+
+    polygons = [[] for _ in range(num_groups)]
+    rings = {}
+    for ring in shells:
+        rings[ring] = [ring]
+        polygons[ring_codes[ring]].append(rings[ring])
+    for hole, shell in zip(pair_holes[smallest], pair_shells[smallest]):
+        rings[shell].append(hole)
+
+    def polygon_wkb(rings):
+        return b''.join([struct.pack('<BII', 1, 3, len(rings))] + [
+            struct.pack('<I', closed_sizes[ring]) +
+            data[16 * closed_starts[ring]:16 * (closed_starts[ring] + closed_sizes[ring])] for ring in rings])
+
+    return [polygon_wkb(group_polygons[0]) if len(group_polygons) == 1 else
+            struct.pack('<BII', 1, 6, len(group_polygons)) + b''.join(map(polygon_wkb, group_polygons))
+            for group_polygons in polygons]
+
+
+def cluster_shapes(pois, shape_type=1, eps_per_cluster=None, resolution=16, tolerance=0, n_jobs=1):
     """Computes cluster shapes.
 
     Args:
          pois (GeoDataFrame): The clustered POIs.
          shape_type (integer): The methods to use for computing cluster shapes (allowed values: 1-3).
          eps_per_cluster (DataFrame): The value of parameter eps used for each cluster (required by methods 2 and 3).
+         resolution (integer): The number of segments used to approximate a quarter of the circles of method 2
+            (default: 16, as in `buffer`).
+         tolerance (float): The distance by which the shapes of method 2 may deviate from the union of the circles;
+            only one POI is kept per grid cell with diagonal `tolerance` (default: 0, i.e., all POIs are kept).
+         n_jobs (integer): The number of processes used by method 2 (-1 means one per CPU; default: 1).
 
     Returns:
           A GeoDataFrame containing the cluster shapes.
@@ -90,55 +1112,67 @@ def cluster_shapes(pois, shape_type=1, eps_per_cluster=None):
     t0 = time()
 
     if shape_type == 2:
-        cluster_borders = pois.groupby(['cluster_id'], sort=False)['geometry'].agg([list, np.size])
-        join_df = merge(cluster_borders, eps_per_cluster, left_index=True, right_index=True, how='inner')
-        cluster_list = []
-        for index, row in join_df.iterrows():
-            eps = row['eps']
-            cluster_i = []
-            for p in row['list']:
-                cluster_i.append(p.buffer(eps))
-
-            cluster_list.append(cascaded_union(cluster_i))
+        # The clusters in order of appearance, except those without eps (and noise, if its eps is not given)
+        codes, cluster_ids = pd.factorize(pois['cluster_id'])
+        eps = eps_per_cluster['eps'].reindex(cluster_ids).values.astype(float)
+        kept = ~np.isnan(eps)
+        positions = np.flatnonzero((codes >= 0) & kept[np.maximum(codes, 0)])
+        codes = (np.cumsum(kept) - 1)[codes[positions]]
+        cluster_ids, eps = cluster_ids[kept], eps[kept]
+        order = np.argsort(codes, kind='stable')
+        coords = _coordinates(pois)[positions[order]]
+        codes = codes[order]
 
-        join_df['geometry'] = cluster_list
-        join_df['cluster_id'] = join_df.index
-        join_df.reset_index(drop=True, inplace=True)
-        join_df.drop(['list', 'cluster_size'], axis=1, inplace=True)
+        sizes = np.bincount(codes, minlength=len(cluster_ids))
+        bounds = np.r_[0, np.cumsum(sizes)]
+        tasks = [(codes[bounds[c0]:bounds[c1]] - c0, coords[bounds[c0]:bounds[c1], 0],
+                  coords[bounds[c0]:bounds[c1], 1], eps[c0:c1], resolution, tolerance)
+                 for c0, c1 in _batches(sizes, _DISC_BATCH_SIZE)]
+        shapes = geopandas.GeoSeries.from_wkb([shape for batch in _run_tiles(_disc_unions, tasks, _num_workers(n_jobs))
+                                               for shape in batch]).values
 
-        cluster_borders = GeoDataFrame(join_df, crs=pois.crs, geometry='geometry')
-        cluster_borders = cluster_borders[['cluster_id', 'size', 'geometry']]
+        cluster_borders = GeoDataFrame({'cluster_id': cluster_ids, 'size': sizes, 'geometry': shapes}, crs=pois.crs,
+                                       geometry='geometry')
 
     elif shape_type == 3:
-        eps_dict = dict()
-        for index, row in eps_per_cluster.iterrows():
-            eps_dict[index] = row['eps']
-
-        circles_from_pois = pois.copy()
-        cid_size_dict = dict()
-        circles = []
-        for index, row in circles_from_pois.iterrows():
-            cid = row['cluster_id']
-            circles.append(row['geometry'].buffer(eps_dict[cid]))
-            cid_size_dict[cid] = cid_size_dict.get(cid, 0) + 1
+        cluster_ids = pois['cluster_id'].values
+        eps = eps_per_cluster['eps'].reindex(cluster_ids).values
+        x = pois.geometry.x.values
+        y = pois.geometry.y.values
+        cid_size_dict = pois.groupby('cluster_id', sort=False).size().to_dict()
 
-        circles_from_pois['geometry'] = circles
+        # Find the POIs within the circle of radius eps around each POI (using the eps of the cluster of the latter).
+        # The circles are the polygons returned by `buffer`, so POIs closer than the apothem of the polygon are
+        # certainly inside it, while the rest are checked against the polygon itself.
+        neighbors = get_spatial_index(pois).within_distance(x, y, eps)
+        circles = np.repeat(np.arange(len(pois)), [len(positions) for positions in neighbors])
+        members = np.concatenate(neighbors) if len(neighbors) > 0 else np.zeros(0, dtype=np.int64)
 
-        s_index = pois.sindex
+        distances = np.hypot(x[members] - x[circles], y[members] - y[circles])
+        border = np.flatnonzero(distances > eps[circles] * math.cos(math.pi / 64))
+        if len(border) > 0:
+            circle_polys = geopandas.GeoSeries(pois.geometry.values[circles[border]]).buffer(eps[circles[border]])
+            inside = circle_polys.intersects(geopandas.GeoSeries(pois.geometry.values[members[border]])).values
+            keep = np.ones(len(members), dtype=bool)
+            keep[border[~inside]] = False
+            circles = circles[keep]
+            members = members[keep]
 
-        pois_in_circles = geopandas.sjoin(pois, circles_from_pois, how="inner", op='intersects')
-        agged_pois_per_circle = pois_in_circles.groupby(['cluster_id_left', 'index_right'],
-                                                        sort=False)['geometry'].agg([list])
+        # Group the POIs in each circle by cluster, and compute the convex hull of each group of at least 3 POIs
+        order = np.lexsort((members, cluster_ids[members], circles))
+        circles = circles[order]
+        members = members[order]
+        group_starts = np.flatnonzero(np.r_[True, (circles[1:] != circles[:-1]) |
+                                            (cluster_ids[members[1:]] != cluster_ids[members[:-1]])])
+        group_ends = np.r_[group_starts[1:], len(members)]
 
         poly_list = []
         cluster_id_list = []
-        for index, row in agged_pois_per_circle.iterrows():
-            pois_in_circle = row['list']
-            lsize = len(pois_in_circle)
-            if lsize >= 3:
-                poly = MultiPoint(pois_in_circle).convex_hull
-                poly_list.append(poly)
-                cluster_id_list.append(index[0])
+        for start, end in zip(group_starts, group_ends):
+            if end - start >= 3:
+                group = members[start:end]
+                poly_list.append(MultiPoint(np.column_stack([x[group], y[group]])).convex_hull)
+                cluster_id_list.append(cluster_ids[group[0]])
 
         temp_df = pd.DataFrame({
             'cluster_id': cluster_id_list,
@@ -162,12 +1196,12 @@ def cluster_shapes(pois, shape_type=1, eps_per_cluster=None):
 
     # type == 1 (default)
     else:
-        cluster_borders = pois.groupby(['cluster_id'], sort=False)['geometry'].agg([list, np.size])
-        cluster_borders['list'] = [MultiPoint(l).convex_hull for l in cluster_borders['list']]
-        cluster_borders.rename(columns={"list": "geometry"}, inplace=True)
-        cluster_borders.sort_index(inplace=True)
-        cluster_borders = GeoDataFrame(cluster_borders, crs=pois.crs, geometry='geometry')
-        cluster_borders.reset_index(inplace=True)
+        codes, cluster_ids = pd.factorize(pois['cluster_id'], sort=True)
+        coords = _coordinates(pois)
+        cluster_borders = GeoDataFrame({'cluster_id': cluster_ids,
+                                        'geometry': _convex_hulls(codes, coords[:, 0], coords[:, 1]),
+                                        'size': np.bincount(codes, minlength=len(cluster_ids))},
+                                       crs=pois.crs, geometry='geometry')
 
     print("Done in %0.3fs." % (time() - t0))
 
@@ -0,0 +1,134 @@
+import math
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from scipy.signal import fftconvolve
+from scipy.stats import zscore
+from time import time
+from loci.index import _grid_params, _cell_boxes
+
+
+def _kernel_weights(kernel, bandwidth, cell_width, cell_height):
+    """Returns the weights of the given kernel at the centers of the cells around (and including) the origin cell.
+
+    Gaussian kernels are truncated at 4 bandwidths; all other kernels have a support of 1 bandwidth.
+    """
+
+    support = 4 * bandwidth if kernel == 'gaussian' else bandwidth
+    radius_x = int(math.ceil(support / cell_width))
+    radius_y = int(math.ceil(support / cell_height))
+
+    dx = np.arange(-radius_x, radius_x + 1) * cell_width
+    dy = np.arange(-radius_y, radius_y + 1) * cell_height
+    u2 = (dx[:, None] ** 2 + dy[None, :] ** 2) / bandwidth ** 2
+
+    if kernel == 'gaussian':
+        weights = np.exp(-u2 / 2)
+    elif kernel == 'epanechnikov':
+        weights = 1 - u2
+    elif kernel == 'quartic':
+        weights = (1 - u2) ** 2
+    elif kernel == 'uniform':
+        weights = np.ones_like(u2)
+    else:
+        raise ValueError("`kernel` must be one of 'gaussian', 'epanechnikov', 'quartic' or 'uniform'.")
+
+    weights[u2 > (16 if kernel == 'gaussian' else 1)] = 0
+
+    return weights, radius_x, radius_y
+
+
+def kde(pois, bandwidth=None, kernel='gaussian', cell_width=None, cell_height=None, cell_size_ratio=0.01, bounds=None,
+        znorm=False):
+    """Computes a kernel density estimation (KDE) surface of the given POIs over a uniform grid.
+
+    The grid is defined as in `index.grid`. The POIs are first counted per cell, and the cell counts are then convolved
+    (with FFT) with the kernel evaluated at the cell centers, so the cost depends on the number of POIs only through the
+    counting. Each POI is thus treated as if it were located at the center of its cell, so the cells should be
+    considerably smaller than the bandwidth.
+
+    The kernel weights are normalized so that the density of each POI sums to 1 over the grid, and `density` is
+    expressed in POIs per square unit of the CRS (i.e., `density * cell_width * cell_height` is the smoothed count of
+    the cell).
+
+    The density surface is represented by a GeoDataFrame with the same layout as the one returned by `index.grid`,
+    where each row corresponds to a grid cell with non-zero density and contains the following columns:
+        - `cell_id`: The id of the cell (integer computed as: `cell_x * num_columns + cell_y`)
+        - `cell_x`: The row of the cell in the grid (integer).
+        - `cell_y`: The column of the cell in the grid (integer).
+        - `density`: see above
+        - `density_znorm`: the z-normalized density (only if `znorm` is True).
+        - 'geometry': Geometry column of the GeoDataFrame that contains the polygon representing the cell boundaries.
+
+    Args:
+        pois (GeoDataFrame): A POIs GeoDataFrame, or an iterable of such GeoDataFrames (see `index.grid`).
+        bandwidth (float): The kernel bandwidth (default: Scott's rule, `n^(-1/6)` times the mean standard deviation
+            of the coordinates).
+        kernel (string): The kernel (`gaussian`, `epanechnikov`, `quartic` or `uniform`; default: `gaussian`).
+        cell_width (float): cell width.
+        cell_height (float): cell height.
+        cell_size_ratio (float): ratio of cell width and height to area width and height (default: 0.01).
+        bounds (tuple): The area `(minx, miny, maxx, maxy)` covered by the grid (default: the bounding box of `pois`).
+        znorm (bool): Whether to include the z-normalized density (default: False).
+
+    Returns:
+        A GeoDataFrame as described above, the number of columns and the number of rows of the grid.
+    """
+
+    t0 = time()
+
+    chunks, minx, miny, cell_width, cell_height, num_columns, num_rows = _grid_params(pois, cell_width, cell_height,
+                                                                                      cell_size_ratio, bounds)
+
+    # Count the POIs per cell, keeping the coordinate sums needed for the default bandwidth; POIs outside the grid
+    # are ignored, and POIs on its upper and right edges are assigned to the last row and column
+    orig_crs = None
+    counts = np.zeros(num_columns * num_rows)
+    num_pois = 0
+    sums = np.zeros(4)
+    for chunk in chunks:
+        orig_crs = chunk.crs
+        x = chunk.geometry.x.values
+        y = chunk.geometry.y.values
+        within = ((x >= minx) & (x <= minx + num_columns * cell_width) & (y >= miny) &
+                  (y <= miny + num_rows * cell_height))
+        x = x[within]
+        y = y[within]
+        cell_x = np.minimum(np.floor((x - minx) / cell_width).astype(np.int64), num_columns - 1)
+        cell_y = np.minimum(np.floor((y - miny) / cell_height).astype(np.int64), num_rows - 1)
+        counts += np.bincount(cell_x * num_rows + cell_y, minlength=len(counts))
+        num_pois += len(x)
+        sums += [x.sum(), (x * x).sum(), y.sum(), (y * y).sum()]
+    counts = counts.reshape(num_columns, num_rows)
+
+    if bandwidth is None:
+        if num_pois < 2:
+            raise ValueError('`bandwidth` must be provided when there are fewer than 2 POIs.')
+        std_x = math.sqrt(max(sums[1] / num_pois - (sums[0] / num_pois) ** 2, 0))
+        std_y = math.sqrt(max(sums[3] / num_pois - (sums[2] / num_pois) ** 2, 0))
+        bandwidth = num_pois ** (-1 / 6) * (std_x + std_y) / 2
+
+    weights, radius_x, radius_y = _kernel_weights(kernel, bandwidth, cell_width, cell_height)
+    weights /= weights.sum() * cell_width * cell_height
+
+    # The full convolution keeps the density spreading beyond the area; only the cells within the area are returned
+    density = fftconvolve(counts, weights, mode='full')[radius_x:radius_x + num_columns, radius_y:radius_y + num_rows]
+
+    # Remove the round-off noise of the FFT
+    density[density < 1e-10 * density.max()] = 0
+
+    cell_x, cell_y = np.nonzero(density)
+    cell_ids = cell_x * num_columns + cell_y
+
+    cells = pd.DataFrame({'cell_id': cell_ids, 'cell_x': cell_x, 'cell_y': cell_y,
+                          'density': density[cell_x, cell_y]}, index=pd.Index(cell_ids, name='cell_id'))
+
+    if znorm:
+        cells['density_znorm'] = zscore(cells['density'])
+
+    geometry = _cell_boxes(cell_x, cell_y, minx, miny, cell_width, cell_height)
+    gcells = gpd.GeoDataFrame(cells, crs=orig_crs, geometry=geometry)
+
+    print("Done in %0.3fs." % (time() - t0))
+
+    return gcells, num_columns, num_rows
@@ -1,16 +1,170 @@
 import math
-from shapely.geometry import box
+import os
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, diags
+from scipy.spatial import cKDTree
 from scipy.stats import zscore
 import geopandas as gpd
 from time import time
 
 
-def grid(pois, cell_width=None, cell_height=None, cell_size_ratio=0.01, znorm=False, neighborhood=False):
+def _grid_params(pois, cell_width, cell_height, cell_size_ratio, bounds):
+    """Returns the POI chunks to be assigned to a grid and the grid parameters, as described in `grid`."""
+
+    if isinstance(pois, pd.DataFrame):
+        if bounds is None:
+            bounds = pois.geometry.total_bounds
+        chunks = [pois]
+    else:
+        if bounds is None:
+            raise ValueError('`bounds` must be provided when `pois` is an iterable of GeoDataFrames.')
+        chunks = pois
+
+    minx, miny, maxx, maxy = bounds
+
+    if cell_width is None:
+        cell_width = cell_size_ratio * (maxx - minx)
+
+    if cell_height is None:
+        cell_height = cell_size_ratio * (maxy - miny)
+
+    num_columns = math.ceil((maxx - minx) / cell_width)
+    num_rows = math.ceil((maxy - miny) / cell_height)
+
+    return chunks, minx, miny, cell_width, cell_height, num_columns, num_rows
+
+
+def _grid_cells(x, y, minx, miny, cell_width, cell_height, num_columns, num_rows):
+    """Returns the ids (`cell_x * num_columns + cell_y`) of the grid cells containing the given coordinates, and a
+    mask of the coordinates within the grid.
+
+    Coordinates outside the grid get the id -1, and those on its upper and right edges are assigned to the last row
+    and column.
+    """
+
+    within = ((x >= minx) & (x <= minx + num_columns * cell_width) & (y >= miny) &
+              (y <= miny + num_rows * cell_height))
+    cell_x = np.minimum(np.floor((x[within] - minx) / cell_width).astype(np.int64), num_columns - 1)
+    cell_y = np.minimum(np.floor((y[within] - miny) / cell_height).astype(np.int64), num_rows - 1)
+
+    cell_ids = np.full(len(x), -1, dtype=np.int64)
+    cell_ids[within] = cell_x * num_columns + cell_y
+
+    return cell_ids, within
+
+
+def _nb_sums(cell_x, cell_y, score):
+    """Returns the total score of each given cell and its adjacent cells.
+
+    The sums are computed as a 2D convolution of the sparse cell score matrix with a 3x3 kernel of ones, i.e., as the
+    product `T_x * S * T_y`, where `T_x` and `T_y` are tridiagonal matrices of ones.
+    """
+
+    if len(score) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    rows = cell_x - cell_x.min()
+    cols = cell_y - cell_y.min()
+    num_x = rows.max() + 1
+    num_y = cols.max() + 1
+
+    scores = coo_matrix((score, (rows, cols)), shape=(num_x, num_y)).tocsr()
+    t_x = diags([1, 1, 1], [-1, 0, 1], shape=(num_x, num_x), dtype=scores.dtype, format='csr')
+    t_y = diags([1, 1, 1], [-1, 0, 1], shape=(num_y, num_y), dtype=scores.dtype, format='csr')
+    nb_scores = t_x.dot(scores).dot(t_y)
+
+    return np.asarray(nb_scores[rows, cols]).ravel()
+
+
+def _cell_boxes(cell_x, cell_y, minx, miny, cell_width, cell_height):
+    """Returns the polygons representing the boundaries of the given cells.
+
+    The polygons are encoded in bulk as WKB records and decoded at once, instead of constructing each one separately.
+    """
+
+    x0 = minx + cell_x * cell_width
+    y0 = miny + cell_y * cell_height
+    x1 = minx + (cell_x + 1) * cell_width
+    y1 = miny + (cell_y + 1) * cell_height
+
+    # Same vertex order as `shapely.geometry.box`
+    return _ring_polygons(np.column_stack([x1, y0, x1, y1, x0, y1, x0, y0, x1, y0]))
+
+
+def _ring_polygons(coords):
+    """Returns polygons with a single (closed) ring, given as rows of `x1, y1, x2, y2, ...` coordinates."""
+
+    # Little endian WKB polygon with a single ring
+    wkb = np.empty(len(coords), dtype=[('byte_order', 'u1'), ('type', '<u4'), ('num_rings', '<u4'),
+                                       ('num_points', '<u4'), ('coords', '<f8', (coords.shape[1],))])
+    wkb['byte_order'] = 1
+    wkb['type'] = 3
+    wkb['num_rings'] = 1
+    wkb['num_points'] = coords.shape[1] // 2
+    wkb['coords'] = coords
+
+    size = wkb.dtype.itemsize
+    data = wkb.tobytes()
+
+    return gpd.GeoSeries.from_wkb([data[i:i + size] for i in range(0, len(data), size)]).values
+
+
+def _group_cells(cell_ids):
+    """Groups the POIs by cell, keeping the cells in order of appearance and the POIs in their original order.
+
+    Returns the order of the POIs sorted by cell, the distinct cell ids, the offset of the first POI and the number of
+    POIs of each cell in that order, and the order of appearance of the cells.
+    """
+
+    order = np.argsort(cell_ids, kind='mergesort')
+    unique_ids, starts, score = np.unique(cell_ids[order], return_index=True, return_counts=True)
+    appearance = np.argsort(order[starts], kind='mergesort')
+
+    return order, unique_ids, starts, score, appearance
+
+
+def _num_workers(n_jobs):
+    """Returns the number of worker processes for `n_jobs` (where -1 means one per CPU, as in scikit-learn)."""
+
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+
+
+def _add_contents(cells, cols, contents, poi_ids, order, starts, score, appearance):
+    """Adds the points of each cell to `cells`, as described in `grid`, and returns the array of point ids to be kept
+    in `attrs['contents']`, if any."""
+
+    contents_ids = None
+    if contents == 'list':
+        cell_lists = np.split(np.concatenate(poi_ids)[order], starts[1:])
+        cells['contents'] = [cell_lists[i].tolist() for i in appearance]
+        cols.append('contents')
+    elif contents == 'offsets':
+        contents_ids = np.concatenate(poi_ids)[order]
+        cells['contents_start'] = starts[appearance]
+        cells['contents_end'] = starts[appearance] + score[appearance]
+        cols.extend(['contents_start', 'contents_end'])
+
+    return contents_ids
+
+
+def grid(pois, cell_width=None, cell_height=None, cell_size_ratio=0.01, znorm=False, neighborhood=False, bounds=None,
+         contents='list'):
     """Constructs a uniform grid from the given POIs.
 
     If `cell_width` and `cell_height` are provided, each grid cell has size `cell_width * cell_height`.
     Otherwise, `cell_width = cell_size_ratio * area_width` and `cell_height = cell_size_ratio * area_height`,
-    where `area` refers to the bounding box of `pois`.
+    where `area` refers to the bounding box of `pois` (or `bounds`, if provided).
+
+    Instead of a single GeoDataFrame, `pois` may be an iterable of POI GeoDataFrames (e.g., the chunks yielded by
+    `io.iter_poi_csv`), which are assigned to cells one at a time. In that case, `bounds` must be provided.
+
+    POIs outside `bounds` are ignored, and POIs on the upper and right edges of the grid are assigned to its last row
+    and column.
 
     Each cell is assigned a `score`, which is the number of points within that cell.
 
@@ -29,9 +183,15 @@ def grid(pois, cell_width=None, cell_height=None, cell_size_ratio=0.01, znorm=Fa
         - `score_nb`: see above
         - `score_znorm`: see above
         - `score_nb_znorm`: see above
-        - 'contents': list of points in the cell.
+        - 'contents': list of points in the cell (only if `contents='list'`).
+        - 'contents_start', 'contents_end': offsets of the points of the cell (only if `contents='offsets'`).
         - 'geometry': Geometry column of the GeoDataFrame that contains the polygon representing the cell boundaries.
 
+    Keeping a list of points per cell dominates memory for fine grids. With `contents='offsets'`, the ids of all points
+    are instead stored in a single array sorted by cell (in `attrs['contents']` of the returned GeoDataFrame), and
+    each cell only stores the start and end offsets of its points in that array; use `cell_contents` to fetch the
+    points of a cell. With `contents='none'`, the points of the cells are not kept at all.
+
     Args:
         pois (GeoDataFrame): a POIs GeoDataFrame.
         cell_width (float): cell width.
@@ -39,86 +199,942 @@ def grid(pois, cell_width=None, cell_height=None, cell_size_ratio=0.01, znorm=Fa
         cell_size_ratio (float): ratio of cell width and height to area width and height (default: 0.01).
         znorm (bool): Whether to include z-normalized scores (default: False).
         neighborhood (bool): Whether to include a total score including adjacent cells (default: False).
+        bounds (tuple): The area `(minx, miny, maxx, maxy)` covered by the grid (default: the bounding box of `pois`).
+        contents (string): How to keep the points of each cell (`list`, `offsets` or `none`; default: `list`).
 
     Returns:
         A GeoDataFrame as described above.
     """
 
     t0 = time()
-    orig_crs = pois.crs
-    minx, miny, maxx, maxy = pois.geometry.total_bounds
 
-    if cell_width is None:
-        cell_width = cell_size_ratio * (maxx - minx)
+    if contents not in ('list', 'offsets', 'none'):
+        raise ValueError("`contents` must be one of 'list', 'offsets' or 'none'.")
 
-    if cell_height is None:
-        cell_height = cell_size_ratio * (maxy - miny)
+    chunks, minx, miny, cell_width, cell_height, num_columns, num_rows = _grid_params(pois, cell_width, cell_height,
+                                                                                      cell_size_ratio, bounds)
 
-    num_columns = math.ceil((maxx - minx) / cell_width)
-    num_rows = math.ceil((maxy - miny) / cell_height)
+    orig_crs = None
+    cell_ids = []
+    poi_ids = []
+    for chunk in chunks:
+        orig_crs = chunk.crs
+        chunk_cell_ids, within = _grid_cells(chunk.geometry.x.values, chunk.geometry.y.values, minx, miny,
+                                             cell_width, cell_height, num_columns, num_rows)
+        chunk['cell_id'] = chunk_cell_ids
+        cell_ids.append(chunk_cell_ids[within])
+        if contents != 'none':
+            poi_ids.append(chunk['id'].values[within])
 
-    def grid_cell(poi):
-        cell_x = math.floor((poi.x - minx) / cell_width)
-        cell_y = math.floor((poi.y - miny) / cell_height)
+    cell_ids = np.concatenate(cell_ids)
 
-        return int(cell_x * num_columns + cell_y)
+    order, unique_ids, starts, score, appearance = _group_cells(cell_ids)
+    del cell_ids
 
-    pois['cell_id'] = pois['geometry'].apply(lambda row: grid_cell(row))
+    cell_x, cell_y = np.divmod(unique_ids[appearance], num_columns)
 
-    pois = pois.groupby('cell_id', sort=False)['id'].agg([list])
+    pois = pd.DataFrame({'cell_id': unique_ids[appearance], 'cell_x': cell_x, 'cell_y': cell_y,
+                         'score': score[appearance]}, index=pd.Index(unique_ids[appearance], name='cell_id'))
+    cols = ['cell_id', 'cell_x', 'cell_y', 'score']
 
-    def score(row):
-        (cell_x, cell_y) = divmod(row.name, num_columns)
+    if neighborhood is True:
+        pois['score_nb'] = _nb_sums(cell_x, cell_y, pois['score'].values)
+        cols.append('score_nb')
 
-        cell_id = int(cell_x * num_columns + cell_y)
-        cell_score = len(row['list'])
-        geometry = box(minx + cell_x * cell_width, miny + cell_y * cell_height, minx + (cell_x + 1) * cell_width, miny
-                       + (cell_y + 1) * cell_height)
+    if znorm:
+        pois['score_znorm'] = zscore(pois['score'])
+        cols.append('score_znorm')
+        if neighborhood is True:
+            pois['score_nb_znorm'] = zscore(pois['score_nb'])
+            cols.append('score_nb_znorm')
 
-        return cell_id, cell_x, cell_y, cell_score, geometry
+    contents_ids = _add_contents(pois, cols, contents, poi_ids, order, starts, score, appearance)
+    del poi_ids, order
 
-    pois['cell_id'], pois['cell_x'], pois['cell_y'], pois['score'], pois['geometry'] = zip(*pois.apply(score, axis=1))
+    pois['geometry'] = _cell_boxes(cell_x, cell_y, minx, miny, cell_width, cell_height)
+    cols.append('geometry')
 
-    pois.rename(columns={'list': 'contents'}, inplace=True)
+    pois = pois[cols]
 
-    if znorm:
-        pois['score_znorm'] = zscore(pois['score'])
+    gpois = gpd.GeoDataFrame(pois, crs=orig_crs, geometry=pois.geometry)
+    if contents_ids is not None:
+        gpois.attrs['contents'] = contents_ids
 
-    if neighborhood is True:
-        # Build dict. {(x, y): score}
-        cell_id_score_dict = pois.set_index(['cell_x', 'cell_y']).to_dict()['score']
+    print("Done in %0.3fs." % (time() - t0))
+
+    return gpois, num_columns, num_rows
+
+
+def cell_contents(grid, cell_id):
+    """Returns the ids of the points contained in a cell of a grid constructed by `grid`.
+
+    Args:
+        grid (GeoDataFrame): A grid constructed with `contents='list'` or `contents='offsets'`.
+        cell_id (integer): The id of the cell.
+
+    Returns:
+        The ids of the points in the cell (a list or an array, respectively).
+    """
+
+    cell = grid.loc[cell_id]
+    if 'contents' in grid.columns:
+        return cell['contents']
+
+    return grid.attrs['contents'][cell['contents_start']:cell['contents_end']]
+
+
+class GridPyramid(object):
+    """A multi-resolution grid over a set of POIs.
+
+    The finest level (level 0) is the grid constructed by `grid` with the given parameters. Each coarser level `k` is
+    derived from level `k - 1` by summing the scores of blocks of 2x2 cells, so that its cells are `2^k` times wider
+    and higher than those of level 0, without revisiting the POIs. The scores of each level are computed once, when the
+    level is first requested, so switching between levels is cheap.
+
+    Args:
+        pois (GeoDataFrame): A POIs GeoDataFrame, or an iterable of such GeoDataFrames (see `grid`).
+        cell_width (float): Cell width of the finest level.
+        cell_height (float): Cell height of the finest level.
+        cell_size_ratio (float): Ratio of cell width and height of the finest level to area width and height
+            (default: 0.01).
+        bounds (tuple): The area `(minx, miny, maxx, maxy)` covered by the grid (default: the bounding box of `pois`).
+        num_levels (int): The number of levels (default: 5).
+    """
+
+    def __init__(self, pois, cell_width=None, cell_height=None, cell_size_ratio=0.01, bounds=None, num_levels=5):
+        t0 = time()
+
+        chunks, minx, miny, cell_width, cell_height, num_columns, num_rows = _grid_params(pois, cell_width,
+                                                                                          cell_height, cell_size_ratio,
+                                                                                          bounds)
+        self.minx = minx
+        self.miny = miny
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.num_columns = num_columns
+        self.num_rows = num_rows
+        self.num_levels = num_levels
+        self.crs = None
+
+        cell_ids = []
+        counts = []
+        for chunk in chunks:
+            self.crs = chunk.crs
+            chunk_cell_ids, within = _grid_cells(chunk.geometry.x.values, chunk.geometry.y.values, minx, miny,
+                                                 cell_width, cell_height, num_columns, num_rows)
+            chunk_cell_ids, chunk_counts = np.unique(chunk_cell_ids[within], return_counts=True)
+            cell_ids.append(chunk_cell_ids)
+            counts.append(chunk_counts)
+
+        cell_ids, inverse = np.unique(np.concatenate(cell_ids), return_inverse=True)
+        score = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+        cell_x, cell_y = np.divmod(cell_ids, num_columns)
+
+        self._levels = [self._scores(cell_x, cell_y, score, 0)]
+
+        print("Done in %0.3fs." % (time() - t0))
+
+    def shape(self, level=0):
+        """Returns the number of columns and rows of the given level."""
+
+        factor = 2 ** level
+        return math.ceil(self.num_columns / factor), math.ceil(self.num_rows / factor)
+
+    def cell_size(self, level=0):
+        """Returns the cell width and height of the given level."""
+
+        factor = 2 ** level
+        return self.cell_width * factor, self.cell_height * factor
+
+    def _scores(self, cell_x, cell_y, score, level):
+        num_columns, num_rows = self.shape(level)
+        scores = pd.DataFrame({'cell_id': cell_x * num_columns + cell_y, 'cell_x': cell_x, 'cell_y': cell_y,
+                               'score': score})
+        scores['score_nb'] = _nb_sums(cell_x, cell_y, score)
+        scores['score_znorm'] = zscore(scores['score'])
+        scores['score_nb_znorm'] = zscore(scores['score_nb'])
+        scores.index = pd.Index(scores['cell_id'].values, name='cell_id')
+
+        return scores
 
-        cell_id_nbsum_dict = dict()
-        for key, value in cell_id_score_dict.items():
-            x = key[0]
-            y = key[1]
-            nb_sum = 0
-            for i in range(x - 1, x + 2):
-                for j in range(y - 1, y + 2):
-                    nb_sum += cell_id_score_dict.get((i, j)) or 0
+    def _level_scores(self, level):
+        if level < 0 or level >= self.num_levels:
+            raise ValueError('`level` must be between 0 and %d.' % (self.num_levels - 1))
 
-            cell_id_nbsum_dict[int(x * num_columns + y)] = nb_sum
+        # Roll up the cells of the previous level into blocks of 2x2 cells
+        while len(self._levels) <= level:
+            prev = self._levels[-1]
+            cell_x = prev['cell_x'].values // 2
+            cell_y = prev['cell_y'].values // 2
+            min_x = cell_x.min()
+            min_y = cell_y.min()
+            span_y = cell_y.max() - min_y + 1
+            keys, inverse = np.unique((cell_x - min_x) * span_y + (cell_y - min_y), return_inverse=True)
+            score = np.bincount(inverse, weights=prev['score'].values).astype(np.int64)
+            cell_x, cell_y = np.divmod(keys, span_y)
+            self._levels.append(self._scores(cell_x + min_x, cell_y + min_y, score, len(self._levels)))
 
-        pois['score_nb'] = pois.index.map(cell_id_nbsum_dict)
-        del cell_id_score_dict
+        return self._levels[level]
 
+    def level(self, level=0, znorm=False, neighborhood=False, bbox=None):
+        """Returns a level of the pyramid as a grid.
+
+        Args:
+            level (int): The level (0 is the finest; default: 0).
+            znorm (bool): Whether to include z-normalized scores (default: False).
+            neighborhood (bool): Whether to include a total score including adjacent cells (default: False).
+            bbox (tuple): If provided, only the cells intersecting the area `(minx, miny, maxx, maxy)` are returned.
+                Z-normalized scores still refer to all the cells of the level.
+
+        Returns:
+            A GeoDataFrame with the same columns as the one returned by `grid` with `contents='none'`.
+        """
+
+        scores = self._level_scores(level)
+        cell_width, cell_height = self.cell_size(level)
+
+        if bbox is not None:
+            q_minx, q_miny, q_maxx, q_maxy = bbox
+            cell_x = scores['cell_x'].values
+            cell_y = scores['cell_y'].values
+            mask = ((cell_x >= math.floor((q_minx - self.minx) / cell_width)) &
+                    (cell_x <= math.floor((q_maxx - self.minx) / cell_width)) &
+                    (cell_y >= math.floor((q_miny - self.miny) / cell_height)) &
+                    (cell_y <= math.floor((q_maxy - self.miny) / cell_height)))
+            scores = scores[mask]
+
+        cols = ['cell_id', 'cell_x', 'cell_y', 'score']
+        if neighborhood is True:
+            cols.append('score_nb')
         if znorm:
-            pois['score_nb_znorm'] = zscore(pois['score_nb'])
-            cols = ['cell_id', 'cell_x', 'cell_y', 'score', 'score_nb', 'score_znorm', 'score_nb_znorm', 'contents',
-                    'geometry']
-        else:
-            cols = ['cell_id', 'cell_x', 'cell_y', 'score', 'score_nb', 'contents', 'geometry']
+            cols.append('score_znorm')
+            if neighborhood is True:
+                cols.append('score_nb_znorm')
+
+        cells = scores[cols].copy()
+        geometry = _cell_boxes(cells['cell_x'].values, cells['cell_y'].values, self.minx, self.miny, cell_width,
+                               cell_height)
+
+        return gpd.GeoDataFrame(cells, crs=self.crs, geometry=geometry)
+
+
+class GridIndex(object):
+    """A mutable uniform grid over a changing set of POIs.
+
+    The grid is defined once, with the same parameters as in `grid`, and POIs can then be added or removed in batches.
+    Each batch incrementally updates the score of the affected cells, the neighborhood score (`score_nb`) of the
+    affected cells and their adjacent cells, as well as the running sums used to compute the mean and standard
+    deviation of both scores for z-normalization, so the scores stay current without rebuilding the grid.
+
+    Args:
+        pois (GeoDataFrame): The initial POIs (default: None). Either `pois` or `bounds` must be provided.
+        cell_width (float): cell width.
+        cell_height (float): cell height.
+        cell_size_ratio (float): ratio of cell width and height to area width and height (default: 0.01).
+        bounds (tuple): The area `(minx, miny, maxx, maxy)` covered by the grid (default: the bounding box of `pois`).
+            POIs added later may also fall outside of it, in which case the grid is extended with cells of the same
+            size beyond the bounds (with negative `cell_x` or `cell_y`, or ones exceeding the number of columns or
+            rows).
+    """
+
+    def __init__(self, pois=None, cell_width=None, cell_height=None, cell_size_ratio=0.01, bounds=None):
+        if pois is None and bounds is None:
+            raise ValueError('Either `pois` or `bounds` must be provided.')
+
+        _, minx, miny, cell_width, cell_height, num_columns, num_rows = _grid_params(
+            pois if pois is not None else [], cell_width, cell_height, cell_size_ratio, bounds)
+        self.minx = minx
+        self.miny = miny
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.num_columns = num_columns
+        self.num_rows = num_rows
+        self.crs = pois.crs if pois is not None else None
+
+        self._scores = dict()
+        self._nb_scores = dict()
+        self._poi_cells = dict()
+        self._score_sum = 0
+        self._score_sq_sum = 0
+        self._nb_sum = 0
+        self._nb_sq_sum = 0
+
+        if pois is not None:
+            self.add(pois)
+
+    def __len__(self):
+        return len(self._poi_cells)
+
+    def _update(self, cells, deltas):
+        # Cells are keyed by `(cell_x, cell_y)`, since cells outside the bounds have no valid `cell_id`
+        scores = self._scores
+        nb_scores = self._nb_scores
+
+        for cell, delta in zip(cells, deltas.tolist()):
+            old = scores.get(cell, 0)
+            new = old + delta
+            self._score_sum += delta
+            self._score_sq_sum += new * new - old * old
+
+            # The neighborhood score of a cell only counts towards the statistics while the cell is not empty
+            if old > 0:
+                nb = nb_scores.get(cell, 0)
+                self._nb_sum -= nb
+                self._nb_sq_sum -= nb * nb
+
+            cell_x, cell_y = cell
+            for i in range(cell_x - 1, cell_x + 2):
+                for j in range(cell_y - 1, cell_y + 2):
+                    nb_cell = (i, j)
+                    nb_old = nb_scores.get(nb_cell, 0)
+                    nb_new = nb_old + delta
+                    if nb_new == 0:
+                        del nb_scores[nb_cell]
+                    else:
+                        nb_scores[nb_cell] = nb_new
+
+                    if nb_cell != cell and nb_cell in scores:
+                        self._nb_sum += delta
+                        self._nb_sq_sum += nb_new * nb_new - nb_old * nb_old
+
+            if new > 0:
+                scores[cell] = new
+                nb = nb_scores.get(cell, 0)
+                self._nb_sum += nb
+                self._nb_sq_sum += nb * nb
+            else:
+                del scores[cell]
+
+    def add(self, pois):
+        """Adds a batch of POIs to the grid. POIs with ids already in the grid are moved to their new location, and only
+        the last of the POIs with the same id in the batch is added.
+
+        The CRS of the grid is taken from the first non-empty batch, if it was not given by the initial POIs.
+
+        Args:
+            pois (GeoDataFrame): The POIs to be added.
+        """
+
+        if self.crs is None and len(pois.index) > 0:
+            self.crs = pois.crs
+
+        last = ~pois['id'].duplicated(keep='last').values
+        if not last.all():
+            pois = pois[last]
+
+        ids = pois['id'].tolist()
+        self.remove([poi_id for poi_id in ids if poi_id in self._poi_cells])
+
+        cell_x = np.floor((pois.geometry.x.values - self.minx) / self.cell_width).astype(np.int64)
+        cell_y = np.floor((pois.geometry.y.values - self.miny) / self.cell_height).astype(np.int64)
+        self._poi_cells.update(zip(ids, zip(cell_x.tolist(), cell_y.tolist())))
+
+        cells, counts = np.unique(np.column_stack([cell_x, cell_y]), axis=0, return_counts=True)
+        self._update(map(tuple, cells.tolist()), counts)
+
+    def remove(self, ids):
+        """Removes a batch of POIs from the grid. Ids not in the grid are ignored.
+
+        Args:
+            ids (list): The ids of the POIs to be removed.
+        """
+
+        cells = [self._poi_cells.pop(poi_id) for poi_id in ids if poi_id in self._poi_cells]
+        if len(cells) == 0:
+            return
+
+        cells, counts = np.unique(np.array(cells, dtype=np.int64), axis=0, return_counts=True)
+        self._update(map(tuple, cells.tolist()), -counts)
+
+    def _stats(self, total, sq_total):
+        num_cells = len(self._scores)
+        if num_cells == 0:
+            return float('nan'), float('nan')
+
+        mean = total / num_cells
+        return mean, math.sqrt(max(sq_total / num_cells - mean * mean, 0.0))
+
+    def score_stats(self):
+        """Returns the mean and standard deviation of the scores of the non-empty cells."""
+
+        return self._stats(self._score_sum, self._score_sq_sum)
+
+    def score_nb_stats(self):
+        """Returns the mean and standard deviation of the neighborhood scores of the non-empty cells."""
+
+        return self._stats(self._nb_sum, self._nb_sq_sum)
+
+    def to_grid(self, znorm=False, neighborhood=False):
+        """Returns the current state of the grid.
+
+        As in `grid`, `cell_id` is computed as `cell_x * num_columns + cell_y`, so it only identifies the cells within
+        the bounds; cells outside of them should be identified by `cell_x` and `cell_y`.
+
+        Args:
+            znorm (bool): Whether to include z-normalized scores (default: False).
+            neighborhood (bool): Whether to include a total score including adjacent cells (default: False).
+
+        Returns:
+            A GeoDataFrame with the same columns as the one returned by `grid` with `contents='none'`.
+        """
+
+        keys = np.array(list(self._scores.keys()), dtype=np.int64).reshape(-1, 2)
+        cell_x, cell_y = keys[:, 0], keys[:, 1]
+        cell_ids = cell_x * self.num_columns + cell_y
+        cells = pd.DataFrame({'cell_id': cell_ids, 'cell_x': cell_x, 'cell_y': cell_y,
+                              'score': np.fromiter(self._scores.values(), dtype=np.int64, count=len(cell_ids))},
+                             index=pd.Index(cell_ids, name='cell_id'))
+
+        if neighborhood is True:
+            cells['score_nb'] = np.array([self._nb_scores[cell] for cell in self._scores], dtype=np.int64)
 
-    else:
         if znorm:
-            cols = ['cell_id', 'cell_x', 'cell_y', 'score', 'score_znorm', 'contents', 'geometry']
-        else:
-            cols = ['cell_id', 'cell_x', 'cell_y', 'score', 'contents', 'geometry']
+            mean, std = self.score_stats()
+            cells['score_znorm'] = (cells['score'] - mean) / std
+            if neighborhood is True:
+                mean, std = self.score_nb_stats()
+                cells['score_nb_znorm'] = (cells['score_nb'] - mean) / std
 
-    pois = pois[cols]
+        geometry = _cell_boxes(cell_x, cell_y, self.minx, self.miny, self.cell_width, self.cell_height)
 
-    gpois = gpd.GeoDataFrame(pois, crs=orig_crs, geometry=pois.geometry)
+        return gpd.GeoDataFrame(cells, crs=self.crs, geometry=geometry)
+
+
+def _pack_ids(a, b):
+    """Packs two signed 32-bit integer coordinates into a single 64-bit integer id."""
+
+    return (a.astype(np.int64) << 32) | (b.astype(np.int64) + 2 ** 31)
+
+
+def _unpack_ids(cell_ids):
+    """Unpacks the coordinates packed by `_pack_ids`."""
+
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    return cell_ids >> 32, (cell_ids & 0xFFFFFFFF) - 2 ** 31
+
+
+class Tessellation(object):
+    """A partitioning of the plane into cells with stable integer ids.
+
+    Cell ids only depend on the tessellation parameters, not on the data, so that grids constructed by `tessellate` in
+    separate runs or over different regions (with the same tessellation) can be merged on `cell_id`.
+
+    Subclasses implement the assignment of points to cells, the enumeration of the adjacent cells of each cell and the
+    construction of the cell boundaries, each on arrays of points or cells at once.
+    """
+
+    def cells(self, geometry):
+        """Returns the ids of the cells containing the given points.
+
+        Args:
+            geometry (GeoSeries): The points.
+
+        Returns:
+            An integer array of cell ids.
+        """
+
+        raise NotImplementedError
+
+    def neighbors(self, cell_ids):
+        """Returns the ids of the cells adjacent to the given cells.
+
+        Args:
+            cell_ids (array): The cell ids.
+
+        Returns:
+            An integer array with a row per given cell, where missing neighbors (e.g., beyond the poles) are -1.
+        """
+
+        raise NotImplementedError
+
+    def boundaries(self, cell_ids, crs):
+        """Returns the polygons representing the boundaries of the given cells.
+
+        Args:
+            cell_ids (array): The cell ids.
+            crs (dict or string): The CRS of the points assigned to the cells.
+
+        Returns:
+            A GeoSeries with the cell polygons in `crs`.
+        """
+
+        raise NotImplementedError
+
+
+class RectangularTessellation(Tessellation):
+    """A tessellation into rectangles of size `cell_width * cell_height` in the CRS of the points.
+
+    Unlike `grid`, the cells are aligned to a fixed `origin` instead of the bounding box of the points.
+
+    Args:
+        cell_width (float): Cell width.
+        cell_height (float): Cell height.
+        origin (tuple): The lower left corner of cell `(0, 0)` (default: `(0, 0)`).
+    """
+
+    def __init__(self, cell_width, cell_height, origin=(0.0, 0.0)):
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.origin = origin
+
+    def cells(self, geometry):
+        cell_x = np.floor((geometry.x.values - self.origin[0]) / self.cell_width)
+        cell_y = np.floor((geometry.y.values - self.origin[1]) / self.cell_height)
+        return _pack_ids(cell_x, cell_y)
+
+    def neighbors(self, cell_ids):
+        cell_x, cell_y = _unpack_ids(cell_ids)
+        offsets = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx != 0 or dy != 0]
+        return np.column_stack([_pack_ids(cell_x + dx, cell_y + dy) for dx, dy in offsets])
+
+    def boundaries(self, cell_ids, crs):
+        cell_x, cell_y = _unpack_ids(cell_ids)
+        return gpd.GeoSeries(_cell_boxes(cell_x, cell_y, self.origin[0], self.origin[1], self.cell_width,
+                                         self.cell_height), crs=crs)
+
+
+class HexagonalTessellation(Tessellation):
+    """A tessellation into regular (pointy-top) hexagons in the CRS of the points.
+
+    The hexagons are laid out on the plane of the CRS of the points, so a projected CRS (e.g., EPSG:3857, to compare
+    different cities) should be used. Cells are identified by their axial coordinates `(q, r)`.
+
+    Args:
+        size (float): The distance from the center of each hexagon to its vertices.
+        origin (tuple): The center of hexagon `(0, 0)` (default: `(0, 0)`).
+    """
+
+    _NEIGHBOR_OFFSETS = [(1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1)]
+
+    def __init__(self, size, origin=(0.0, 0.0)):
+        self.size = size
+        self.origin = origin
+
+    def cells(self, geometry):
+        x = (geometry.x.values - self.origin[0]) / self.size
+        y = (geometry.y.values - self.origin[1]) / self.size
+
+        # Fractional axial coordinates, rounded to the nearest hexagon in cube coordinates
+        q = math.sqrt(3) / 3 * x - y / 3
+        r = 2 / 3 * y
+        s = -q - r
+        rq, rr, rs = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq[fix_q] = -rr[fix_q] - rs[fix_q]
+        rr[fix_r] = -rq[fix_r] - rs[fix_r]
+
+        return _pack_ids(rq, rr)
+
+    def neighbors(self, cell_ids):
+        q, r = _unpack_ids(cell_ids)
+        return np.column_stack([_pack_ids(q + dq, r + dr) for dq, dr in self._NEIGHBOR_OFFSETS])
+
+    def centers(self, cell_ids):
+        """Returns the x and y coordinates of the centers of the given cells."""
+
+        q, r = _unpack_ids(cell_ids)
+        x = self.origin[0] + self.size * math.sqrt(3) * (q + r / 2)
+        y = self.origin[1] + self.size * 1.5 * r
+        return x, y
+
+    def boundaries(self, cell_ids, crs):
+        x, y = self.centers(cell_ids)
+        angles = np.radians(np.arange(-30, 330, 60))
+        coords = np.empty((len(x), 2 * len(angles) + 2))
+        coords[:, 0:-2:2] = x[:, None] + self.size * np.cos(angles)
+        coords[:, 1:-2:2] = y[:, None] + self.size * np.sin(angles)
+        coords[:, -2:] = coords[:, :2]
+        return gpd.GeoSeries(_ring_polygons(coords), crs=crs)
+
+
+def _spread_bits(v):
+    """Interleaves the bits of the given (up to 32-bit) integers with zeros."""
+
+    v = v.astype(np.uint64)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def _compact_bits(v):
+    """Reverses `_spread_bits`."""
+
+    v = v.astype(np.uint64) & np.uint64(0x5555555555555555)
+    for shift, mask in ((1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+                        (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF)):
+        v = (v | (v >> np.uint64(shift))) & np.uint64(mask)
+    return v.astype(np.int64)
+
+
+class QuadkeyTessellation(Tessellation):
+    """A tessellation into the (Web Mercator) map tiles of a zoom level.
+
+    Points are projected to EPSG:3857 and assigned to the tiles of the standard tile pyramid used by web maps. The id
+    of each tile is its quadkey as an integer, i.e., the interleaved bits of the tile column and row, preceded by a
+    single set bit that determines the zoom level; see `quadkeys` for the usual string representation.
+
+    Args:
+        zoom (int): The zoom level (0 to 30).
+    """
+
+    _EXTENT = 20037508.342789244
+    _EDGE_POINTS = 16
+
+    def __init__(self, zoom):
+        if not 0 <= zoom <= 30:
+            raise ValueError('`zoom` must be between 0 and 30.')
+        self.zoom = zoom
+
+    def tiles(self, cell_ids):
+        """Returns the columns and rows of the tiles with the given ids."""
+
+        cell_ids = np.asarray(cell_ids, dtype=np.int64) - (1 << 2 * self.zoom)
+        return _compact_bits(cell_ids), _compact_bits(cell_ids >> 1)
+
+    def _tile_ids(self, tile_x, tile_y):
+        return (1 << 2 * self.zoom) | (_spread_bits(tile_x) | (_spread_bits(tile_y) << np.uint64(1))).astype(np.int64)
+
+    def quadkeys(self, cell_ids):
+        """Returns the quadkey strings of the tiles with the given ids."""
+
+        return [np.base_repr(cell_id, 4)[1:] for cell_id in np.asarray(cell_ids, dtype=np.int64).tolist()]
+
+    def cells(self, geometry):
+        if geometry.crs is not None:
+            geometry = geometry.to_crs('EPSG:3857')
+
+        num_tiles = 2 ** self.zoom
+        tile_size = 2 * self._EXTENT / num_tiles
+        tile_x = np.clip(np.floor((geometry.x.values + self._EXTENT) / tile_size), 0, num_tiles - 1)
+        tile_y = np.clip(np.floor((self._EXTENT - geometry.y.values) / tile_size), 0, num_tiles - 1)
+
+        return self._tile_ids(tile_x.astype(np.int64), tile_y.astype(np.int64))
+
+    def neighbors(self, cell_ids):
+        tile_x, tile_y = self.tiles(cell_ids)
+        num_tiles = 2 ** self.zoom
+
+        neighbors = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx == 0 and dy == 0:
+                    continue
+                # Tiles wrap around the antimeridian, but not around the poles; at the lowest zoom levels, where
+                # wrapping would visit the same tile twice, each tile is only counted once
+                nb_x = (tile_x + dx) % num_tiles
+                nb_y = tile_y + dy
+                valid = (nb_y >= 0) & (nb_y < num_tiles) & ((nb_x != tile_x) | (nb_y != tile_y))
+                if dx == 1 and num_tiles == 2:
+                    valid[:] = False
+                neighbors.append(np.where(valid, self._tile_ids(nb_x, np.clip(nb_y, 0, num_tiles - 1)), -1))
+
+        return np.column_stack(neighbors)
+
+    def boundaries(self, cell_ids, crs):
+        tile_x, tile_y = self.tiles(cell_ids)
+        tile_size = 2 * self._EXTENT / 2 ** self.zoom
+        x0 = -self._EXTENT + tile_x * tile_size
+        y1 = self._EXTENT - tile_y * tile_size
+
+        # Tile edges are straight lines only in EPSG:3857, so they are densified before being transformed
+        steps = np.linspace(0, 1, self._EDGE_POINTS, endpoint=False)
+        ring_x = np.concatenate([steps, np.ones_like(steps), 1 - steps, np.zeros_like(steps), [0]])
+        ring_y = np.concatenate([np.zeros_like(steps), steps, np.ones_like(steps), 1 - steps, [0]])
+        coords = np.empty((len(x0), 2 * len(ring_x)))
+        coords[:, 0::2] = x0[:, None] + tile_size * ring_x
+        coords[:, 1::2] = y1[:, None] - tile_size * ring_y
+
+        boundaries = gpd.GeoSeries(_ring_polygons(coords), crs='EPSG:3857')
+        return boundaries.to_crs(crs) if crs is not None else boundaries
+
+
+def tessellate(pois, tessellation, znorm=False, neighborhood=False, contents='list'):
+    """Constructs a grid from the given POIs over the cells of a tessellation.
+
+    This is the counterpart of `grid` for the tessellations of this module (`RectangularTessellation`,
+    `HexagonalTessellation` and `QuadkeyTessellation`), and produces the same scores. `pois` may also be an iterable of
+    POI GeoDataFrames, which are assigned to cells one at a time.
+
+    The constructed grid is represented by a GeoDataFrame where each row corresponds to a non-empty cell and contains
+    the columns `cell_id`, `score`, `score_nb`, `score_znorm`, `score_nb_znorm`, the points of the cell and `geometry`,
+    as described in `grid`. Since cell ids do not depend on the data, grids of separate runs or regions constructed
+    with the same tessellation can be merged on `cell_id`.
+
+    Args:
+        pois (GeoDataFrame): a POIs GeoDataFrame.
+        tessellation (Tessellation): The tessellation.
+        znorm (bool): Whether to include z-normalized scores (default: False).
+        neighborhood (bool): Whether to include a total score including adjacent cells (default: False).
+        contents (string): How to keep the points of each cell (`list`, `offsets` or `none`; default: `list`).
+
+    Returns:
+        A GeoDataFrame as described above.
+    """
+
+    t0 = time()
+
+    if contents not in ('list', 'offsets', 'none'):
+        raise ValueError("`contents` must be one of 'list', 'offsets' or 'none'.")
+
+    chunks = [pois] if isinstance(pois, pd.DataFrame) else pois
+
+    orig_crs = None
+    cell_ids = []
+    poi_ids = []
+    for chunk in chunks:
+        orig_crs = chunk.crs
+        cell_ids.append(tessellation.cells(chunk.geometry))
+        if contents != 'none':
+            poi_ids.append(chunk['id'].values)
+
+    cell_ids = np.concatenate(cell_ids)
+    order, unique_ids, starts, score, appearance = _group_cells(cell_ids)
+    del cell_ids
+
+    cells = pd.DataFrame({'cell_id': unique_ids[appearance], 'score': score[appearance]},
+                         index=pd.Index(unique_ids[appearance], name='cell_id'))
+    cols = ['cell_id', 'score']
+
+    if neighborhood is True:
+        # Look up the scores of the neighbors among the (sorted) non-empty cells
+        neighbors = tessellation.neighbors(unique_ids)
+        positions = np.minimum(np.searchsorted(unique_ids, neighbors), len(unique_ids) - 1)
+        nb_scores = np.where(unique_ids[positions] == neighbors, score[positions], 0)
+        cells['score_nb'] = (score + nb_scores.sum(axis=1))[appearance]
+        cols.append('score_nb')
+
+    if znorm:
+        cells['score_znorm'] = zscore(cells['score'])
+        cols.append('score_znorm')
+        if neighborhood is True:
+            cells['score_nb_znorm'] = zscore(cells['score_nb'])
+            cols.append('score_nb_znorm')
+
+    contents_ids = _add_contents(cells, cols, contents, poi_ids, order, starts, score, appearance)
+    del poi_ids, order
+
+    cells['geometry'] = tessellation.boundaries(unique_ids[appearance], orig_crs).values
+    cols.append('geometry')
+
+    cells = cells[cols]
+
+    gcells = gpd.GeoDataFrame(cells, crs=orig_crs, geometry=cells.geometry)
+    if contents_ids is not None:
+        gcells.attrs['contents'] = contents_ids
 
     print("Done in %0.3fs." % (time() - t0))
 
-    return gpois, num_columns, num_rows
+    return gcells
+
+
+def _expand_ranges(starts, ends):
+    """Returns the concatenation of the integer ranges `[starts[i], ends[i])`."""
+
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def _str_order(bounds, node_capacity):
+    """Returns the Sort-Tile-Recursive order of the given boxes: sorted by center x into vertical slices, each of which
+    is sorted by center y."""
+
+    if len(bounds) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    num_nodes = math.ceil(len(bounds) / node_capacity)
+    slice_size = math.ceil(math.sqrt(num_nodes)) * node_capacity
+
+    center_x = bounds[:, 0] + bounds[:, 2]
+    center_y = bounds[:, 1] + bounds[:, 3]
+    slices = np.empty(len(bounds), dtype=np.int64)
+    slices[np.argsort(center_x, kind='mergesort')] = np.arange(len(bounds)) // slice_size
+
+    return np.lexsort((center_y, slices))
+
+
+def _intersects_bbox(bounds, bbox):
+    """Returns a mask of the boxes intersecting the given bounding box."""
+
+    return ((bounds[:, 0] <= bbox[2]) & (bounds[:, 2] >= bbox[0]) & (bounds[:, 1] <= bbox[3]) &
+            (bounds[:, 3] >= bbox[1]))
+
+
+class SpatialIndex(object):
+    """A spatial index over the geometries of a GeoDataFrame.
+
+    The bounding boxes of the geometries are packed bottom-up in a Sort-Tile-Recursive (STR) tree, stored as one array
+    of boxes per level, which is searched one level at a time for all candidate nodes at once. Radius and nearest
+    neighbor queries (for points only) are served by a k-d tree over the coordinates, built on first use.
+
+    All queries return the (sorted) positions of the matching rows of the GeoDataFrame, to be used with `iloc`. Use
+    `get_spatial_index` to reuse a single index per GeoDataFrame.
+
+    Args:
+        gdf (GeoDataFrame): The GeoDataFrame to index.
+        node_capacity (int): The maximum number of children of each node (default: 16).
+    """
+
+    def __init__(self, gdf, node_capacity=16):
+        self.index = gdf.index
+        self.geometry = gdf.geometry.values
+        self._kd_tree = None
+
+        bounds = self.geometry.bounds
+        bounds[np.isnan(bounds[:, 0])] = [np.inf, np.inf, -np.inf, -np.inf]
+
+        # The leaf level holds the boxes of the geometries in STR order; each upper level holds the boxes of its nodes,
+        # also in STR order, along with the range of their children in the level below
+        self._order = _str_order(bounds, node_capacity)
+        self._levels = [(bounds[self._order], None, None)]
+        level_bounds = self._levels[0][0]
+        while len(level_bounds) > node_capacity:
+            starts = np.arange(0, len(level_bounds), node_capacity)
+            ends = np.minimum(starts + node_capacity, len(level_bounds))
+            node_bounds = np.column_stack([np.minimum.reduceat(level_bounds[:, 0], starts),
+                                           np.minimum.reduceat(level_bounds[:, 1], starts),
+                                           np.maximum.reduceat(level_bounds[:, 2], starts),
+                                           np.maximum.reduceat(level_bounds[:, 3], starts)])
+            node_order = _str_order(node_bounds, node_capacity)
+            level_bounds = node_bounds[node_order]
+            self._levels.append((level_bounds, starts[node_order], ends[node_order]))
+
+    def __len__(self):
+        return len(self._order)
+
+    def query_bbox(self, bbox):
+        """Returns the positions of the geometries whose bounding boxes intersect the given bounding box.
+
+        Args:
+            bbox (tuple): The bounding box `(minx, miny, maxx, maxy)`.
+
+        Returns:
+            A sorted integer array of positions.
+        """
+
+        candidates = np.arange(len(self._levels[-1][0]))
+        for level_bounds, starts, ends in reversed(self._levels[1:]):
+            nodes = candidates[_intersects_bbox(level_bounds[candidates], bbox)]
+            candidates = _expand_ranges(starts[nodes], ends[nodes])
+
+        leaves = candidates[_intersects_bbox(self._levels[0][0][candidates], bbox)]
+        return np.sort(self._order[leaves])
+
+    def query(self, geometry, predicate='intersects'):
+        """Returns the positions of the geometries satisfying a spatial predicate with the given geometry.
+
+        Args:
+            geometry (BaseGeometry): The query geometry (e.g., a polygon).
+            predicate (string): The predicate to be satisfied by each indexed geometry with respect to `geometry`,
+                i.e., any binary predicate of GeoSeries such as `intersects`, `within` or `contains` (default:
+                `intersects`).
+
+        Returns:
+            A sorted integer array of positions.
+        """
+
+        if predicate not in ('intersects', 'within', 'contains', 'covers', 'covered_by', 'touches', 'crosses',
+                             'overlaps'):
+            raise ValueError('Unsupported `predicate`: %s.' % predicate)
+
+        candidates = self.query_bbox(geometry.bounds)
+        if len(candidates) == 0:
+            return candidates
+
+        matches = getattr(gpd.GeoSeries(self.geometry[candidates]), predicate)(geometry)
+        return candidates[matches.values]
+
+    def _points(self):
+        if self._kd_tree is None:
+            if len(self.geometry) > 0 and not (self.geometry.geom_type == 'Point').all():
+                raise ValueError('Radius and nearest neighbor queries are only supported for points.')
+            self._kd_tree = cKDTree(np.column_stack([self.geometry.x, self.geometry.y]))
+
+        return self._kd_tree
+
+    def within_distance(self, x, y, radius):
+        """Returns the positions of the points within distance `radius` from the given location(s).
+
+        Args:
+            x (float or array): The x coordinate(s) of the location(s).
+            y (float or array): The y coordinate(s) of the location(s).
+            radius (float or array): The distance (for all locations, or per location).
+
+        Returns:
+            A sorted integer array of positions, or a list of such arrays (one per location) if `x` and `y` are arrays.
+        """
+
+        tree = self._points()
+        if np.ndim(x) == 0:
+            return np.array(sorted(tree.query_ball_point([x, y], radius)), dtype=np.int64)
+
+        neighbors = tree.query_ball_point(np.column_stack([x, y]), radius)
+        return [np.array(sorted(positions), dtype=np.int64) for positions in neighbors]
+
+    def pairs_within_distance(self, x, y, radius):
+        """Returns all pairs of a location and a point within distance `radius` from each other.
+
+        Args:
+            x (array): The x coordinates of the locations.
+            y (array): The y coordinates of the locations.
+            radius (float): The distance.
+
+        Returns:
+            The positions of the locations, the positions of the points and their distances, as arrays sorted by
+            location and distance.
+        """
+
+        tree = self._points()
+        pairs = cKDTree(np.column_stack([x, y])).sparse_distance_matrix(tree, radius, output_type='ndarray')
+        order = np.lexsort((pairs['j'], pairs['v'], pairs['i']))
+
+        return (pairs['i'][order].astype(np.int64), pairs['j'][order].astype(np.int64),
+                pairs['v'][order].astype(float))
+
+    def nearest(self, x, y, k=1):
+        """Returns the `k` points nearest to the given location(s).
+
+        Args:
+            x (float or array): The x coordinate(s) of the location(s).
+            y (float or array): The y coordinate(s) of the location(s).
+            k (int): The number of neighbors (default: 1).
+
+        Returns:
+            The distances and the positions of the neighbors, in increasing distance, as arrays of shape `(k,)`, or
+            `(len(x), k)` if `x` and `y` are arrays. If there are fewer than `k` points, missing neighbors have
+            infinite distance and position -1.
+        """
+
+        tree = self._points()
+        distances, positions = tree.query(np.column_stack([np.atleast_1d(x), np.atleast_1d(y)]), k=k)
+        distances = distances.reshape(-1, k)
+        positions = np.where(np.isinf(distances), -1, positions.reshape(-1, k))
+        if np.ndim(x) == 0:
+            return distances[0], positions[0]
+
+        return distances, positions
+
+
+def get_spatial_index(gdf):
+    """Returns the spatial index of a GeoDataFrame, building it on first use.
+
+    The index is kept on the GeoDataFrame itself and reused by subsequent calls, as long as the GeoDataFrame has the
+    same index and geometries (copies and subsets get their own index).
+
+    Args:
+        gdf (GeoDataFrame): A GeoDataFrame.
+
+    Returns:
+        A SpatialIndex over the geometries of `gdf`.
+    """
+
+    sindex = getattr(gdf, '_spatial_index', None)
+    if sindex is None or sindex.index is not gdf.index or sindex.geometry is not gdf.geometry.values:
+        sindex = SpatialIndex(gdf)
+        gdf._spatial_index = sindex
+
+    return sindex
@@ -1,46 +1,79 @@
+import numpy as np
 import pandas as pd
-from shapely.geometry import Point
 import geopandas as gpd
-import math
 import osmnx
 import requests
+import hashlib
+import os
 from io import BytesIO
+from itertools import chain
 from zipfile import ZipFile
+from shapely import vectorized
+from loci.analytics import KwdsEncoding, get_kwds_encoding
 
 
-def read_poi_csv(input_file, col_id='id', col_name='name', col_lon='lon', col_lat='lat', col_kwds='kwds', col_sep=';',
-                 kwds_sep=',', source_crs='EPSG:4326', target_crs='EPSG:4326', keep_other_cols=False):
-    """Creates a POI GeoDataFrame from an input CSV file.
+def _valid_lon_lat(pois, col_lon, col_lat):
+    """Parses the coordinate columns of a DataFrame as float arrays.
 
     Args:
-        input_file (string): Path to the input csv file.
-        col_id (string): Name of the column containing the POI id (default: `id`).
-        col_name (string): Name of the column containing the POI name (default: `name`).
-        col_lon (string): Name of the column containing the POI longitude (default: `lon`).
-        col_lat (string): Name of the column containing the POI latitude (default: `lat`).
-        col_kwds (string): Name of the column containing the POI keywords (default: `kwds`).
-        col_sep (string): Column delimiter (default: `;`).
-        kwds_sep (string): Keywords delimiter (default: `,`).
-        source_crs (string): Coordinate Reference System of input data (default: `EPSG:4326`).
-        target_crs (string): Coordinate Reference System of the GeoDataFrame to be created (default: `EPSG:4326`).
-        keep_other_cols (bool): Whether to keep the rest of the columns in the csv file (default: `False`).
+        pois (DataFrame): A DataFrame with coordinate columns.
+        col_lon (string): Name of the column containing the longitude.
+        col_lat (string): Name of the column containing the latitude.
 
     Returns:
-        A POI GeoDataFrame with columns `id`, `name` and `kwds`.
+        The longitude and latitude arrays, and a boolean mask of the rows with valid coordinates.
     """
 
-    def lon_lat_to_point(row, c_lon, c_lat):
-        try:
-            x_lon = float(row[c_lon])
-            y_lat = float(row[c_lat])
-            if math.isnan(x_lon) is False and math.isnan(y_lat) is False:
-                return Point(x_lon, y_lat)
-            else:
-                return float('NaN')
-        except:
-            return float('NaN')
+    x_lon = pd.to_numeric(pois[col_lon], errors='coerce').values.astype(float)
+    y_lat = pd.to_numeric(pois[col_lat], errors='coerce').values.astype(float)
+    mask = ~(np.isnan(x_lon) | np.isnan(y_lat))
+
+    return x_lon, y_lat, mask
+
+
+def _bound_mask(x, y, mask, bound):
+    """Restricts a mask of valid coordinates to the points intersecting a polygon.
+
+    The points are first filtered by the bounding box of the polygon on the raw coordinate arrays, and only the
+    remaining points are tested against the polygon itself (with prepared geometries).
+
+    Args:
+        x (array): The x coordinates.
+        y (array): The y coordinates.
+        mask (array): A boolean mask of the points to be considered.
+        bound (polygon): The polygon.
+
+    Returns:
+        A boolean mask of the points in `mask` that intersect `bound`.
+    """
+
+    minx, miny, maxx, maxy = bound.bounds
+    candidates = np.flatnonzero(mask & (x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy))
+
+    x = x[candidates]
+    y = y[candidates]
+    inside = vectorized.contains(bound, x, y)
+
+    # Points on the boundary of the polygon also intersect it; only points very close to it need to be checked
+    outside = np.flatnonzero(~inside)
+    near = outside[vectorized.contains(bound.buffer(1e-9 * max(maxx - minx, maxy - miny)), x[outside], y[outside])]
+    inside[near] = vectorized.touches(bound, x[near], y[near])
+
+    mask = np.zeros(len(mask), dtype=bool)
+    mask[candidates[inside]] = True
+
+    return mask
+
+
+def _poi_gdf(pois, col_id, col_name, col_lon, col_lat, col_kwds, kwds_sep, source_crs, target_crs, keep_other_cols,
+             encode_kwds, bound=None):
+    """Converts a DataFrame read from a POI CSV file to a POI GeoDataFrame, skipping rows with errors and, if `bound`
+    is provided, rows outside `bound`.
+
+    Returns:
+        A POI GeoDataFrame and the number of skipped rows.
+    """
 
-    pois = pd.read_csv(input_file, delimiter=col_sep, error_bad_lines=False)
     init_poi_size = pois.index.size
 
     columns = list(pois)
@@ -56,32 +89,245 @@ def read_poi_csv(input_file, col_id='id', col_name='name', col_lon='lon', col_la
         if col_kwds in columns:
             subset_cols.append(col_kwds)
 
-    # Geometry Column(Uncleaned)
-    pois['geometry'] = pois.apply(lambda row: lon_lat_to_point(row, col_lon, col_lat), axis=1)
-    subset_cols.append('geometry')
+    # Drop all N/A, Null rows and rows with invalid coordinates, as well as columns not in subset columns.
+    x_lon, y_lat, mask = _valid_lon_lat(pois, col_lon, col_lat)
+    mask &= pois[subset_cols].notnull().all(axis=1).values
+    skipped = init_poi_size - np.count_nonzero(mask)
 
-    # Drop Columns Not in subset Columns.
-    drop_columns = set(columns) - set(subset_cols)
-    pois.drop(drop_columns, inplace=True, axis=1)
+    if bound is not None:
+        mask = _bound_mask(x_lon, y_lat, mask, bound)
 
-    # Drop all N/A, Null rows from DataFrame.
-    pois.dropna(inplace=True)
-    if init_poi_size - pois.index.size > 0:
-        print("Skipped", (init_poi_size - pois.index.size), "rows due to errors.")
+    keep_cols = [col for col in columns if col in subset_cols and col not in (col_lon, col_lat)]
+    pois = pois.loc[mask, keep_cols]
 
+    encoding = None
     if col_kwds in columns:
-        pois[col_kwds] = pois[col_kwds].map(lambda s: s.split(kwds_sep))
+        if encode_kwds:
+            encoding = KwdsEncoding.from_strings(pois[col_kwds], kwds_sep, col_kwds)
+            pois = pois.drop(columns=[col_kwds])
+        else:
+            pois[col_kwds] = pois[col_kwds].map(lambda s: s.split(kwds_sep))
 
     source_crs = {'init': source_crs}
     target_crs = {'init': target_crs}
-    pois = gpd.GeoDataFrame(pois, crs=source_crs, geometry=pois['geometry']).to_crs(target_crs).drop(columns=[col_lon,
-                                                                                                              col_lat])
+    pois = gpd.GeoDataFrame(pois, crs=source_crs, geometry=gpd.points_from_xy(x_lon[mask], y_lat[mask]))
+    pois = pois.to_crs(target_crs)
+
+    if encoding is not None:
+        encoding.attach(pois)
+
+    return pois, skipped
+
+
+def _poi_cache_file(cache_dir, input_file, loader_args):
+    """Returns the path of the cache file for a POI CSV file loaded with the given arguments.
+
+    The cache key covers the path, modification time and size of the input file, as well as the loader arguments.
+    """
+
+    stat = os.stat(input_file)
+    key = repr((os.path.abspath(input_file), stat.st_mtime_ns, stat.st_size) + tuple(loader_args))
+    key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    return os.path.join(cache_dir, 'pois-' + key + '.feather')
+
+
+def _write_feather(df, path):
+    """Writes a DataFrame to a Feather file through a temporary file, so that an interrupted write never leaves a
+    truncated file at `path`."""
+
+    tmp_file = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        df.to_feather(tmp_file)
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _write_poi_cache(pois, cache_file, col_kwds):
+    """Stores a POI GeoDataFrame in a Feather file.
+
+    The geometries are stored as coordinate columns. The keywords are flattened into a dictionary encoded column of a
+    separate Feather file, and the keywords column of the main file holds the offset of the first keyword of each POI.
+    The main file is written last, so it only exists along with a complete keywords file.
+    """
+
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+
+    df = pd.DataFrame(pois.drop(columns=pois.geometry.name))
+    df['__index'] = pois.index.values
+    df['__x'] = pois.geometry.x.values
+    df['__y'] = pois.geometry.y.values
+
+    encoding = get_kwds_encoding(pois, col_kwds)
+    if encoding is not None:
+        df[col_kwds] = encoding.offsets[:-1]
+        kwds = pd.Categorical.from_codes(encoding.codes, encoding.vocabulary)
+        _write_feather(pd.DataFrame({col_kwds: kwds}), cache_file + '.kwds')
+    elif col_kwds in df.columns:
+        lengths = df[col_kwds].map(len).values
+        df[col_kwds] = np.cumsum(lengths) - lengths
+        kwds = pd.Categorical(list(chain.from_iterable(pois[col_kwds])))
+        _write_feather(pd.DataFrame({col_kwds: kwds}), cache_file + '.kwds')
+
+    _write_feather(df.reset_index(drop=True), cache_file)
+
+
+def _split_kwds(flat_kwds, offsets):
+    """Splits a flat array of keywords into a list of keywords per row, given the offset of the first keyword of each
+    row and the total number of keywords.
+
+    The rows are grouped by their number of keywords, so that the lists of each group are built at once from a 2D
+    array instead of slicing per row.
+    """
+
+    lengths = np.diff(offsets)
+    order = np.argsort(lengths, kind='stable')
+    sorted_lengths = lengths[order]
+    bounds = np.flatnonzero(np.diff(sorted_lengths)) + 1
+
+    kwds = []
+    for rows in np.split(order, bounds):
+        if len(rows) > 0:
+            positions = offsets[rows][:, np.newaxis] + np.arange(lengths[rows[0]])
+            kwds += flat_kwds[positions].tolist()
+
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+
+    return list(map(kwds.__getitem__, inverse.tolist()))
+
+
+def _read_poi_cache(cache_file, col_kwds, crs, encode_kwds):
+    """Loads a POI GeoDataFrame stored by `_write_poi_cache`."""
+
+    df = pd.read_feather(cache_file)
+
+    encoding = None
+    if col_kwds in df.columns:
+        kwds = pd.read_feather(cache_file + '.kwds')[col_kwds].astype('category')
+        vocabulary = np.asarray(kwds.cat.categories, dtype=object)
+        codes = kwds.cat.codes.values.astype(np.int32)
+        offsets = np.append(df[col_kwds].values, len(codes)).astype(np.int64)
+        if encode_kwds:
+            encoding = KwdsEncoding(vocabulary, offsets, codes, col_kwds)
+            df.drop(columns=[col_kwds], inplace=True)
+        else:
+            df[col_kwds] = _split_kwds(vocabulary[codes], offsets)
+
+    geometry = gpd.points_from_xy(df['__x'].values, df['__y'].values)
+    df.index = df['__index'].values
+    df.drop(columns=['__index', '__x', '__y'], inplace=True)
+
+    pois = gpd.GeoDataFrame(df, crs={'init': crs}, geometry=geometry)
+    if encoding is not None:
+        encoding.attach(pois)
+
+    return pois
+
+
+def read_poi_csv(input_file, col_id='id', col_name='name', col_lon='lon', col_lat='lat', col_kwds='kwds', col_sep=';',
+                 kwds_sep=',', source_crs='EPSG:4326', target_crs='EPSG:4326', keep_other_cols=False, cache_dir=None,
+                 encode_kwds=False, bound=None):
+    """Creates a POI GeoDataFrame from an input CSV file.
+
+    If `bound` is provided, only the POIs intersecting it are loaded. The filter is applied on the raw coordinates,
+    before any geometries are constructed, so `bound` must be in `source_crs`.
+
+    If `cache_dir` is provided, the created GeoDataFrame is also stored there in the Feather columnar format (requires
+    `pyarrow`, installed with `pip install loci[cache]`). Subsequent calls with the same arguments, as long as the
+    input file is not modified, load the GeoDataFrame from the cache without parsing the CSV file.
+
+    Args:
+        input_file (string): Path to the input csv file.
+        col_id (string): Name of the column containing the POI id (default: `id`).
+        col_name (string): Name of the column containing the POI name (default: `name`).
+        col_lon (string): Name of the column containing the POI longitude (default: `lon`).
+        col_lat (string): Name of the column containing the POI latitude (default: `lat`).
+        col_kwds (string): Name of the column containing the POI keywords (default: `kwds`).
+        col_sep (string): Column delimiter (default: `;`).
+        kwds_sep (string): Keywords delimiter (default: `,`).
+        source_crs (string): Coordinate Reference System of input data (default: `EPSG:4326`).
+        target_crs (string): Coordinate Reference System of the GeoDataFrame to be created (default: `EPSG:4326`).
+        keep_other_cols (bool): Whether to keep the rest of the columns in the csv file (default: `False`).
+        cache_dir (string): Path to a directory for caching the created GeoDataFrame (default: None, no caching).
+        encode_kwds (bool): Whether to store the keywords in a compact dictionary encoding attached to the
+            GeoDataFrame instead of the keywords column (see `analytics.KwdsEncoding`; default: `False`).
+        bound (polygon): A polygon to be used as filter, in `source_crs` (default: None).
+
+    Returns:
+        A POI GeoDataFrame with columns `id`, `name` and `kwds`.
+    """
+
+    if cache_dir is not None:
+        cache_file = _poi_cache_file(cache_dir, input_file, (col_id, col_name, col_lon, col_lat, col_kwds, col_sep,
+                                                             kwds_sep, source_crs, target_crs, keep_other_cols,
+                                                             bound.wkb_hex if bound is not None else None))
+        if os.path.isfile(cache_file):
+            pois = _read_poi_cache(cache_file, col_kwds, target_crs, encode_kwds)
+            print('Loaded ' + str(len(pois.index)) + ' POIs from cache.')
+            return pois
+
+    pois = pd.read_csv(input_file, delimiter=col_sep, error_bad_lines=False)
+    pois, skipped = _poi_gdf(pois, col_id, col_name, col_lon, col_lat, col_kwds, kwds_sep, source_crs, target_crs,
+                             keep_other_cols, encode_kwds, bound)
+    if skipped > 0:
+        print("Skipped", skipped, "rows due to errors.")
+
+    if cache_dir is not None:
+        _write_poi_cache(pois, cache_file, col_kwds)
 
     print('Loaded ' + str(len(pois.index)) + ' POIs.')
 
     return pois
 
 
+def iter_poi_csv(input_file, chunksize=100000, col_id='id', col_name='name', col_lon='lon', col_lat='lat',
+                 col_kwds='kwds', col_sep=';', kwds_sep=',', source_crs='EPSG:4326', target_crs='EPSG:4326',
+                 keep_other_cols=False, encode_kwds=False, bound=None):
+    """Reads an input CSV file in chunks, yielding a POI GeoDataFrame per chunk.
+
+    Each chunk is cleaned, has its keywords split and is reprojected exactly as in `read_poi_csv`, so that files
+    larger than memory can be processed with a fixed memory budget (e.g., by passing the chunks to `kwds_freq` or
+    `grid`). Row indices are unique across chunks.
+
+    Args:
+        input_file (string): Path to the input csv file.
+        chunksize (integer): Number of csv rows per chunk (default: 100000).
+        col_id (string): Name of the column containing the POI id (default: `id`).
+        col_name (string): Name of the column containing the POI name (default: `name`).
+        col_lon (string): Name of the column containing the POI longitude (default: `lon`).
+        col_lat (string): Name of the column containing the POI latitude (default: `lat`).
+        col_kwds (string): Name of the column containing the POI keywords (default: `kwds`).
+        col_sep (string): Column delimiter (default: `;`).
+        kwds_sep (string): Keywords delimiter (default: `,`).
+        source_crs (string): Coordinate Reference System of input data (default: `EPSG:4326`).
+        target_crs (string): Coordinate Reference System of the GeoDataFrames to be created (default: `EPSG:4326`).
+        keep_other_cols (bool): Whether to keep the rest of the columns in the csv file (default: `False`).
+        encode_kwds (bool): Whether to store the keywords of each chunk in a compact dictionary encoding attached to
+            it instead of the keywords column (see `analytics.KwdsEncoding`; default: `False`).
+        bound (polygon): A polygon to be used as filter, in `source_crs` (default: None).
+
+    Yields:
+        POI GeoDataFrames with columns `id`, `name` and `kwds`.
+    """
+
+    total_skipped = 0
+    total_loaded = 0
+    for chunk in pd.read_csv(input_file, delimiter=col_sep, error_bad_lines=False, chunksize=chunksize):
+        pois, skipped = _poi_gdf(chunk, col_id, col_name, col_lon, col_lat, col_kwds, kwds_sep, source_crs,
+                                 target_crs, keep_other_cols, encode_kwds, bound)
+        total_skipped += skipped
+        total_loaded += len(pois.index)
+        yield pois
+
+    if total_skipped > 0:
+        print("Skipped", total_skipped, "rows due to errors.")
+
+    print('Loaded ' + str(total_loaded) + ' POIs.')
+
+
 def import_osmnx(bound, target_crs='EPSG:4326'):
     """Creates a POI GeoDataFrame from POIs retrieved by OSMNX (https://github.com/gboeing/osmnx).
 
@@ -120,27 +366,24 @@ def import_osmnx(bound, target_crs='EPSG:4326'):
     return pois
 
 
-def import_osmwrangle(osmwrangle_file, target_crs='EPSG:4326', bound=None):
-    """Creates a POI GeoDataFrame from a file produced by OSMWrangle (https://github.com/SLIPO-EU/OSMWrangle).
+def _open_osmwrangle(osmwrangle_file):
+    """Returns a readable source for a path or URL to a file produced by OSMWrangle."""
 
-    Args:
-        osmwrangle_file (string): Path or URL to the input csv file.
-        target_crs (string): Coordinate Reference System of the GeoDataFrame to be created (default: `EPSG:4326`).
-        bound (polygon): A polygon to be used as filter.
+    if osmwrangle_file.startswith('http') and osmwrangle_file.endswith('.zip'):
+        response = requests.get(osmwrangle_file)
+        zip_file = ZipFile(BytesIO(response.content))
+        return zip_file.open(zip_file.namelist()[0])
+
+    return open(osmwrangle_file, 'rb')
+
+
+def _osmwrangle_gdf(pois, target_crs, bound, encode_kwds):
+    """Converts a DataFrame read from an OSMWrangle file to a POI GeoDataFrame, skipping rows with errors.
 
     Returns:
-        A POI GeoDataFrame with columns `id`, `name` and `kwds`.
+        A POI GeoDataFrame and the number of skipped rows.
     """
 
-    def lon_lat_to_point(row, c_lon, c_lat):
-        x_lon = float(row[c_lon])
-        y_lat = float(row[c_lat])
-        if math.isnan(x_lon) is False and math.isnan(y_lat) is False:
-            return Point(x_lon, y_lat)
-        else:
-            return float('NaN')
-
-    col_sep = '|'
     col_id = 'ID'
     col_lon = 'LON'
     col_lat = 'LAT'
@@ -149,54 +392,100 @@ def import_osmwrangle(osmwrangle_file, target_crs='EPSG:4326', bound=None):
     col_subcat = 'SUBCATEGORY'
     source_crs = {'init': 'EPSG:4326'}
 
-    # Load the file
-    if osmwrangle_file.startswith('http') and osmwrangle_file.endswith('.zip'):
-        response = requests.get(osmwrangle_file)
-        zip_file = ZipFile(BytesIO(response.content))
-        with zip_file.open(zip_file.namelist()[0]) as csvfile:
-            pois = pd.read_csv(csvfile, delimiter=col_sep, error_bad_lines=False)
-    else:
-        pois = pd.read_csv(osmwrangle_file, delimiter=col_sep, error_bad_lines=False)
-
     init_poi_size = pois.index.size
 
-    columns = list(pois)
-
-    subset_cols = [col_id, col_name, 'kwds', col_lon, col_lat]
-
-    # Geometry Column(Uncleaned)
-    pois['geometry'] = pois.apply(lambda row: lon_lat_to_point(row, col_lon, col_lat), axis=1)
-    subset_cols.append('geometry')
+    # Drop all N/A, Null rows and rows with invalid coordinates, as well as columns not in subset columns.
+    x_lon, y_lat, mask = _valid_lon_lat(pois, col_lon, col_lat)
+    mask &= pois[[col_id, col_name, col_cat, col_subcat]].notnull().all(axis=1).values
+    skipped = init_poi_size - np.count_nonzero(mask)
 
-    pois['kwds'] = pois[col_cat] + ',' + pois[col_subcat]
-    pois['kwds'] = pois['kwds'].map(lambda s: s.split(','))
-
-    # Drop Columns Not in subset Columns.
-    drop_columns = set(columns) - set(subset_cols)
-    pois.drop(drop_columns, inplace=True, axis=1)
+    # Check whether location filter should be applied
+    if bound is not None:
+        mask = _bound_mask(x_lon, y_lat, mask, bound)
 
-    # Drop all N/A, Null rows from DataFrame.
-    pois.dropna(inplace=True)
-    if init_poi_size - pois.index.size > 0:
-        print("Skipped", (init_poi_size - pois.index.size), "rows due to errors.")
+    pois = pois.loc[mask, [col_id, col_name, col_cat, col_subcat]]
+    kwds = pois[col_cat] + ',' + pois[col_subcat]
 
-    pois = pois.rename(columns={col_id: 'id', col_name: 'name'})
-    pois = gpd.GeoDataFrame(pois, crs=source_crs, geometry=pois['geometry']).drop(columns=[col_lon, col_lat])
+    pois = pois[[col_id, col_name]].rename(columns={col_id: 'id', col_name: 'name'})
+    pois = gpd.GeoDataFrame(pois, crs=source_crs, geometry=gpd.points_from_xy(x_lon[mask], y_lat[mask]))
 
-    # Check whether location filter should be applied
-    if bound is not None:
-        spatial_filter = pois.geometry.intersects(bound)
-        pois = pois[spatial_filter]
+    # The keywords column follows the geometry column, as in the files loaded row by row
+    encoding = None
+    if encode_kwds:
+        encoding = KwdsEncoding.from_strings(kwds, ',', 'kwds')
+    else:
+        pois['kwds'] = kwds.map(lambda s: s.split(',')).values
 
     if target_crs != 'EPSG:4326':
         target_crs = {'init': target_crs}
         pois = pois.to_crs(target_crs)
 
+    if encoding is not None:
+        encoding.attach(pois)
+
+    return pois, skipped
+
+
+def import_osmwrangle(osmwrangle_file, target_crs='EPSG:4326', bound=None, encode_kwds=False):
+    """Creates a POI GeoDataFrame from a file produced by OSMWrangle (https://github.com/SLIPO-EU/OSMWrangle).
+
+    Args:
+        osmwrangle_file (string): Path or URL to the input csv file.
+        target_crs (string): Coordinate Reference System of the GeoDataFrame to be created (default: `EPSG:4326`).
+        bound (polygon): A polygon to be used as filter.
+        encode_kwds (bool): Whether to store the keywords in a compact dictionary encoding attached to the
+            GeoDataFrame instead of the keywords column (see `analytics.KwdsEncoding`; default: `False`).
+
+    Returns:
+        A POI GeoDataFrame with columns `id`, `name` and `kwds`.
+    """
+
+    # Load the file
+    with _open_osmwrangle(osmwrangle_file) as csvfile:
+        pois = pd.read_csv(csvfile, delimiter='|', error_bad_lines=False)
+
+    pois, skipped = _osmwrangle_gdf(pois, target_crs, bound, encode_kwds)
+    if skipped > 0:
+        print("Skipped", skipped, "rows due to errors.")
+
     print('Loaded ' + str(len(pois.index)) + ' POIs.')
 
     return pois
 
 
+def iter_osmwrangle(osmwrangle_file, chunksize=100000, target_crs='EPSG:4326', bound=None, encode_kwds=False):
+    """Reads a file produced by OSMWrangle (https://github.com/SLIPO-EU/OSMWrangle) in chunks, yielding a POI
+    GeoDataFrame per chunk.
+
+    Each chunk is processed exactly as in `import_osmwrangle`.
+
+    Args:
+        osmwrangle_file (string): Path or URL to the input csv file.
+        chunksize (integer): Number of csv rows per chunk (default: 100000).
+        target_crs (string): Coordinate Reference System of the GeoDataFrames to be created (default: `EPSG:4326`).
+        bound (polygon): A polygon to be used as filter.
+        encode_kwds (bool): Whether to store the keywords of each chunk in a compact dictionary encoding attached to
+            it instead of the keywords column (see `analytics.KwdsEncoding`; default: `False`).
+
+    Yields:
+        POI GeoDataFrames with columns `id`, `name` and `kwds`.
+    """
+
+    total_skipped = 0
+    total_loaded = 0
+    with _open_osmwrangle(osmwrangle_file) as csvfile:
+        for chunk in pd.read_csv(csvfile, delimiter='|', error_bad_lines=False, chunksize=chunksize):
+            pois, skipped = _osmwrangle_gdf(chunk, target_crs, bound, encode_kwds)
+            total_skipped += skipped
+            total_loaded += len(pois.index)
+            yield pois
+
+    if total_skipped > 0:
+        print("Skipped", total_skipped, "rows due to errors.")
+
+    print('Loaded ' + str(total_loaded) + ' POIs.')
+
+
 def retrieve_osm_loc(name, buffer_dist=0):
     """Retrieves a polygon from an OSM location.
 
@@ -6,7 +6,8 @@ import matplotlib.pyplot as plt
 import folium
 from folium.plugins import HeatMap
 from folium.plugins import MarkerCluster
-from loci.analytics import bbox, kwds_freq
+from loci.analytics import bbox, kwds_freq, kwds_profile
+from loci.index import get_spatial_index
 from wordcloud import WordCloud
 from pysal.viz.mapclassify import Natural_Breaks
 from pandas import DataFrame, concat
@@ -128,7 +129,8 @@ def barchart(data, orientation='Vertical', x_axis_label='', y_axis_label='', plo
     """Plots a bar chart with the given data.
 
     Args:
-        data (dict): The data to plot.
+        data (dict): The data to plot (e.g., keyword frequencies as returned by `analytics.kwds_freq` or
+            `analytics.KwdsProfile.freq`).
         orientation (string): The orientation of the bars in the plot (`Vertical` or `Horizontal`; default: `Vertical`).
         x_axis_label (string): Label of x axis.
         y_axis_label (string): Label of y axis.
@@ -174,18 +176,26 @@ def barchart(data, orientation='Vertical', x_axis_label='', y_axis_label='', plo
     return plt
 
 
-def plot_wordcloud(pois, bg_color='black', width=400, height=200):
+def plot_wordcloud(pois, bg_color='black', width=400, height=200, col_group=None, group=None):
     """Generates and plots a word cloud from the keywords of the given POIs.
 
+    If `col_group` and `group` are provided, only the keywords of the POIs in that group (e.g., a cluster) are used,
+    taken from the keyword profile of the groups (see `analytics.kwds_profile`), which is computed once for all groups.
+
      Args:
         pois (GeoDataFrame): The POIs from which the keywords will be used to generate the word cloud.
         bg_color (string): The background color to use for the plot (default: black).
         width (int): The width of the plot.
         height (int): The height of the plot.
+        col_group (string): The column containing the group label of each POI, e.g., `cluster_id` (default: None).
+        group: The label of the group whose keywords will be used (default: None).
     """
 
     # Compute keyword frequences
-    kf = kwds_freq(pois)
+    if col_group is not None and group is not None:
+        kf = kwds_profile(pois, col_group).freq(group)
+    else:
+        kf = kwds_freq(pois)
 
     # Generate the word cloud
     wordcloud = WordCloud(background_color=bg_color, width=width, height=height).generate_from_frequencies(kf)
@@ -359,7 +369,7 @@ def map_cluster_diff(clusters_a, clusters_b, intersection_color='#00ff00', diff_
     if clusters_b.crs['init'] != '4326':
         clusters_b = clusters_b.to_crs({'init': 'epsg:4326'})
 
-    spatial_index_b = clusters_b.sindex
+    spatial_index_b = get_spatial_index(clusters_b)
     prev_size_list = []
     prev_cid_list = []
 
@@ -386,7 +396,7 @@ def map_cluster_diff(clusters_a, clusters_b, intersection_color='#00ff00', diff_
         prev_cid_list.append(cid)
         prev_size_list.append(size)
 
-        possible_matches_index = list(spatial_index_b.intersection(poly.bounds))
+        possible_matches_index = spatial_index_b.query_bbox(poly.bounds)
         possible_matches = clusters_b.iloc[possible_matches_index]
 
         max_area = 0.0
@@ -433,7 +443,7 @@ def map_cluster_diff(clusters_a, clusters_b, intersection_color='#00ff00', diff_
             diff_ab_polygs_attr.append('A(' + str(cid) + ') - B(' + str(max_cid_intersect) + ')')
             diff_ba_polygs_attr.append('B(' + str(max_cid_intersect) + ') - A(' + str(cid) + ')')
 
-    spatial_index_a = clusters_a.sindex
+    spatial_index_a = get_spatial_index(clusters_a)
     old_polys = []
     old_poly_attr = []
 
@@ -441,7 +451,7 @@ def map_cluster_diff(clusters_a, clusters_b, intersection_color='#00ff00', diff_
         poly = row['geometry']
         cid = row['cluster_id']
 
-        possible_matches_index = list(spatial_index_a.intersection(poly.bounds))
+        possible_matches_index = spatial_index_a.query_bbox(poly.bounds)
         possible_matches = clusters_a.iloc[possible_matches_index]
 
         max_area = 0.0
@@ -4,6 +4,7 @@ from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
 from sklearn.model_selection import GridSearchCV
 import pyLDAvis.sklearn
+from loci.analytics import kwds_profile
 
 
 def topic_modeling(clusters, label_col='cluster_id', kwds_col='kwds', num_of_topics=3, kwds_per_topic=10):
@@ -21,18 +22,14 @@ def topic_modeling(clusters, label_col='cluster_id', kwds_col='kwds', num_of_top
           assignments.
     """
 
-    # Create a "document" for each cluster
-    cluster_kwds = dict()
-    for index, row in clusters.iterrows():
-        cluster_id, kwds = row[label_col], row[kwds_col]
-        if cluster_id not in cluster_kwds:
-            cluster_kwds[cluster_id] = ''
-        for w in kwds:
-            cluster_kwds[cluster_id] += w + ' '
-
-    # Vectorize the corpus
     vectorizer = CountVectorizer()
-    corpus_vectorized = vectorizer.fit_transform(cluster_kwds.values())
+
+    # Vectorize the corpus by mapping each keyword of the keyword profile of the clusters to the terms it consists of
+    profile = kwds_profile(clusters, label_col, kwds_col)
+    used = np.flatnonzero(profile.counts.getnnz(axis=0))
+    kwd_terms = vectorizer.fit_transform(profile.vocabulary[used])
+    corpus_vectorized = profile.counts[:, used].dot(kwd_terms)
+    cluster_names = profile.groups
 
     # Extract the topics
     search_params = {'n_components': [num_of_topics]}
@@ -58,7 +55,6 @@ def topic_modeling(clusters, label_col='cluster_id', kwds_col='kwds', num_of_top
     # Topics per cluster
     lda_output = lda_model.transform(corpus_vectorized)
     topic_names = ["Topic" + str(i) for i in range(lda_model.n_components)]
-    cluster_names = cluster_kwds.keys()
     cluster_topics = pd.DataFrame(np.round(lda_output, 2), columns=topic_names, index=cluster_names).sort_index()
     dominant_topic = np.argmax(cluster_topics.values, axis=1)
     cluster_topics['Dominant Topic'] = dominant_topic
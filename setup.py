@@ -8,5 +8,6 @@ setup(
    author_email='pkalampokis@athenarc.gr, dskoutas@athenarc.gr',
    packages=['loci'],
    install_requires=['geopandas', 'shapely', 'pandas', 'numpy', 'matplotlib', 'folium', 'scikit-learn', 'hdbscan',
-                     'scipy', 'networkx', 'wordcloud', 'pysal', 'pyLDAvis', 'mlxtend', 'osmnx', 'requests', 'zipfile']
+                     'scipy', 'networkx', 'wordcloud', 'pysal', 'pyLDAvis', 'osmnx', 'requests', 'zipfile'],
+   extras_require={'cache': ['pyarrow']}
 )
@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+from shapely.geometry import GeometryCollection
+from loci.analytics import (decode_kwds, encode_kwds, filter_by_kwd, freq_locationsets, get_kwds_encoding,
+                            kwds_freq, KeywordIndex)
+
+
+def _pois():
+    kwds = [['cafe', 'food'], ['Museum'], [], ['bakery', 'food', 'shop'], ['cafe'], ['food']]
+    geometry = gpd.points_from_xy(range(len(kwds)), range(len(kwds)))
+    return gpd.GeoDataFrame({'id': range(len(kwds)), 'kwds': kwds}, geometry=geometry)
+
+
+def test_encode_kwds_drops_column():
+    pois = _pois()
+    expected = kwds_freq(pois)
+
+    encoding = encode_kwds(pois)
+    assert 'kwds' not in pois.columns
+    assert get_kwds_encoding(pois) is encoding
+    assert kwds_freq(pois) == expected
+
+    decode_kwds(pois)
+    assert pois['kwds'].tolist() == _pois()['kwds'].tolist()
+    assert get_kwds_encoding(pois) is encoding
+
+
+def test_encode_kwds_stale_column():
+    pois = _pois()
+    encode_kwds(pois, drop=False)
+    assert get_kwds_encoding(pois) is not None
+
+    # Replacing the keywords column invalidates the encoding
+    pois['kwds'] = pois['kwds'].apply(lambda kwds: [kwd.upper() for kwd in kwds])
+    assert get_kwds_encoding(pois) is None
+    assert kwds_freq(pois) == {'CAFE': 2, 'FOOD': 3, 'MUSEUM': 1, 'BAKERY': 1, 'SHOP': 1}
+    assert filter_by_kwd(pois, 'museum')['id'].tolist() == [1]
+
+    # So does reordering the rows in place, or dropping the column
+    pois = _pois()
+    encode_kwds(pois, drop=False)
+    pois.sort_values('id', ascending=False, inplace=True)
+    assert get_kwds_encoding(pois) is None
+    assert filter_by_kwd(pois, 'food')['id'].tolist() == [5, 3, 0]
+
+    pois = _pois()
+    encode_kwds(pois, drop=False)
+    pois.drop(columns=['kwds'], inplace=True)
+    assert get_kwds_encoding(pois) is None
+
+
+@pytest.mark.parametrize('kwd, expected_ids', [
+    ('food', [0, 3, 5, 6]),
+    ('MUSEUM', [1]),
+    ('caf', []),
+    ('parking', []),
+])
+def test_filter_by_kwd_index(kwd, expected_ids):
+    pois = _pois()
+    # Keywords repeated within a row, in another case
+    pois.loc[len(pois)] = [6, ['Food', 'food'], pois.geometry[0]]
+
+    expected = filter_by_kwd(pois, kwd)
+    assert expected['id'].tolist() == expected_ids
+
+    encoded = pois.copy()
+    encode_kwds(encoded)
+    actual = filter_by_kwd(pois, kwd, kwd_index=KeywordIndex(pois))
+    assert actual.equals(expected)
+
+    # With the keywords encoded, the matching rows carry the subset of the encoding
+    for actual in (filter_by_kwd(encoded, kwd), filter_by_kwd(encoded, kwd, kwd_index=KeywordIndex(encoded))):
+        assert actual.equals(expected.drop(columns='kwds'))
+        decode_kwds(actual)
+        assert actual[expected.columns].equals(expected)
+
+
+def test_filter_by_kwd_index_empty():
+    pois = _pois().iloc[:0]
+    kwd_index = KeywordIndex(pois)
+
+    for actual in (filter_by_kwd(pois, 'food'), filter_by_kwd(pois, 'food', kwd_index=kwd_index)):
+        assert len(actual) == 0
+        assert list(actual.columns) == list(pois.columns)
+
+
+def _location_visits():
+    """Returns visits of random locationsets to locations, some of which are visited together more often, and the
+    locations."""
+
+    rng = np.random.default_rng(3)
+    location_ids = ['loc%d' % i for i in range(12)]
+    popular = [location_ids[:3], location_ids[3:5], location_ids[5:9]]
+
+    rows = []
+    for locationset_id in range(200):
+        visited = list(rng.choice(location_ids, rng.integers(1, 5), replace=False))
+        if rng.uniform() < 0.5:
+            visited += popular[rng.integers(0, len(popular))]
+        # Repeated visits to the same location count once
+        visited += visited[:1]
+        rows += [(location, 'set%d' % locationset_id) for location in visited]
+
+    location_visits = pd.DataFrame(rows, columns=['location_id', 'locationset_id'])
+    geometry = gpd.points_from_xy(rng.uniform(0, 100, 12), rng.uniform(0, 100, 12))
+    locations = gpd.GeoDataFrame(index=location_ids, geometry=geometry, crs='EPSG:3857')
+
+    return location_visits, locations
+
+
+def _apriori_locationsets(location_visits, locations, min_sup, min_length):
+    """Returns the location sets mined by mlxtend apriori, as `freq_locationsets` returned them before ECLAT."""
+
+    frequent_patterns = pytest.importorskip('mlxtend.frequent_patterns')
+    preprocessing = pytest.importorskip('mlxtend.preprocessing')
+
+    itemsets = location_visits.groupby(['locationset_id'], sort=False)['location_id'].agg(set)
+    te = preprocessing.TransactionEncoder()
+    oht_df = pd.DataFrame(te.fit(itemsets).transform(itemsets.values), columns=te.columns_)
+
+    apriori_df = frequent_patterns.apriori(oht_df, min_support=min_sup, use_colnames=True)
+    apriori_df = apriori_df[apriori_df['itemsets'].apply(len) >= min_length]
+
+    return {itemset: (support, GeometryCollection([locations.loc[c].geometry for c in itemset]))
+            for itemset, support in zip(apriori_df['itemsets'], apriori_df['support'])}
+
+
+@pytest.mark.parametrize('min_sup, min_length', [(0.05, 1), (0.1, 2), (0.3, 1), (0.9, 1)])
+def test_freq_locationsets_apriori(min_sup, min_length):
+    location_visits, locations = _location_visits()
+    expected = _apriori_locationsets(location_visits, locations, min_sup, min_length)
+
+    results = [
+        freq_locationsets(location_visits, 'location_id', locations, 'locationset_id', min_sup, min_length),
+        # Transaction id lists instead of bitsets
+        freq_locationsets(location_visits, 'location_id', locations, 'locationset_id', min_sup, min_length,
+                          max_memory=0),
+        # SON over chunks of whole locationsets, also mined in parallel
+        freq_locationsets(location_visits, 'location_id', locations, 'locationset_id', min_sup, min_length,
+                          n_jobs=2),
+        freq_locationsets([location_visits[location_visits['locationset_id'] < 'set5'],
+                           location_visits[location_visits['locationset_id'] >= 'set5']],
+                          'location_id', locations, 'locationset_id', min_sup, min_length),
+    ]
+
+    for locationsets in results:
+        assert locationsets.crs == locations.crs
+        assert sorted(map(sorted, locationsets['location_ids'])) == sorted(map(sorted, expected))
+        for location_ids, support, length, geometry in zip(locationsets['location_ids'], locationsets['support'],
+                                                           locationsets['length'], locationsets.geometry):
+            expected_support, expected_geometry = expected[location_ids]
+            assert support == pytest.approx(expected_support)
+            assert length == len(location_ids)
+            assert geometry.geom_type == 'GeometryCollection'
+            assert sorted(g.wkb for g in geometry.geoms) == sorted(g.wkb for g in expected_geometry.geoms)
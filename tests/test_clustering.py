@@ -0,0 +1,148 @@
+import math
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+from shapely.geometry import MultiPoint, Point
+from shapely.ops import unary_union
+from loci import clustering
+from loci.clustering import cluster_shapes
+
+
+def _clustered_pois():
+    """Returns clustered POIs covering typical and degenerate configurations, and the eps of each cluster."""
+
+    rng = np.random.default_rng(1)
+    parts = []
+
+    # Random blobs, where many circles are covered by others
+    for _ in range(12):
+        n = rng.integers(3, 40)
+        center = rng.uniform(0, 20000, 2)
+        parts.append((center[0] + rng.normal(0, 100, n), center[1] + rng.normal(0, 100, n)))
+
+    # Collinear points, duplicate points, a single point, two points and isolated points of the same cluster
+    parts.append((np.arange(20) * 30. + 30000, np.full(20, 5.)))
+    parts.append((np.full(10, 31000.), np.full(10, 7.)))
+    parts.append((np.array([32000.]), np.array([0.])))
+    parts.append((np.array([33000., 33100.]), np.array([0., 10.])))
+    parts.append((np.array([34000., 35000., 34500.]), np.array([0., 0., 1000.])))
+
+    # A square grid (cocircular points) and a ring of points around an island, i.e., a polygon with a hole and another
+    # polygon within the hole
+    grid_x, grid_y = np.meshgrid(np.arange(0, 500, 50.), np.arange(0, 500, 50.))
+    parts.append((grid_x.ravel() + 40000, grid_y.ravel()))
+    angles = np.linspace(0, 2 * math.pi, 120, endpoint=False)
+    parts.append((np.r_[np.cos(angles) * 600, 0] + 50000, np.r_[np.sin(angles) * 600, 0]))
+
+    cluster_ids = np.concatenate([np.full(len(px), i) for i, (px, _) in enumerate(parts)])
+    x = np.concatenate([px for px, _ in parts])
+    y = np.concatenate([py for _, py in parts])
+    order = rng.permutation(len(x))
+    pois = gpd.GeoDataFrame({'cluster_id': cluster_ids[order]}, geometry=gpd.points_from_xy(x[order], y[order]),
+                            crs='EPSG:3068')
+
+    eps = np.where(np.arange(len(parts)) % 2 == 0, 40., 55.)
+    eps_per_cluster = pd.DataFrame({'eps': eps, 'cluster_size': np.bincount(cluster_ids)})
+
+    return pois, eps_per_cluster
+
+
+def _buffer_union(pois, cluster_id, eps, resolution):
+    return unary_union([Point(p).buffer(eps, resolution) for p in pois.geometry[pois['cluster_id'] == cluster_id]])
+
+
+@pytest.mark.parametrize('resolution, tolerance', [(16, 0), (4, 0), (16, 3)])
+def test_cluster_shapes_circles(resolution, tolerance):
+    pois, eps_per_cluster = _clustered_pois()
+    shapes = cluster_shapes(pois, 2, eps_per_cluster, resolution=resolution, tolerance=tolerance)
+
+    assert sorted(shapes['cluster_id']) == list(range(len(eps_per_cluster)))
+    assert (shapes['size'].values == eps_per_cluster.loc[shapes['cluster_id'], 'cluster_size'].values).all()
+
+    for cluster_id, shape in zip(shapes['cluster_id'], shapes.geometry):
+        eps = eps_per_cluster.loc[cluster_id, 'eps']
+        expected = _buffer_union(pois, cluster_id, eps, resolution)
+        exact = _buffer_union(pois, cluster_id, eps, 256)
+
+        # Same shape as the union of the buffers, up to the distance of the polygons of `buffer` from their circles
+        # (the sagitta) plus `tolerance` along the boundary, and within that distance from the union of the circles.
+        # The parts and holes are those of the union of the circles (coarse buffers may close or merge small holes)
+        sagitta = eps * (1 - math.cos(math.pi / (4 * resolution)))
+        assert shape.is_valid
+        assert shape.geom_type == exact.geom_type
+        assert len(getattr(shape, 'geoms', [shape])) == len(getattr(exact, 'geoms', [exact]))
+        assert len(getattr(shape, 'interiors', [])) == len(getattr(exact, 'interiors', []))
+        assert shape.symmetric_difference(expected).area <= expected.length * (sagitta + tolerance) / 2
+        assert shape.hausdorff_distance(exact) <= sagitta + tolerance + 1e-6 * eps
+
+
+def test_cluster_shapes_circles_batches(monkeypatch):
+    pois, eps_per_cluster = _clustered_pois()
+    expected = cluster_shapes(pois, 2, eps_per_cluster)
+
+    monkeypatch.setattr(clustering, '_DISC_BATCH_SIZE', 50)
+    for n_jobs in (1, 2):
+        shapes = cluster_shapes(pois, 2, eps_per_cluster, n_jobs=n_jobs)
+        assert all(shape.equals_exact(other, 1e-9) for shape, other in zip(shapes.geometry, expected.geometry))
+
+
+def test_cluster_shapes_circles_missing_eps():
+    pois, eps_per_cluster = _clustered_pois()
+    noise = pois.iloc[:5].assign(cluster_id=-1)
+    pois = pd.concat([pois, noise], ignore_index=True)
+
+    shapes = cluster_shapes(pois, 2, eps_per_cluster.drop(index=[3]))
+
+    assert 3 not in set(shapes['cluster_id'])
+    assert -1 not in set(shapes['cluster_id'])
+    assert len(shapes) == len(eps_per_cluster) - 1
+
+
+def test_cluster_shapes_hulls_degenerate():
+    rng = np.random.default_rng(2)
+    parts = [
+        # Collinear points, also with integer coordinates and with duplicates
+        (np.arange(10) * 3.5 + 100, np.arange(10) * 1.5 - 20),
+        (np.array([0., 1, 2, 3, 2, 1]), np.array([0., 2, 4, 6, 4, 2])),
+        # Duplicate points only, a single point and two points (in both orders)
+        (np.full(5, 7.), np.full(5, -3.)),
+        (np.array([1.]), np.array([2.])),
+        (np.array([5., 1.]), np.array([0., 4.])),
+        (np.array([1., 5.]), np.array([4., 0.])),
+        # A square with points on its edges and inside, and duplicate vertices
+        (np.array([0., 10, 10, 0, 5, 10, 5, 0, 5, 0]), np.array([0., 0, 10, 10, 0, 5, 10, 5, 5, 0])),
+    ]
+
+    # Almost collinear points, whose orientations are affected by rounding errors (the first ones gave other hulls than
+    # GEOS with orientations computed in floating point)
+    parts.append((np.array([-758300.5945435459, -758148.9761497407, -758295.3910423928, -758416.1613715469]),
+                  np.array([360574.9981260419, 360663.7353429754, 360578.04356267425, 360507.36069479573])))
+    parts.append((np.array([-98813.6555925598, -98674.80417648901, -98730.95501233001, -98778.95498295945,
+                            -98633.85690652348, -98649.69096595369, -99009.29971113006, -98872.28391659643,
+                            -98899.07140531312]),
+                  np.array([-245007.96122037183, -244891.08659122206, -244938.35012155597, -244978.7528695096,
+                            -244856.62027371992, -244869.94818838013, -245172.63965470318, -245057.31011304684,
+                            -245079.8577967379])))
+    parts.append((np.array([3705.914322250579, 3683.426434603024, 3813.333759750232, 4239.599323729451,
+                            4126.929613917528, 4024.6071395271138]),
+                  np.array([281742.3310175057, 281708.87385567755, 281902.1481404052, 282536.34002980584,
+                            282368.7116258672, 282216.47769273864])))
+    for _ in range(300):
+        t = rng.uniform(0, 1, rng.integers(3, 8))
+        origin, direction = rng.uniform(-1e6, 1e6, 2), rng.uniform(-1e3, 1e3, 2)
+        x, y = origin[0] + t * direction[0], origin[1] + t * direction[1]
+        parts.append((x + rng.normal(0, 1e-9, len(t)) * rng.integers(0, 2, len(t)), y))
+
+    cluster_ids = np.concatenate([np.full(len(px), i) for i, (px, _) in enumerate(parts)])
+    pois = gpd.GeoDataFrame({'cluster_id': cluster_ids},
+                            geometry=gpd.points_from_xy(np.concatenate([px for px, _ in parts]),
+                                                        np.concatenate([py for _, py in parts])))
+
+    shapes = cluster_shapes(pois, 1)
+
+    assert list(shapes['cluster_id']) == list(range(len(parts)))
+    for (x, y), shape in zip(parts, shapes.geometry):
+        expected = MultiPoint(np.column_stack([x, y])).convex_hull
+        assert shape.geom_type == expected.geom_type
+        assert shape.equals_exact(expected, 0)
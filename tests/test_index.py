@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from loci.index import grid, GridIndex, GridPyramid
+
+
+def _pois(x, y, ids):
+    return gpd.GeoDataFrame({'id': ids}, geometry=gpd.points_from_xy(x, y))
+
+
+def test_grid_index_outside_bounds():
+    rng = np.random.default_rng(0)
+    pois = _pois(rng.uniform(0, 10, 500), rng.uniform(0, 10, 500), np.arange(500))
+    index = GridIndex(pois, cell_width=1, cell_height=1, bounds=(0, 0, 10, 10))
+
+    # POIs below, left of, and beyond the bounds, one of which is removed again
+    outside = _pois([4.5, -0.5, 11.5, 12.5], [-0.5, 9.5, 3.5, 12.5], [500, 501, 502, 503])
+    index.add(outside)
+    index.remove([503])
+
+    expected, _, _ = grid(pd.concat([pois, outside.iloc[:3]], ignore_index=True), cell_width=1, cell_height=1,
+                          bounds=(-2, -2, 14, 14), znorm=True, neighborhood=True, contents='none')
+    actual = index.to_grid(znorm=True, neighborhood=True)
+
+    cols = ['cell_x', 'cell_y', 'score', 'score_nb', 'score_znorm', 'score_nb_znorm']
+    expected = expected[cols].assign(cell_x=expected['cell_x'] - 2, cell_y=expected['cell_y'] - 2)
+    expected = expected.sort_values(['cell_x', 'cell_y']).reset_index(drop=True)
+    actual = actual[cols].sort_values(['cell_x', 'cell_y']).reset_index(drop=True)
+
+    assert len(actual) == len(expected)
+    assert (actual[cols[:4]].values == expected[cols[:4]].values).all()
+    assert np.allclose(actual[cols[4:]].values, expected[cols[4:]].values)
+
+
+def test_grid_index_crs_and_duplicate_ids():
+    index = GridIndex(cell_width=1, cell_height=1, bounds=(0, 0, 10, 10))
+    index.add(_pois([], [], []).set_crs('EPSG:3857'))
+    assert index.crs is None
+
+    # The second POI with id 1 replaces the first one
+    index.add(_pois([0.5, 1.5, 2.5], [0.5, 0.5, 0.5], [1, 2, 1]).set_crs('EPSG:3857'))
+    assert index.crs == 'EPSG:3857'
+    assert len(index) == 2
+
+    index.remove([1])
+    expected, _, _ = grid(_pois([1.5], [0.5], [2]), cell_width=1, cell_height=1, bounds=(0, 0, 10, 10),
+                          znorm=True, neighborhood=True, contents='none')
+    actual = index.to_grid(znorm=True, neighborhood=True)
+
+    assert actual.crs == 'EPSG:3857'
+    assert actual[['cell_x', 'cell_y', 'score', 'score_nb']].values.tolist() == \
+        expected[['cell_x', 'cell_y', 'score', 'score_nb']].values.tolist()
+    assert index.score_stats() == (1.0, 0.0)
+    assert index.score_nb_stats() == (1.0, 0.0)
+
+
+def test_grid_outside_bounds():
+    # POIs inside the bounds, on their lower and upper edges, and outside of them on each side
+    inside = _pois([0.5, 0., 3.5, 4., 4., 2.5], [0.5, 0., 1.5, 3., 4., 4.], [0, 1, 2, 3, 4, 5])
+    outside = _pois([-0.5, 4.5, 2., 2., 5.5], [2., 2., -0.5, 4.5, 5.5], [6, 7, 8, 9, 10])
+    pois = pd.concat([inside, outside], ignore_index=True)
+
+    for chunks in (pois, [pois.iloc[:7], pois.iloc[7:]]):
+        cells, num_columns, num_rows = grid(chunks, cell_width=1, cell_height=1, bounds=(0, 0, 4, 4),
+                                            neighborhood=True)
+        assert (num_columns, num_rows) == (4, 4)
+        assert cells['score'].sum() == len(inside)
+        assert sorted(map(sorted, cells['contents'])) == [[0, 1], [2], [3, 4], [5]]
+        assert cells.set_index(['cell_x', 'cell_y'])['score'].to_dict() == {(0, 0): 2, (3, 1): 1, (3, 3): 2, (2, 3): 1}
+        assert ((cells['cell_x'] < num_columns) & (cells['cell_y'] < num_rows)).all()
+
+    offsets, _, _ = grid(pois, cell_width=1, cell_height=1, bounds=(0, 0, 4, 4), contents='offsets')
+    assert sorted(offsets.attrs['contents']) == [0, 1, 2, 3, 4, 5]
+
+    pyramid = GridPyramid(pois, cell_width=1, cell_height=1, bounds=(0, 0, 4, 4), num_levels=2)
+    assert pyramid.level(0)['score'].sum() == len(inside)
+    assert pyramid.level(1)['score'].sum() == len(inside)
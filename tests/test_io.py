@@ -0,0 +1,118 @@
+import math
+import os
+import shutil
+import pandas as pd
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point
+
+pytest.importorskip('osmnx')
+pytest.importorskip('pyarrow')
+
+from loci import io  # noqa: E402
+from loci.analytics import get_kwds_encoding  # noqa: E402
+
+
+BERLIN_POIS = os.path.join(os.path.dirname(__file__), os.pardir, 'datasets', 'osmpois-berlin.csv')
+
+
+def _baseline_read_poi_csv(input_file, target_crs, keep_other_cols):
+    """The row-wise `read_poi_csv` that built a Point per row, kept to check the vectorized loader against it."""
+
+    def lon_lat_to_point(row):
+        try:
+            x_lon = float(row['lon'])
+            y_lat = float(row['lat'])
+            if math.isnan(x_lon) is False and math.isnan(y_lat) is False:
+                return Point(x_lon, y_lat)
+            return float('NaN')
+        except (TypeError, ValueError):
+            return float('NaN')
+
+    pois = pd.read_csv(input_file, delimiter=';', error_bad_lines=False)
+    columns = list(pois)
+    subset_cols = list(columns) if keep_other_cols else ['id', 'lon', 'lat', 'name', 'kwds']
+
+    pois['geometry'] = pois.apply(lon_lat_to_point, axis=1)
+    subset_cols.append('geometry')
+    pois.drop(set(columns) - set(subset_cols), inplace=True, axis=1)
+    pois.dropna(inplace=True)
+    pois['kwds'] = pois['kwds'].map(lambda s: s.split(','))
+
+    return gpd.GeoDataFrame(pois, crs={'init': 'EPSG:4326'}, geometry=pois['geometry']).to_crs(
+        {'init': target_crs}).drop(columns=['lon', 'lat'])
+
+
+@pytest.mark.parametrize('keep_other_cols', [False, True])
+@pytest.mark.parametrize('target_crs', ['EPSG:4326', 'EPSG:3068'])
+def test_read_poi_csv_baseline(tmp_path, target_crs, keep_other_cols):
+    # The Berlin POIs, along with rows with invalid or missing coordinates, names and keywords
+    input_file = str(tmp_path / 'pois.csv')
+    shutil.copyfile(BERLIN_POIS, input_file)
+    with open(input_file, 'a') as f:
+        f.write('x1;Invalid lon;abc;52.5;shop\n'
+                'x2;Missing lat;13.4;;shop\n'
+                'x3;;13.4;52.5;shop\n'
+                'x4;Missing kwds;13.4;52.5;\n'
+                'x5;Valid;13.4;52.5;cafe,food\n')
+
+    expected = _baseline_read_poi_csv(input_file, target_crs, keep_other_cols)
+    actual = io.read_poi_csv(input_file, target_crs=target_crs, keep_other_cols=keep_other_cols)
+
+    assert list(actual.columns) == list(expected.columns)
+    assert list(actual.index) == list(expected.index)
+    assert actual.crs == expected.crs
+    assert actual.drop(columns='geometry').equals(expected.drop(columns='geometry'))
+    assert actual.geometry.geom_equals_exact(expected.geometry, 1e-6).all()
+    assert 'x5' in set(actual['id']) and not set(actual['id']) & {'x1', 'x2', 'x3', 'x4'}
+
+
+def _write_csv(path):
+    rows = ['id;name;lon;lat;kwds',
+            '1;Cafe A;13.40;52.52;cafe,food',
+            '2;Museum;13.41;52.51;museum',
+            '3;Broken;abc;52.50;shop',
+            '4;Station;13.39;52.53;transport,subway,station',
+            '5;Bakery;13.38;52.54;bakery,food']
+    path.write_text('\n'.join(rows) + '\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('encode_kwds', [False, True])
+@pytest.mark.parametrize('target_crs', ['EPSG:4326', 'EPSG:3068'])
+def test_read_poi_csv_cache(tmp_path, encode_kwds, target_crs):
+    input_file = _write_csv(tmp_path / 'pois.csv')
+    cache_dir = str(tmp_path / 'cache')
+
+    expected = io.read_poi_csv(input_file, target_crs=target_crs, encode_kwds=encode_kwds)
+    io.read_poi_csv(input_file, target_crs=target_crs, encode_kwds=encode_kwds, cache_dir=cache_dir)
+    actual = io.read_poi_csv(input_file, target_crs=target_crs, encode_kwds=encode_kwds, cache_dir=cache_dir)
+
+    assert list(actual.columns) == list(expected.columns)
+    assert list(actual.index) == list(expected.index)
+    assert actual.crs == expected.crs
+    assert actual.drop(columns='geometry').equals(expected.drop(columns='geometry'))
+    assert actual.geometry.geom_equals(expected.geometry).all()
+    if encode_kwds:
+        assert list(get_kwds_encoding(actual, 'kwds').decode()) == list(get_kwds_encoding(expected, 'kwds').decode())
+
+
+def test_read_poi_csv_cache_interrupted_write(tmp_path, monkeypatch):
+    input_file = _write_csv(tmp_path / 'pois.csv')
+    cache_dir = str(tmp_path / 'cache')
+    to_feather = pd.DataFrame.to_feather
+
+    def interrupted_to_feather(df, path, *args, **kwargs):
+        with open(path, 'wb') as f:
+            f.write(b'ARROW1')
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(pd.DataFrame, 'to_feather', interrupted_to_feather)
+    with pytest.raises(KeyboardInterrupt):
+        io.read_poi_csv(input_file, cache_dir=cache_dir)
+    assert os.listdir(cache_dir) == []
+
+    monkeypatch.setattr(pd.DataFrame, 'to_feather', to_feather)
+    expected = io.read_poi_csv(input_file, cache_dir=cache_dir)
+    actual = io.read_poi_csv(input_file, cache_dir=cache_dir)
+    assert actual.drop(columns='geometry').equals(expected.drop(columns='geometry'))